@@ -0,0 +1,114 @@
+"""
+Per-call memory of advice already given, used to drop repeated bullets.
+
+Repeat suppression used to paste the previous turn's advice into the prompt and
+ask the model not to repeat it: tokens on every turn, and advice from two turns
+back could still come back. AdviceMemory instead remembers every bullet shown
+during the call as a MinHash signature of its content words and filters a new
+turn's bullets after generation; a bullet whose estimated Jaccard similarity to
+any remembered one reaches REPEAT_SIMILARITY is dropped.
+
+Bullets are 5-8 words, so signatures are small and a call's whole history is
+compared in well under a millisecond.
+"""
+
+import random
+import time
+import zlib
+from collections import deque
+from typing import Deque, List, Optional, Set, Tuple
+
+from metrics import metrics
+from novelty_gate import FILLER_WORDS, STOP_WORDS, tokenize
+from turn_store import approx_bytes
+
+REPEAT_SIMILARITY = 0.5     # estimated Jaccard of content words at which a bullet counts as a repeat
+NUM_PERM = 64               # MinHash permutations per signature
+MAX_REMEMBERED = 200        # bullets remembered per call (oldest forgotten first)
+
+# Phrasing shared by most advice bullets ("You should ask the caller whether ...")
+ADVICE_STOP_WORDS = {
+    "should", "ask", "tell", "caller", "whether", "if", "them", "him", "confirm", "make", "sure", "find",
+    "out", "any", "instruct", "check", "keep", "get", "let", "know", "advise", "all", "from", "about",
+}
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_IGNORED = STOP_WORDS | FILLER_WORDS | ADVICE_STOP_WORDS
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def shingles(text: str) -> Set[str]:
+    """Stemmed content words of an advice bullet."""
+    return {_stem(w) for w in tokenize(text) if w not in _IGNORED}
+
+
+def signature(features: Set[str], num_perm: int = NUM_PERM) -> Tuple[int, ...]:
+    hashes = [zlib.crc32(f.encode()) for f in features]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS[:num_perm])
+
+
+class AdviceMemory:
+    __slots__ = ("threshold", "num_perm", "_bullets")
+
+    def __init__(self, threshold: float = REPEAT_SIMILARITY, num_perm: int = NUM_PERM,
+                 max_bullets: int = MAX_REMEMBERED):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self._bullets: Deque[Tuple[str, Tuple[int, ...]]] = deque(maxlen=max_bullets)
+
+    def __len__(self) -> int:
+        return len(self._bullets)
+
+    def _signature(self, bullet: str) -> Optional[Tuple[int, ...]]:
+        features = shingles(bullet)
+        return signature(features, self.num_perm) if features else None
+
+    def _best_match(self, sig: Tuple[int, ...]) -> Tuple[float, Optional[str]]:
+        best, match = 0.0, None
+        for text, other in self._bullets:
+            similarity = sum(1 for x, y in zip(sig, other) if x == y) / self.num_perm
+            if similarity > best:
+                best, match = similarity, text
+        return best, match
+
+    def filter(self, advice: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Split a turn's bullets into (new, repeats) and remember the new ones.
+        Bullets with no content words are kept; a bullet repeating an earlier one
+        of the same turn is dropped too.
+        """
+        start = time.time()
+        kept, repeats = [], []
+        for bullet in advice:
+            sig = self._signature(bullet)
+            if sig is not None and self._best_match(sig)[0] >= self.threshold:
+                repeats.append(bullet)
+                continue
+            kept.append(bullet)
+            if sig is not None:
+                self._bullets.append((bullet, sig))
+        metrics.incr("advice_filter.bullets", len(advice))
+        metrics.incr("advice_filter.repeats", len(repeats))
+        metrics.observe("advice_filter.ms", (time.time() - start) * 1000)
+        return kept, repeats
+
+    def remember(self, advice: List[str]) -> None:
+        """Record bullets that were shown without filtering them (journal recovery)."""
+        for bullet in advice:
+            sig = self._signature(bullet)
+            if sig is not None:
+                self._bullets.append((bullet, sig))
+
+    def clear(self) -> None:
+        self._bullets.clear()
+
+    def nbytes(self) -> int:
+        return sum(approx_bytes(entry) for entry in self._bullets)
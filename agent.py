@@ -2,19 +2,37 @@ import os
 import json
 import time
 import hashlib
-import threading
 from typing import Dict, List, Optional, Any, Tuple, Optional
 from dataclasses import dataclass
 from datetime import datetime
-from functools import lru_cache
 import hashlib
 import asyncio
+import logging
+import uuid
 
 from dotenv import load_dotenv
-from openai import OpenAI
-from pinecone import Pinecone
-from groq import Groq
-from letta_client import Letta, MessageCreate
+
+import clients
+import http_pool
+from advice_filter import AdviceMemory
+from ann_index import get_ann_index
+from bm25 import get_bm25_index, reciprocal_rank_fusion
+from call_journal import CallJournal, CallState
+from call_summary import CallSummary
+from deadline import TurnBudget, stage_estimate_ms
+from embedding_batcher import EmbeddingBatcher
+from fact_extractor import ExtractedFacts, extract_facts, max_criticality
+from guideline_selection import MMR_POOL_FACTOR, GuidelineTracker, mmr_select
+from hedging import HedgedGroq
+from incident_bundles import BUNDLE_CONFIDENCE, GuidelineBundles, classify_incident
+from memory_backend import LettaMemoryBackend, LocalMemoryBackend, MemoryBackend, get_sqlite_store
+from memory_writer import WriteBehindQueue
+from metrics import metrics
+from novelty_gate import NoveltyGate
+from token_accounting import TurnTokens, split_prompt_tokens, token_ledger, zero_turn_tokens
+from turn_store import BoundedCache, approx_bytes
+
+logger = logging.getLogger("agent")
 
 @dataclass
 class TimingStats:
@@ -34,236 +52,57 @@ def timeit(func):
 load_dotenv()
 
 # ─── Clients ────────────────────────────────────────────────────────────────────
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-pinecone_client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pinecone_client.Index("subitis-guides")
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# OpenAI, Pinecone, Groq and Letta clients are built on first use (clients.py),
+# so importing this module does no network I/O
 
-letta_client = Letta(
-    token=os.getenv("LETTA_API_KEY"),
-    # base_url="http://localhost:8283"  # if self-hosted
-)
+def _write_letta_block(backend: LettaMemoryBackend, block_label: str, value: str):
+    backend.write_block(block_label, value)
 
+# One write-behind queue for all agents' Letta block updates (latest value wins)
+memory_writer = WriteBehindQueue(_write_letta_block)
 
-class DispatcherAgent:
-    def __init__(self):
-        # Create a Letta agent for memory management
-        self.agent = letta_client.agents.create(
-            memory_blocks=[
-                {
-                    "label": "call_history",
-                    "value": "",
-                    "description": "Rolling bullet-point summary of the call so far"
-                },
-                {
-                    "label": "full_conversation",
-                    "value": "",
-                    "description": "Complete conversation history in format: [role]: [message]"
-                }
-            ],
-            system="You are a memory manager for crisis dispatch calls.",
-            model="openai/gpt-4o-mini",
-            embedding="openai/text-embedding-3-small"
-        )
-        
-        # In-memory cache for embeddings and summaries
-        self.embedding_cache = {}
-        self.summary_cache = None
-        self.conversation_cache = ""
-        self.summary_cache_time = 0
-        self.rag_cache = {}
-        self.prev_advice_cache = ""
-        
-        # Add synchronization locks
-        self._conversation_lock = threading.Lock()
-        self._pending_update = False
-        self._last_successful_cache = self.conversation_cache
-        self._skip_count = 0  # Track how many updates we've skipped
+# Append-only per-call journal; a restarted processor rebuilds live calls from it
+JOURNAL_ENABLED = os.getenv("CALL_JOURNAL", "1") == "1"
+call_journal = CallJournal() if JOURNAL_ENABLED else None
 
-    def _get_text_hash(self, text: str) -> str:
-        """Generate a hash for caching purposes"""
-        return hashlib.md5(text.encode()).hexdigest()[:8]
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "local")   # "local" (in-process + SQLite) or "letta"
+LETTA_MIRROR = os.getenv("LETTA_MIRROR", "1") == "1"    # mirror local memory to Letta asynchronously
 
-    @lru_cache(maxsize=128)
-    def _get_embedding_cached(self, text: str) -> List[float]:
-        """Cache embeddings to avoid repeated API calls"""
-        resp = openai_client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=[text]
-        )
-        return resp.data[0].embedding
 
-    @timeit
-    def _get_rag_passages_fast(self, text: str, top_k: int = 3) -> Tuple[List[str], float]:
-        """Optimized RAG with embedding caching"""
-        text_hash = self._get_text_hash(text)
-        
-        # Check cache first
-        if text_hash in self.rag_cache:
-            return self.rag_cache[text_hash]
-        
-        # Get cached embedding
-        q_emb = self._get_embedding_cached(text)
-
-        # Query Pinecone
-        result = index.query(
-            vector=q_emb,
-            top_k=top_k,
-            include_metadata=True
-        )
-        passages = [match["metadata"]["text"] for match in result["matches"]]
-        
-        # Cache result
-        self.rag_cache[text_hash] = passages
-        
-        return passages
+def create_memory_backend(call_id: str) -> MemoryBackend:
+    if MEMORY_BACKEND == "letta":
+        return LettaMemoryBackend(clients.letta_client, memory_writer)
+    mirror = LettaMemoryBackend(clients.letta_client, memory_writer) if LETTA_MIRROR else None
+    return LocalMemoryBackend(call_id, store=get_sqlite_store(), mirror=mirror)
 
-    def _get_current_summary_fast(self) -> str:
-        """Fast summary retrieval with caching"""
-        current_time = time.time()
-        
-        # Use cache if it's fresh (less than 5 seconds old)
-        if self.summary_cache and (current_time - self.summary_cache_time) < 5:
-            return self.summary_cache
-        
-        # Otherwise fetch from Letta
-        try:
-            block = letta_client.agents.blocks.retrieve(
-                agent_id=self.agent.id,
-                block_label="call_history"
-            )
-            self.summary_cache = block.value if block else ""
-            self.summary_cache_time = current_time
-            return self.summary_cache
-        except:
-            return ""
-
-    def _update_summary_async(self, new_summary: str):
-        """Update summary asynchronously (fire and forget)"""
-        try:
-            letta_client.agents.blocks.modify(
-                agent_id=self.agent.id,
-                block_label="call_history",
-                value=new_summary
-            )
-            self.summary_cache = new_summary
-            self.summary_cache_time = time.time()
-        except Exception as e:
-            print(f"Warning: Failed to update summary: {e}")
-            
-    def _update_conversation_async(self, role: str, message: str):
-        """Update conversation history with proper synchronization"""
-        try:
-            with self._conversation_lock:
-                # Update in-memory cache
-                new_entry = f"{role}: {message}\n"
-                self.conversation_cache += new_entry
-                
-                # Skip update if one is already pending
-                if self._pending_update:
-                    self._skip_count += 1
-                    if self._skip_count == 10:
-                        pass  
-                    return
-                
-                self._pending_update = True
-                current_cache = self.conversation_cache
-                if self._skip_count > 0:
-                    pass  
-                    self._skip_count = 0  # Reset skip count
-            
-            # Update Letta in background
-            def _update():
-                try:
-                    letta_client.agents.blocks.modify(
-                        agent_id=self.agent.id,
-                        block_label="full_conversation",
-                        value=current_cache
-                    )
-                    # Update successful cache on success
-                    with self._conversation_lock:
-                        self._last_successful_cache = current_cache
-                    pass  
-                    
-                except Exception as e:
-                    print(f"Warning: Failed to update conversation in Letta: {e}")
-                    # Revert to last successful state on failure
-                    with self._conversation_lock:
-                        self.conversation_cache = self._last_successful_cache
-                finally:
-                    with self._conversation_lock:
-                        self._pending_update = False
-            
-            # Run in background thread
-            thread = threading.Thread(target=_update)
-            thread.daemon = True
-            thread.start()
-            
-        except Exception as e:
-            print(f"Warning: Failed to update conversation cache: {e}")
-            with self._conversation_lock:
-                self._pending_update = False
+# Shared by every DispatcherAgent in the process so concurrent calls' query
+# embeddings go out as one batched request
+embedding_batcher = EmbeddingBatcher(clients.openai_client, model="text-embedding-ada-002")
 
-    def _get_full_conversation(self) -> str:
-        """Get the full conversation history"""
-        if not self.conversation_cache:
-            try:
-                block = letta_client.agents.blocks.retrieve(
-                    agent_id=self.agent.id,
-                    block_label="full_conversation"
-                )
-                self.conversation_cache = block.value if block else ""
-            except Exception as e:
-                print(f"Warning: Failed to fetch conversation: {e}")
-                self.conversation_cache = ""
-        return self.conversation_cache
+GROQ_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+GROQ_FALLBACK_MODEL = "llama-3.1-8b-instant"  # hedge target when the primary is slow
+GROQ_DEADLINE_S = 10.0
+
+# Advice calls stream through the hedger: a duplicate goes to the fallback model if
+# the primary hasn't produced a first token by its recent p90 first-token latency
+# (to the same model on high/critical calls, which are never downgraded)
+hedged_groq = HedgedGroq(clients.groq_client, fallback_model=GROQ_FALLBACK_MODEL, deadline_s=GROQ_DEADLINE_S)
 
-    def process_chunk_fast(self, transcript_chunk: str, role: str = "caller") -> Dict:
-        """
-        Process a chunk of conversation with role context
-        
-        Args:
-            transcript_chunk: The text of the message
-            role: Either 'caller' or 'dispatcher' to indicate who is speaking
-            
-        Returns: {"summary": [...], "advice": "...", "timings": [...]}
-        """
-        timings = []
-        start_time = time.time()
-        
-        # 1) Update conversation history with new message
-        self._update_conversation_async(role, transcript_chunk)
-        
-        # 2) Get current summary (with caching)
-        summary_start = time.time()
-        current_summary = self._get_current_summary_fast()
-        conversation_history = self._get_full_conversation()
-        summary_time = (time.time() - summary_start) * 1000
-        timings.append(TimingStats("get_summary_and_history", summary_time, datetime.now().isoformat()))
-        
-        # 3) Get RAG passages (with caching) - use both current chunk and recent conversation
-        rag_query = f"{transcript_chunk}\n\nRecent conversation:\n{conversation_history[-1000:]}"  # Use last ~1000 chars for context
-        passages, rag_time = self._get_rag_passages_fast(rag_query)
-        timings.append(TimingStats("rag_retrieval_fast", rag_time, datetime.now().isoformat()))
-        
-        rag_context = "\n\n".join(passages)
 
-        # 4) Build prompt for Groq
-        system_prompt = """### SYSTEM PROMPT  – Emergency-Dispatcher Copilot ###
+# ─── Prompts ────────────────────────────────────────────────────────────────────
+SYSTEM_PROMPT = """### SYSTEM PROMPT  – Emergency-Dispatcher Copilot ###
 
 You are an AI assistant supporting 911 dispatchers in real-time.
 
 **INPUT (every turn)**  
-1. **memory_summary** – current running summary (array of brief bullets)  
+1. **memory_summary** – current call summary as fields: location, patient (age/sex), and numbered lists of symptoms, hazards, actions (taken so far) and notes  
 2. **guidelines** – dispatcher protocols / SOPs relevant to the call  
 3. **history** – full caller–dispatcher transcript up to now  
 4. **last_msg** – most recent line from caller *or* dispatcher  
-5. **prev_advice** – the advice you gave on the immediately-previous turn  
 
 **YOUR TASKS**  
 - Understand the entire context, but respond **only to last_msg**.  
-- Detect **new, unaddressed facts** and merge them into *memory_summary* (add or update; max 5-8 words each).  
-- NEVER repeat anything found in **prev_advice**.  
+- Detect **new, unaddressed facts** and record them as **summary_ops** on *memory_summary* (max 5-8 words per value). Return only changes; never restate what the summary already holds.  
 - Generate **specific, actionable guidance** for the dispatcher in **atmost two bullet points**, written in **second-person** (“You should …”, “Ask …”). 
  
 
@@ -272,10 +111,11 @@ Return **only** a valid JSON object with these keys:
 
 ```json
 {
-  "summary": [           // updated running bullets
-    "Caller: chest pain, 45 M",
-    "Location: 123 Main St",
-    "Conscious, breathing normal"
+  "summary_ops": [       // changes to memory_summary only; [] if nothing changed
+    {"op": "set", "field": "patient", "value": "45 M"},
+    {"op": "add", "field": "symptoms", "value": "chest pain since 2pm"},
+    {"op": "update", "field": "actions", "index": 1, "value": "Aspirin taken 10 min ago"},
+    {"op": "remove", "field": "hazards", "index": 2}
   ],
   "advice": [            // max 2 bullets, second-person voice
     "You should verify exact pain onset time",
@@ -286,13 +126,398 @@ Return **only** a valid JSON object with these keys:
 }
 ```
 
+**SUMMARY OPS:** "set" or "remove" for location and patient; "add", "update" or "remove" for the
+list fields, naming the item by its number in memory_summary.
+
 **CRITICALITY LEVELS:**
 - **low**: Minor injuries, non-urgent medical issues
 - **medium**: Moderate pain, stable vital signs, non-life-threatening
 - **high**: Severe symptoms, potential for deterioration, urgent response needed  
 - **critical**: Life-threatening, cardiac arrest, severe trauma, immediate response required
 """
-        user_prompt = f"""=== CURRENT CALL SUMMARY ===
+
+# Shorter variant for low-stakes housekeeping turns on the fast model
+BRIEF_SYSTEM_PROMPT = """You are an AI assistant supporting 911 dispatchers in real-time.
+Respond only to the most recent message. Record new facts as changes to the call summary
+(5-8 words per value) and give at most two short second-person advice bullets.
+
+Return **only** a valid JSON object:
+{"summary_ops": [{"op": "set" | "add" | "update" | "remove", "field": "location" | "patient" | "symptoms" | "hazards" | "actions" | "notes", "value": "...", "index": <item number, for update/remove>}],
+ "advice": [...], "patient_age": <int or null>, "criticality_level": "low" | "medium" | "high" | "critical"}
+"""
+
+PROMPT_VARIANTS = {
+    "full": SYSTEM_PROMPT,
+    "brief": BRIEF_SYSTEM_PROMPT,
+}
+
+# Appended to either prompt for fused turns (buffer2 FUSED_TURNS): the raw ASR fragments
+# come with the prompt instead of a separate consolidation call, and the reply carries
+# the merged dialogue as well
+FUSED_SYSTEM_ADDENDUM = """
+**FUSED MODE**
+The newest speech arrives as raw ASR fragments (speaker, in capture order) and is not yet
+in the history. First merge them into clean dialogue lines (rejoin split sentences, drop
+repeated fragments, keep the speakers' wording), then treat the last merged line as the most
+recent message. Add one more key to the JSON object:
+"dialogue": [{"role": "caller" | "dispatcher", "text": "..."}]   // merged lines, in order
+"""
+FUSED_EXTRA_TOKENS = 250    # room for the merged dialogue in the reply
+
+
+def merge_fragments(fragments: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Consecutive fragments of the same speaker joined into one line, without the LLM."""
+    lines: List[Tuple[str, str]] = []
+    for role, text in fragments:
+        if lines and lines[-1][0] == role:
+            lines[-1] = (role, f"{lines[-1][1]} {text}")
+        else:
+            lines.append((role, text))
+    return lines
+
+
+# ─── Model Routing ──────────────────────────────────────────────────────────────
+@dataclass
+class Route:
+    name: str
+    model: str
+    max_tokens: int
+    prompt_variant: str
+
+
+ROUTES = {
+    "fast": Route("fast", GROQ_FALLBACK_MODEL, 400, "brief"),
+    "standard": Route("standard", GROQ_MODEL, 700, "full"),
+    "critical": Route("critical", GROQ_MODEL, 1000, "full"),
+}
+
+# Route for a normal turn at each criticality level
+ROUTING_POLICY = {
+    "low": "fast",
+    "medium": "standard",
+    "high": "critical",
+    "critical": "critical",
+}
+SHORT_TURN_WORDS = 4            # "okay", "uh-huh", "yes that's right" ...
+ROUTE_LATENCY_BUDGET_MS = 1200  # recent p90 above this downgrades medium turns to "fast"
+NEVER_DOWNGRADE = {"high", "critical"}
+
+
+class ModelRouter:
+    """
+    Picks model, max_tokens and prompt variant for a turn from the call's current
+    criticality, the length of the new chunk and recent per-route latency.
+    High/critical calls always get the strong model.
+    """
+
+    def __init__(self, routes: Dict[str, Route] = ROUTES, policy: Dict[str, str] = ROUTING_POLICY,
+                 short_turn_words: int = SHORT_TURN_WORDS, latency_budget_ms: float = ROUTE_LATENCY_BUDGET_MS):
+        self.routes = routes
+        self.policy = policy
+        self.short_turn_words = short_turn_words
+        self.latency_budget_ms = latency_budget_ms
+
+    def choose(self, criticality_level: str, transcript_chunk: str) -> Route:
+        route_name = self.policy.get(criticality_level, "standard")
+        if criticality_level not in NEVER_DOWNGRADE:
+            if len(transcript_chunk.split()) <= self.short_turn_words:
+                route_name = "fast"
+            elif metrics.quantile(f"route.{route_name}.latency_ms", 90) > self.latency_budget_ms:
+                route_name = "fast"
+        return self.routes[route_name]
+
+    def record(self, route: Route, latency_ms: float) -> None:
+        metrics.incr(f"route.{route.name}.count")
+        metrics.observe(f"route.{route.name}.latency_ms", latency_ms)
+
+    def stats(self) -> Dict:
+        return {
+            name: {
+                "count": metrics.counter(f"route.{name}.count"),
+                "latency_ms_p50": metrics.quantile(f"route.{name}.latency_ms", 50),
+                "latency_ms_p90": metrics.quantile(f"route.{name}.latency_ms", 90),
+            }
+            for name in self.routes
+        }
+
+
+model_router = ModelRouter()
+
+# ─── Guideline Retrieval ────────────────────────────────────────────────────────
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")  # "hybrid", "vector" or "lexical"
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")  # or "ann": local memory-mapped IVF index (rag.py)
+RAG_CANDIDATES = 10             # depth of each ranking fed into the fusion
+RAG_LATENCY_BUDGET_MS = 300     # recent embed + vector query p90 above this → lexical only
+RAG_PROBE_EVERY = 10            # still run the vector path every Nth over-budget turn to refresh its latency
+
+
+class HybridRetriever:
+    """
+    Local BM25 fused with Pinecone vector search by reciprocal rank fusion. BM25
+    catches keyword-heavy protocol lookups (drug names, "CPR", "AED") that an
+    embedding of mostly-history misses, and costs no network call, so the vector
+    path is dropped when its recent latency would blow the budget or it fails.
+    """
+
+    def __init__(self, mode: str = RETRIEVAL_MODE, candidates: int = RAG_CANDIDATES,
+                 latency_budget_ms: float = RAG_LATENCY_BUDGET_MS):
+        self.mode = mode
+        self.candidates = candidates
+        self.latency_budget_ms = latency_budget_ms
+        self._over_budget_turns = 0
+
+    def _vector_over_budget(self) -> bool:
+        predicted_ms = metrics.quantile("embedding.request_ms", 90) + metrics.quantile("vector.query_ms", 90)
+        if predicted_ms <= self.latency_budget_ms:
+            return False
+        self._over_budget_turns += 1
+        return self._over_budget_turns % RAG_PROBE_EVERY != 0
+
+    def _vector_search(self, text: str, embed_fn) -> List[Tuple[str, str]]:
+        q_emb = embed_fn(text)
+        start = time.time()
+        ann = get_ann_index() if VECTOR_BACKEND == "ann" else None
+        if ann is not None:
+            hits = [(doc_id, ann.text(doc_id)) for doc_id, _ in ann.search(q_emb, self.candidates)]
+        else:
+            result = clients.pinecone_index().query(vector=q_emb, top_k=self.candidates, include_metadata=True)
+            http_pool.mark_used("pinecone")
+            hits = [(match["id"], match["metadata"]["text"]) for match in result["matches"]]
+        metrics.observe("vector.query_ms", (time.time() - start) * 1000)
+        return hits
+
+    def retrieve(self, text: str, top_k: int = 3, embed_fn=embedding_batcher.embed,
+                 mode: Optional[str] = None) -> Tuple[List[Dict], str]:
+        """
+        Top {"id", "text", "score"} passages for the query and the mode actually used ("hybrid", "vector" or
+        "lexical"). An explicit `mode` is not subject to the latency budget.
+        """
+        lexical = get_bm25_index()
+        if lexical is None:
+            mode = "vector"
+        elif mode is None:
+            mode = self.mode
+            if mode == "hybrid" and self._vector_over_budget():
+                mode = "lexical"
+
+        texts: Dict[str, str] = {}
+        rankings: List[List[str]] = []
+        if mode in ("hybrid", "vector"):
+            try:
+                hits = self._vector_search(text, embed_fn)
+                rankings.append([doc_id for doc_id, _ in hits])
+                texts.update(hits)
+            except Exception as e:
+                if lexical is None:
+                    raise
+                logger.warning(f"Vector retrieval failed, using BM25 only: {e}")
+                metrics.incr("retrieval.vector_errors")
+                mode = "lexical"
+        if mode in ("hybrid", "lexical"):
+            hits = lexical.search(text, self.candidates)
+            rankings.append([doc_id for doc_id, _ in hits])
+            for doc_id, _ in hits:
+                texts.setdefault(doc_id, lexical.text(doc_id))
+
+        metrics.incr(f"retrieval.{mode}")
+        fused = reciprocal_rank_fusion(rankings)[:top_k]
+        return [{"id": doc_id, "text": texts[doc_id], "score": score} for doc_id, score in fused], mode
+
+
+hybrid_retriever = HybridRetriever()
+
+# Ranked passages per incident type, precomputed by rag.py at index time
+guideline_bundles = GuidelineBundles()
+
+# Skips the LLM for turns that add nothing ("okay", repeated confirmations)
+novelty_gate = NoveltyGate()
+
+# Degradation when a turn's latency budget runs low (see deadline.py)
+DEFAULT_LLM_MS = 600.0          # assumed advice latency until the route has samples
+DEFAULT_RETRIEVAL_MS = 250.0    # assumed embed + vector query latency until sampled
+HISTORY_TRIMMED_CHARS = 1500    # history kept in the prompt when there's no time for the full one
+
+EMBEDDING_CACHE_SIZE = 32   # per call; a 1536-d embedding is ~50 KB as Python floats
+RAG_CACHE_SIZE = 64         # per call
+
+
+class DispatcherAgent:
+    def __init__(self, call_id: Optional[str] = None, memory: Optional[MemoryBackend] = None,
+                 journal: Optional[CallJournal] = call_journal):
+        self.call_id = call_id or uuid.uuid4().hex
+        # Summary and transcript live in the memory backend (local by default, Letta mirrored)
+        self.memory = memory or create_memory_backend(self.call_id)
+        self.journal = journal
+        
+        # Bounded per-call caches for query embeddings and retrieval results
+        self.embedding_cache = BoundedCache(EMBEDDING_CACHE_SIZE)
+        self.rag_cache = BoundedCache(RAG_CACHE_SIZE)
+        # Every advice bullet shown on this call; repeats are filtered out after generation
+        self.advice_memory = AdviceMemory()
+        # Structured summary; the model returns field-level ops applied to it
+        self.summary = CallSummary()
+        # Latest criticality reported by the model; unknown calls start on the standard route
+        self.criticality_level = "medium"
+        # Last returned turn output, re-emitted when the novelty gate skips a turn
+        self.last_output: Optional[Dict] = None
+        # Rule-based facts seen so far, and the red-flag criticality awaiting LLM reconciliation
+        self.facts = ExtractedFacts()
+        self.incident_type: Optional[str] = None
+        # Which guideline passages this call's prompts already carried in full
+        self.guidelines = GuidelineTracker()
+        # Last turn's passages, reused when a turn has no time to retrieve
+        self.last_passages: List[Dict] = []
+
+    @classmethod
+    def from_journal(cls, state: CallState, **kwargs) -> "DispatcherAgent":
+        """Rebuild a live call's agent from its recovered journal state"""
+        agent = cls(call_id=state.call_id, **kwargs)
+        agent.memory.restore(state.summary, state.turns)
+        agent.summary = (CallSummary.from_dict(state.summary_fields) if state.summary_fields
+                         else CallSummary.from_bullets(state.summary))
+        for advice in state.advice_history:
+            if isinstance(advice, list):
+                agent.advice_memory.remember(advice)
+        if state.criticality_level in ROUTING_POLICY:
+            agent.criticality_level = state.criticality_level
+        return agent
+
+    def _journal(self, record: Dict):
+        if self.journal is not None:
+            self.journal.append(self.call_id, record)
+
+    def _get_text_hash(self, text: str) -> str:
+        """Generate a hash for caching purposes"""
+        return hashlib.md5(text.encode()).hexdigest()[:8]
+
+    def _get_embedding_cached(self, text: str) -> List[float]:
+        """Cache embeddings to avoid repeated API calls (misses go through the shared batcher)"""
+        embedding = self.embedding_cache.get(text)
+        if embedding is None:
+            embedding = self.embedding_cache[text] = embedding_batcher.embed(text, priority=self.criticality_level)
+        return embedding
+
+    @timeit
+    def _get_rag_passages_fast(self, text: str, top_k: int = 3, mode: Optional[str] = None) -> Tuple[List[Dict], float]:
+        """Hybrid BM25 + vector retrieval with result and embedding caching"""
+        text_hash = f"{self._get_text_hash(text)}:{mode or ''}"
+        
+        # Check cache first
+        if text_hash in self.rag_cache:
+            return self.rag_cache[text_hash]
+        
+        passages, _ = hybrid_retriever.retrieve(text, top_k, embed_fn=self._get_embedding_cached, mode=mode)
+        
+        # Cache result
+        self.rag_cache[text_hash] = passages
+        
+        return passages
+
+    def _get_guidelines(self, rag_query: str, conversation_history: str,
+                        top_k: int = 3, retrieval_mode: Optional[str] = None,
+                        speculative: bool = False) -> Tuple[List[Dict], str, float]:
+        """
+        Guideline passages for this turn: from the precomputed bundle of the call's
+        incident type when the local classifier is confident, else live retrieval
+        (in `retrieval_mode`, if given). Either way a larger pool is narrowed to a
+        diverse top_k with MMR. Returns (passages, timing_operation, duration_ms).
+        A speculative call leaves the agent's incident_type alone.
+        """
+        start = time.time()
+        pool_size = top_k * MMR_POOL_FACTOR
+        incident, confidence = classify_incident(conversation_history[-2000:])
+        if not speculative:
+            self.incident_type = incident
+        pool, operation = [], "rag_retrieval_fast"
+        if incident is not None and confidence >= BUNDLE_CONFIDENCE:
+            pool = guideline_bundles.passages_for(incident, rag_query, pool_size)
+            if pool:
+                metrics.incr(f"guidelines.bundle.{incident}")
+                operation = f"rag_bundle_{incident}"
+        if not pool:
+            metrics.incr("guidelines.live")
+            pool, _ = self._get_rag_passages_fast(rag_query, pool_size, retrieval_mode)
+        return mmr_select(pool, top_k), operation, (time.time() - start) * 1000
+
+    def _get_current_summary_fast(self) -> str:
+        """Current call summary, rendered for the prompt (held locally, no backend read)"""
+        return self.summary.render()
+
+    def _update_summary_async(self):
+        """Persist the summary after ops were applied (backend persists/mirrors it off the hot path)"""
+        self.memory.set_summary(self.summary.text())
+        self._journal({"t": "summary", "value": self.summary.text(), "fields": self.summary.to_dict()})
+            
+    def _update_conversation_async(self, role: str, message: str):
+        """Append a turn to the conversation (backend persists/mirrors it off the hot path)"""
+        self.memory.append_turn(role, message)
+        self._journal({"t": "turn", "role": role, "text": message})
+
+    def _get_full_conversation(self) -> str:
+        """Get the full conversation history"""
+        return self.memory.get_conversation()
+
+    def close(self, timeout: float = 10.0) -> bool:
+        """Flush this call's pending memory and journal writes (shutdown); the call stays recoverable"""
+        flushed = self.memory.close(timeout=timeout)
+        if self.journal is not None:
+            flushed = self.journal.flush(timeout=timeout) and flushed
+        return flushed
+
+    def end_call(self, timeout: float = 10.0) -> bool:
+        """Call is over: flush everything, retire its journal and release local and remote memory"""
+        flushed = self.close(timeout=timeout)
+        if self.journal is not None:
+            self.journal.end_call(self.call_id)
+        flushed = self.memory.teardown(timeout=timeout) and flushed
+        self.embedding_cache.clear()
+        self.rag_cache.clear()
+        self.last_output = None
+        self.guidelines = GuidelineTracker()
+        self.advice_memory.clear()
+        self.summary = CallSummary()
+        token_ledger.end_call(self.call_id)
+        return flushed
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Approximate bytes held in this process for the call, by component"""
+        report = {
+            "memory": self.memory.memory_bytes(),
+            "embedding_cache": self.embedding_cache.nbytes(),
+            "rag_cache": self.rag_cache.nbytes(),
+            "summary": approx_bytes(self.summary.to_dict()),
+            "advice_memory": self.advice_memory.nbytes(),
+            "last_output": approx_bytes(self.last_output),
+        }
+        report["total"] = sum(report.values())
+        return report
+
+    def _build_rag_query(self, transcript_chunk: str, conversation_history: str) -> str:
+        """RAG query: current chunk plus the last ~1000 chars of conversation for context"""
+        return f"{transcript_chunk}\n\nRecent conversation:\n{conversation_history[-1000:]}"
+
+    def _build_user_prompt(self, current_summary: str, rag_context: str, conversation_history: str, role: str,
+                           fragments: Optional[List[Tuple[str, str]]] = None) -> str:
+        if fragments:
+            rendered = "\n".join(f"  {i + 1}. [{r}] '{t}'" for i, (r, t) in enumerate(fragments))
+            request = f"""=== NEW ASR FRAGMENTS ===
+{rendered}
+
+=== ANALYSIS REQUEST ===
+Merge the new fragments into dialogue lines; the conversation continues with them.
+
+Please provide:
+1. The merged dialogue
+2. Changes to the call summary (summary_ops)
+3. Advice for what the dispatcher should do/say next"""
+        else:
+            request = f"""=== ANALYSIS REQUEST ===
+The above is the complete conversation history. The most recent message was from the {role}.
+
+Please analyze the conversation and provide:
+1. Changes to the call summary (summary_ops)
+2. Advice for what the dispatcher should do/say next"""
+        return f"""=== CURRENT CALL SUMMARY ===
 {current_summary}
 
 === APPLICABLE GUIDELINES ===
@@ -301,95 +526,378 @@ Return **only** a valid JSON object with these keys:
 === FULL CONVERSATION HISTORY ===
 {conversation_history}
 
-=== PREVIOUS ADVICE GIVEN ===
-{self.prev_advice_cache or "None (first turn)"}
+{request}"""
+
+    def _parse_dialogue(self, dialogue: Any, fallback: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """(role, text) lines of a fused reply's "dialogue", or `fallback` if it has none usable"""
+        lines = []
+        if isinstance(dialogue, list):
+            for item in dialogue:
+                if isinstance(item, dict):
+                    role, text = item.get("role"), str(item.get("text", "")).strip()
+                    if role and text:
+                        lines.append((role, text))
+        if not lines:
+            metrics.incr("fused.dialogue_fallback")
+        return lines or fallback
+
+    def _parse_advice_content(self, content: str, transcript_chunk: str) -> Dict:
+        """Extract the JSON object from the model output, falling back to raw text"""
+        fallback = {
+            "summary_ops": [],
+            "advice": content,
+            "patient_age": None,
+            "criticality_level": "low"
+        }
+        try:
+            start = content.find('{')
+            end = content.rfind('}') + 1
+            if start != -1 and end != 0:
+                return json.loads(content[start:end])
+            return fallback
+        except json.JSONDecodeError:
+            return fallback
+
+    def _generate_advice(self, route: Route, user_prompt: str, transcript_chunk: str,
+                         priority: Optional[str] = None, deadline_s: Optional[float] = None,
+                         fused: bool = False, sections: Optional[Dict[str, int]] = None,
+                         kind: str = "advice") -> Tuple[Dict, float, Dict]:
+        """
+        Call Groq (hedged) on the given route and parse its JSON reply. Returns (result, groq_ms, hedge_info).
+        Queues for rate-limit quota at `priority`, by default the call's criticality. `fused`
+        asks for the merged dialogue of the prompt's fragments too.
 
-=== ANALYSIS REQUEST ===
-The above is the complete conversation history. The most recent message was from the {role}.
+        The completion's tokens are recorded in the token ledger as `kind`, with the prompt
+        split by section; `sections` holds the characters of the user prompt's summary,
+        guidelines and history. hedge_info["tokens"] is the TurnTokens.
+        """
+        system_prompt = PROMPT_VARIANTS[route.prompt_variant]
+        if fused:
+            system_prompt += FUSED_SYSTEM_ADDENDUM
+        groq_start = time.time()
+        content, info = hedged_groq.create(
+            model=route.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.1,
+            max_tokens=route.max_tokens + (FUSED_EXTRA_TOKENS if fused else 0),
+            priority=priority or self.criticality_level,
+            deadline_s=deadline_s,
+            downgrade=self.criticality_level not in NEVER_DOWNGRADE,
+        )
+        groq_time = (time.time() - groq_start) * 1000
+        model_router.record(route, groq_time)
+        section_chars = dict(sections or {}, system=len(system_prompt))
+        section_chars["request"] = max(0, len(user_prompt) - sum(v for k, v in section_chars.items() if k != "system"))
+        info["tokens"] = TurnTokens(
+            model=info["model"],
+            kind=kind,
+            prompt_tokens=info["prompt_tokens"],
+            completion_tokens=info["completion_tokens"],
+            reported=info["usage_reported"],
+            latency_ms=groq_time,
+            sections=split_prompt_tokens(info["prompt_tokens"], section_chars),
+        )
+        token_ledger.record(self.call_id, info["tokens"])
+        return self._parse_advice_content(content, transcript_chunk), groq_time, info
 
-Please analyze the conversation and provide:
-1. An updated summary of key facts
-2. Advice for what the dispatcher should do/say next
+    def speculate(self, partial_text: str, role: str = "caller", with_advice: bool = False) -> Dict:
+        """
+        Run the expensive part of a turn on an in-progress utterance.
 
-Remember: DO NOT repeat anything from the "Previous Advice Given" section above. Avoid giving similar advice or asking about the same topics that were already covered in previous advice."""
-        # 4) Call Groq
-        groq_start = time.time()
-        try:
-            response = groq_client.chat.completions.create(
-                model="meta-llama/llama-4-scout-17b-16e-instruct",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.1,
-                max_tokens=1000
-            )
-            groq_time = (time.time() - groq_start) * 1000
-            timings.append(TimingStats("groq_inference", groq_time, datetime.now().isoformat()))
-
-            # 5) Parse response
-            content = response.choices[0].message.content
+        Nothing is written to memory; the returned dict is handed back to
+        process_chunk_fast(speculation=...) if the final text turns out close enough.
+        """
+        spec_start = time.time()
+        summary_version = self.summary.version
+        current_summary = self._get_current_summary_fast()
+        conversation_history = self._get_full_conversation()
+        rag_query = self._build_rag_query(partial_text, conversation_history)
+        passages, _, rag_time = self._get_guidelines(rag_query, conversation_history + partial_text,
+                                                     speculative=True)
+
+        speculation = {
+            "text": partial_text,
+            "role": role,
+            "summary_version": summary_version,
+            "passages": passages,
+            "rag_ms": rag_time,
+            "result": None,
+            "groq_ms": 0.0,
+        }
+        if with_advice:
+            history = conversation_history + f"{role}: {partial_text}\n"
+            rag_context, _ = self.guidelines.render(passages)
+            user_prompt = self._build_user_prompt(current_summary, rag_context, history, role)
+            route = model_router.choose(self.criticality_level, partial_text)
+            # Speculative advice may be thrown away, so it yields quota to real turns
+            sections = {"summary": len(current_summary), "guidelines": len(rag_context), "history": len(history)}
+            result, groq_time, _ = self._generate_advice(route, user_prompt, partial_text, priority="low",
+                                                         sections=sections, kind="speculation")
+            speculation["result"] = result
+            speculation["groq_ms"] = groq_time
+        speculation["total_ms"] = (time.time() - spec_start) * 1000
+        return speculation
+
+    def provisional_update(self, lines: List[Tuple[str, str]]) -> Optional[Dict]:
+        """
+        Instant rule-based update for freshly consolidated (role, text) lines, pushed
+        to the dashboard before the LLM answers. Returns None if nothing new was found.
+        """
+        start = time.time()
+        new_facts = ExtractedFacts()
+        # Dispatcher lines are mostly questions about the very red flags extracted here
+        for role, text in lines:
+            if role == "caller":
+                new_facts.merge(self.facts.merge(extract_facts(text)))
+        if new_facts.is_empty():
+            return None
+
+        if new_facts.criticality_level:
+            # Red flags route this turn's LLM call to the strong model straight away;
+            # the model's own level replaces it when it answers
+            self.criticality_level = max_criticality(self.criticality_level, new_facts.criticality_level)
+        last_level = self.last_output["criticality_level"] if self.last_output else "low"
+        return {
+            "summary": self.summary.bullets() + new_facts.bullets(),
+            "advice": [],
+            "patient_age": self.facts.patient_age,
+            "criticality_level": max_criticality(last_level, new_facts.criticality_level),
+            "provisional": True,
+            "extraction_ms": (time.time() - start) * 1000,
+        }
+
+    def _skipped_turn_output(self, gate_score, timings: List[TimingStats], start_time: float) -> Dict:
+        """Re-emit the current call state without calling the LLM"""
+        timings.append(TimingStats(f"llm_skipped_{gate_score.reason}", 0, datetime.now().isoformat()))
+        timings.append(TimingStats("total_processing_fast", (time.time() - start_time) * 1000, datetime.now().isoformat()))
+        return dict(
+            self.last_output,
+            skipped=True,
+            skip_reason=gate_score.reason,
+            summary_changes=[],
+            tokens=zero_turn_tokens(),
+            timings=[{"operation": t.operation, "duration_ms": t.duration_ms, "timestamp": t.timestamp}
+                     for t in timings],
+        )
+
+    def process_chunk_fast(self, transcript_chunk: str, role: str = "caller", speculation: Optional[Dict] = None,
+                           already_recorded: bool = False, budget: Optional[TurnBudget] = None,
+                           fragments: Optional[List[Tuple[str, str]]] = None) -> Dict:
+        """
+        Process a chunk of conversation with role context
+        
+        Args:
+            transcript_chunk: The text of the message
+            role: Either 'caller' or 'dispatcher' to indicate who is speaking
+            speculation: Result of speculate() on a close-enough interim utterance;
+                its passages (and advice, if present) are reused instead of recomputed
+            already_recorded: The caller already appended this chunk to the conversation
+                (buffer2 records every consolidated line), so don't append it again
+            budget: Latency budget of the turn since capture; stages degrade when it runs
+                low and the decisions are reported as degraded_* timings
+            fragments: Fused mode: the batch's raw (role, text) ASR fragments in capture
+                order. The model merges them in the same call as the advice; the merged
+                lines are recorded and returned as "dialogue". transcript_chunk is then
+                the naive merge's last caller line, used for gating, retrieval and routing
             
-            try:
-                start = content.find('{')
-                end = content.rfind('}') + 1
-                if start != -1 and end != 0:
-                    json_str = content[start:end]
-                    result = json.loads(json_str)
-                else:
-                    result = {
-                        "summary": [transcript_chunk],
-                        "advice": content,
-                        "patient_age": None,
-                        "criticality_level": "low"
-                    }
-            except json.JSONDecodeError:
-                result = {
-                    "summary": [transcript_chunk],
-                    "advice": content,
-                    "patient_age": None,
-                    "criticality_level": "low"
-                }
-
-            # 6) Update Letta memory asynchronously (fire and forget)
-            if "summary" in result and result["summary"]:
-                new_summary = "\n".join([f"• {item}" for item in result["summary"]])
-                # Fire and forget - don't wait for this
-                import threading
-                thread = threading.Thread(target=self._update_summary_async, args=(new_summary,))
-                thread.daemon = True
-                thread.start()
+        Returns: {"summary": [...], "summary_fields": {...}, "summary_changes": [...],
+                  "advice": [...], "tokens": {...} (zero counts if the model wasn't called), "timings": [...]}
+        """
+        timings = []
+        start_time = time.time()
+        
+        # 1) Update conversation history with new message, keeping the prior
+        #    transcript for the novelty gate
+        prior_history = self._get_full_conversation()
+        if fragments is not None:
+            pass  # recorded once the model has merged them
+        elif already_recorded:
+            entry = f"{role}: {transcript_chunk}\n"
+            cut = prior_history.rfind(entry)
+            if cut != -1:
+                prior_history = prior_history[:cut] + prior_history[cut + len(entry):]
+        else:
+            self._update_conversation_async(role, transcript_chunk)
+
+        # 1b) Skip the whole retrieval + LLM cycle for turns that add nothing
+        if self.last_output is not None and speculation is None:
+            gate_score = novelty_gate.score(transcript_chunk, prior_history, self._get_current_summary_fast())
+            timings.append(TimingStats("novelty_gate", gate_score.duration_ms, datetime.now().isoformat()))
+            if gate_score.skip:
+                output = self._skipped_turn_output(gate_score, timings, start_time)
+                if fragments is not None:
+                    output["dialogue"] = merge_fragments(fragments)
+                    for line_role, text in output["dialogue"]:
+                        self._update_conversation_async(line_role, text)
+                return output
+        
+        # What the rest of the turn usually costs, for budget decisions
+        llm_ms = stage_estimate_ms(f"route.{model_router.policy.get(self.criticality_level, 'standard')}.latency_ms",
+                                   default=DEFAULT_LLM_MS)
+        retrieval_ms = stage_estimate_ms("embedding.request_ms", "vector.query_ms", default=DEFAULT_RETRIEVAL_MS)
+        if budget is not None:
+            timings.append(TimingStats("budget_remaining", budget.remaining_ms(), datetime.now().isoformat()))
+
+        # 2) Get current summary (local) and history
+        summary_start = time.time()
+        current_summary = self._get_current_summary_fast()
+        conversation_history = self._get_full_conversation()
+        summary_time = (time.time() - summary_start) * 1000
+        timings.append(TimingStats("get_summary_and_history", summary_time, datetime.now().isoformat()))
+        
+        # 3) Get RAG passages (with caching) - use both current chunk and recent conversation
+        if speculation is not None:
+            passages = speculation["passages"]
+            timings.append(TimingStats("rag_retrieval_speculative", 0, datetime.now().isoformat()))
+        elif budget is not None and self.last_passages and not budget.affords(0, llm_ms):
+            # No time to retrieve at all: the previous turn's guidelines still apply
+            passages = self.last_passages
+            budget.degrade("reused_passages")
+        else:
+            rag_query = self._build_rag_query(transcript_chunk, conversation_history)
+            retrieval_mode = None
+            if budget is not None and not budget.affords(retrieval_ms, llm_ms):
+                retrieval_mode = "lexical"  # local BM25 only, no embedding or vector round-trip
+                budget.degrade("lexical_retrieval")
+            passages, rag_operation, rag_time = self._get_guidelines(rag_query, conversation_history,
+                                                                     retrieval_mode=retrieval_mode)
+            timings.append(TimingStats(rag_operation, rag_time, datetime.now().isoformat()))
+        self.last_passages = passages
+        
+        # Passages already shown in full on a recent turn become one-line references
+        rag_context, full_ids = self.guidelines.render(passages)
+        self.guidelines.mark_sent(full_ids)
+
+        # 4) Build prompt for Groq, with a shorter history if the budget is nearly spent
+        prompt_history = conversation_history
+        if budget is not None and not budget.affords(llm_ms) and len(conversation_history) > HISTORY_TRIMMED_CHARS:
+            prompt_history = conversation_history[-HISTORY_TRIMMED_CHARS:]
+            prompt_history = prompt_history[prompt_history.find("\n") + 1:]  # start on a whole line
+            budget.degrade("trimmed_history")
+        user_prompt = self._build_user_prompt(current_summary, rag_context, prompt_history, role, fragments)
+
+        # 5) Call Groq (or reuse the speculative advice, which has no merged dialogue for a fused turn)
+        dialogue = None
+        turn_tokens = None
+        try:
+            reused = speculation.get("result") if speculation is not None and fragments is None else None
+            if reused is not None and speculation.get("summary_version") != self.summary.version:
+                # Its summary_ops number items of a summary that has changed since
+                metrics.incr("speculation.stale_summary")
+                reused = None
+            if reused is not None:
+                result = reused
+                timings.append(TimingStats("groq_inference_speculative", 0, datetime.now().isoformat()))
+            else:
+                route = model_router.choose(self.criticality_level, transcript_chunk)
+                if (budget is not None and route.name != "fast" and self.criticality_level not in NEVER_DOWNGRADE
+                        and not budget.affords(llm_ms)):
+                    route = model_router.routes["fast"]
+                    budget.degrade("fast_model")
+                timings.append(TimingStats(f"route_{route.name}", 0, datetime.now().isoformat()))
+                deadline_s = min(GROQ_DEADLINE_S, budget.timeout_s()) if budget is not None else None
+                sections = {"summary": len(current_summary), "guidelines": len(rag_context), "history": len(prompt_history)}
+                result, groq_time, groq_info = self._generate_advice(route, user_prompt, transcript_chunk,
+                                                                     deadline_s=deadline_s, fused=fragments is not None,
+                                                                     sections=sections)
+                turn_tokens = groq_info["tokens"]
+                timings.append(TimingStats("groq_first_token", groq_info["first_token_ms"] or 0, datetime.now().isoformat()))
+                timings.append(TimingStats("groq_inference", groq_time, datetime.now().isoformat()))
+                if groq_info["hedged"]:
+                    timings.append(TimingStats(f"groq_hedge_{groq_info['winner']}_won", 0, datetime.now().isoformat()))
+
+            # 5b) Fused turn: record the dialogue the model merged
+            if fragments is not None:
+                dialogue = self._parse_dialogue(result.get("dialogue"), merge_fragments(fragments))
+                for line_role, text in dialogue:
+                    self._update_conversation_async(line_role, text)
+
+            # 6) Apply the summary ops, then update Letta memory asynchronously (fire and forget)
+            if isinstance(result.get("summary_ops"), list):
+                summary_changes = self.summary.apply(result["summary_ops"])
+            elif isinstance(result.get("summary"), list):
+                summary_changes = self.summary.absorb_bullets(result["summary"])
+            else:
+                summary_changes = []
+            if summary_changes:
+                # Fire and forget - the write-behind queue sends it to Letta
+                self._update_summary_async()
                 
                 timings.append(TimingStats("update_summary_async", 0, datetime.now().isoformat()))
 
-            # Update prev_advice cache with the new advice (regardless of role)
-            if "advice" in result:
-                self.prev_advice_cache = result["advice"]
+            # Reconcile with the provisional rule-based facts: keep an extracted age the
+            # model missed. The model's criticality stands; red flags only steered routing
+            patient_age = result.get("patient_age", None)
+            if patient_age is None:
+                patient_age = self.facts.patient_age
+            criticality_level = result.get("criticality_level") or "low"
+
+            # Drop bullets already given earlier in the call (regardless of role)
+            advice = result.get("advice", "")
+            if isinstance(advice, list):
+                filter_start = time.time()
+                advice, repeats = self.advice_memory.filter(advice)
+                timings.append(TimingStats("advice_filter", (time.time() - filter_start) * 1000, datetime.now().isoformat()))
+                if repeats:
+                    timings.append(TimingStats(f"advice_repeats_dropped_{len(repeats)}", 0, datetime.now().isoformat()))
+            self.criticality_level = criticality_level
+            self._journal({
+                "t": "advice",
+                "advice": advice,
+                "patient_age": patient_age,
+                "criticality_level": criticality_level,
+            })
                 
             total_time = (time.time() - start_time) * 1000
             timings.append(TimingStats("total_processing_fast", total_time, datetime.now().isoformat()))
+            if budget is not None:
+                for decision in budget.degraded:
+                    timings.append(TimingStats(f"degraded_{decision}", 0, datetime.now().isoformat()))
+                timings.append(TimingStats("capture_to_output", budget.finish(), datetime.now().isoformat()))
             
             # Convert timings to dict for JSON serialization
             timing_data = [{"operation": t.operation, "duration_ms": t.duration_ms, "timestamp": t.timestamp} 
                           for t in timings]
             
-            return {
-                "summary": result.get("summary", []),
-                "advice": result.get("advice", ""),
-                "patient_age": result.get("patient_age", None),
-                "criticality_level": result.get("criticality_level", "low"),
+            output = {
+                "summary": self.summary.bullets(),
+                "summary_fields": self.summary.to_dict(),
+                "summary_changes": summary_changes,
+                "advice": advice,
+                "patient_age": patient_age,
+                "criticality_level": criticality_level,
+                "tokens": turn_tokens.to_dict() if turn_tokens is not None else zero_turn_tokens(),
                 "timings": timing_data
             }
+            if dialogue is not None:
+                output["dialogue"] = dialogue
+            self.last_output = output
+            return output
 
         except Exception as e:
-            print(f"Error calling Groq: {e}")
-            return {
-                "summary": [transcript_chunk],
+            logger.error(f"Error calling Groq: {e}")
+            # Keep the last good summary; the turn itself is still in the history
+            output = {
+                "summary": self.summary.bullets(),
+                "summary_fields": self.summary.to_dict(),
+                "summary_changes": [],
                 "advice": "Error processing request. Please try again.",
-                "patient_age": None,
-                "criticality_level": "low",
+                "patient_age": self.facts.patient_age,
+                "criticality_level": self.criticality_level,
+                "tokens": zero_turn_tokens(),
                 "timings": []
             }
+            if fragments is not None:
+                # Keep the turn in the history even though the model never merged it
+                if dialogue is None:
+                    dialogue = merge_fragments(fragments)
+                    for line_role, text in dialogue:
+                        self._update_conversation_async(line_role, text)
+                output["dialogue"] = dialogue
+            return output
 
 # def print_timings(timings):
 #     print("\n=== Performance Timings ===")
@@ -0,0 +1,61 @@
+"""
+Recall@k / latency sweep of the local IVF-int8 index against exact search.
+
+With --index DIR the index must have been built with keep_exact=True; queries
+are stored vectors with a little noise added. Without it, a synthetic clustered
+corpus of --n vectors is built in a temporary directory.
+
+    python ann_benchmark.py --n 100000 --dim 1536 --top-k 10
+"""
+
+import argparse
+import tempfile
+
+import numpy as np
+
+from ann_index import IVFInt8Index, recall_at_k, sample_queries
+
+NPROBE_SWEEP = [1, 2, 4, 8, 16, 32, 64]
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    return centers[rng.integers(clusters, size=n)] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--index", help="existing index directory built with keep_exact=True")
+    parser.add_argument("--n", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=0, help="re-score rerank·top_k candidates exactly")
+    args = parser.parse_args()
+
+    if args.index:
+        index = IVFInt8Index(args.index)
+        if index.exact is None:
+            parser.error(f"{args.index} was built without keep_exact=True")
+    else:
+        vectors = synthetic_corpus(args.n, args.dim, args.clusters)
+        ids = [f"doc_{i}" for i in range(len(vectors))]
+        index = IVFInt8Index.build(ids, ids, vectors, path=tempfile.mkdtemp(prefix="ann_bench_"),
+                                   nlist=args.nlist, keep_exact=True)
+    queries = sample_queries(index, args.queries)
+
+    print(f"{len(index)} vectors, {index.meta['nlist']} lists, int8 codes "
+          f"{index.codes.nbytes / 2**20:.1f} MiB (float32 would be {index.codes.nbytes * 4 / 2**20:.1f} MiB)")
+    print(f"{'nprobe':>7} {'recall@' + str(args.top_k):>10} {'mean ms':>9} {'p90 ms':>9}")
+    for nprobe in NPROBE_SWEEP:
+        if nprobe > index.meta["nlist"]:
+            break
+        r = recall_at_k(index, queries, args.top_k, nprobe=nprobe, rerank=args.rerank)
+        print(f"{nprobe:>7} {r['recall']:>10.3f} {r['mean_ms']:>9.2f} {r['p90_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Local approximate nearest-neighbour index for large guideline corpora.
+
+A flat scan, or a remote Pinecone query, stops being fast once the corpus grows
+from two manuals to hundreds of thousands of 1536-dim chunks (county SOPs,
+poison-control sheets, hospital capability docs). IVFInt8Index is an inverted
+file index: vectors are clustered around NLIST k-means centroids, each stored as
+int8 codes with a per-vector scale (4x smaller than float32), and laid out
+contiguously by list. A query scores the centroids and scans only the NPROBE
+closest lists. rag.py builds it into ANN_INDEX_DIR; agent.py memory-maps it, so
+loading is instant and pages are shared between worker processes. Chunk ids and
+texts are memory-mapped too (a UTF-8 blob plus row offsets each), and an id is
+found by binary search over the rows sorted by id, so no process holds the
+corpus text in Python objects.
+
+Knobs: nlist (build time) and nprobe (query time) trade recall for latency;
+rerank re-scores the best candidates with exact float32 vectors if the index was
+built with keep_exact=True. recall_at_k() compares against exact search, e.g. on
+sample_queries() of the built index.
+
+Requires numpy (`pip install .[ann]`).
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+logger = logging.getLogger("ann_index")
+
+ANN_INDEX_DIR = os.getenv("ANN_INDEX_DIR", "ann_index")
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+KMEANS_ITERATIONS = 12
+KMEANS_SAMPLES_PER_LIST = 64   # training sample size per centroid
+ASSIGN_BATCH = 8192            # rows per matrix product when assigning/scanning
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("The ANN index needs numpy: pip install .[ann]")
+
+
+def _normalize(x):
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def default_nlist(n: int) -> int:
+    """~4·sqrt(n) lists, the usual IVF rule of thumb."""
+    return max(1, min(n, int(4 * math.sqrt(n))))
+
+
+def _kmeans(vectors, nlist: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0):
+    """Spherical k-means (cosine) on a sample of the vectors."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLES_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = sample[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+            else:
+                # Re-seed empty lists from a random sample point
+                centroids[c] = sample[rng.integers(sample_size)]
+        centroids = _normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+def _assign(vectors, centroids):
+    return np.concatenate([
+        np.argmax(vectors[i:i + ASSIGN_BATCH] @ centroids.T, axis=1)
+        for i in range(0, len(vectors), ASSIGN_BATCH)
+    ])
+
+
+def quantize_int8(vectors) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Symmetric per-vector int8 quantization: x ≈ codes * scale."""
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class StringTable:
+    """Read-only strings by row: a memory-mapped UTF-8 blob sliced by an offsets array."""
+
+    def __init__(self, path: str, name: str):
+        self.offsets = np.load(os.path.join(path, f"{name}_offsets.npy"), mmap_mode="r")
+        blob_path = os.path.join(path, f"{name}.bin")
+        # np.memmap refuses empty files
+        self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def raw(self, row: int) -> bytes:
+        return bytes(self.blob[int(self.offsets[row]):int(self.offsets[row + 1])])
+
+    def __getitem__(self, row: int) -> str:
+        return self.raw(row).decode("utf-8")
+
+    @staticmethod
+    def write(path: str, name: str, strings: Sequence[str]) -> None:
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.concatenate([[0], np.cumsum([len(e) for e in encoded], dtype=np.int64)]).astype(np.int64)
+        np.save(os.path.join(path, f"{name}_offsets.npy"), offsets)
+        with open(os.path.join(path, f"{name}.bin"), "wb") as f:
+            for e in encoded:
+                f.write(e)
+
+
+class IVFInt8Index:
+    def __init__(self, path: str = ANN_INDEX_DIR, nprobe: int = ANN_NPROBE):
+        _require_numpy()
+        self.path = path
+        self.nprobe = nprobe
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.ids = StringTable(path, "ids")
+        self.texts = StringTable(path, "texts")
+        self.id_order = np.load(os.path.join(path, "id_order.npy"), mmap_mode="r")   # rows sorted by id
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        # The bulk of the index stays on disk and is paged in on demand
+        self.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        exact_path = os.path.join(path, "vectors.npy")
+        self.exact = np.load(exact_path, mmap_mode="r") if os.path.exists(exact_path) else None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, ids: Sequence[str], texts: Sequence[str], vectors, path: str = ANN_INDEX_DIR,
+              nlist: Optional[int] = None, keep_exact: bool = False, seed: int = 0) -> "IVFInt8Index":
+        """Cluster, quantize and write the index; rows are stored grouped by list."""
+        _require_numpy()
+        start = time.time()
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        nlist = nlist or default_nlist(len(vectors))
+        centroids = _kmeans(vectors, nlist, seed=seed)
+        assign = _assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        codes, scales = quantize_int8(vectors[order])
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "centroids.npy"), centroids)
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        np.save(os.path.join(path, "codes.npy"), codes)
+        np.save(os.path.join(path, "scales.npy"), scales)
+        if keep_exact:
+            np.save(os.path.join(path, "vectors.npy"), vectors[order])
+        StringTable.write(path, "ids", [ids[i] for i in order])
+        StringTable.write(path, "texts", [texts[i] for i in order])
+        # Sorted by UTF-8 bytes, the order row() compares in
+        np.save(os.path.join(path, "id_order.npy"),
+                np.asarray(sorted(range(len(order)), key=lambda row: ids[order[row]].encode("utf-8")), dtype=np.int64))
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"dim": int(vectors.shape[1]), "nlist": nlist, "count": len(vectors),
+                       "metric": "cosine", "built_at": time.time()}, f)
+        logger.info(f"Built IVF-int8 index: {len(vectors)} vectors, {nlist} lists in {time.time() - start:.1f}s")
+        return cls(path)
+
+    def _candidates(self, query, nprobe: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        """(row, approximate score) for every vector in the nprobe closest lists."""
+        lists = np.argsort(self.centroids @ query)[::-1][:nprobe]
+        rows, scores = [], []
+        for lst in lists:
+            lo, hi = int(self.offsets[lst]), int(self.offsets[lst + 1])
+            if lo == hi:
+                continue
+            rows.append(np.arange(lo, hi))
+            scores.append((self.codes[lo:hi].astype(np.float32) @ query) * self.scales[lo:hi])
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(rows), np.concatenate(scores)
+
+    def search(self, vector: Sequence[float], top_k: int = 10, nprobe: Optional[int] = None,
+               rerank: int = 0) -> List[Tuple[str, float]]:
+        """
+        (id, cosine score) of the approximate top_k. With rerank > 0 the best
+        rerank·top_k candidates are re-scored with exact vectors when available.
+        """
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        rows, scores = self._candidates(query, nprobe or self.nprobe)
+        if not len(rows):
+            return []
+        keep = min(len(rows), top_k * rerank if rerank and self.exact is not None else top_k)
+        best = np.argpartition(-scores, keep - 1)[:keep]
+        rows, scores = rows[best], scores[best]
+        if rerank and self.exact is not None:
+            scores = np.asarray(self.exact[rows]) @ query
+        order = np.argsort(-scores)[:top_k]
+        return [(self.ids[rows[i]], float(scores[i])) for i in order]
+
+    def row(self, doc_id: str) -> Optional[int]:
+        """Storage row of doc_id (binary search over id_order), or None."""
+        key = doc_id.encode("utf-8")
+        lo, hi = 0, len(self.id_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ids.raw(int(self.id_order[mid])) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.id_order) and self.ids.raw(int(self.id_order[lo])) == key:
+            return int(self.id_order[lo])
+        return None
+
+    def text(self, doc_id: str) -> Optional[str]:
+        row = self.row(doc_id)
+        return self.texts[row] if row is not None else None
+
+
+def exact_search(vectors, vector: Sequence[float], top_k: int = 10) -> List[int]:
+    """Row indices of the true top_k by cosine (brute force)."""
+    query = _normalize(np.asarray(vector, dtype=np.float32))
+    scores = np.concatenate([vectors[i:i + ASSIGN_BATCH] @ query for i in range(0, len(vectors), ASSIGN_BATCH)])
+    return list(np.argsort(-scores)[:top_k])
+
+
+def sample_queries(index: IVFInt8Index, count: int, noise: float = 0.05, seed: int = 1):
+    """Stored exact vectors plus a little noise, as stand-in queries for recall_at_k()."""
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(index.exact[rng.choice(len(index), min(count, len(index)), replace=False)])
+    return sample + noise * rng.normal(size=sample.shape).astype(np.float32)
+
+
+def recall_at_k(index: IVFInt8Index, queries, top_k: int = 10, nprobe: Optional[int] = None,
+                rerank: int = 0) -> Dict[str, float]:
+    """Mean recall@k of the ANN index against exact search, and mean query latency."""
+    if index.exact is None:
+        raise ValueError("recall_at_k needs an index built with keep_exact=True")
+    recalls, latencies = [], []
+    for query in queries:
+        truth = {index.ids[row] for row in exact_search(index.exact, query, top_k)}
+        start = time.time()
+        found = {doc_id for doc_id, _ in index.search(query, top_k, nprobe=nprobe, rerank=rerank)}
+        latencies.append((time.time() - start) * 1000)
+        recalls.append(len(found & truth) / len(truth))
+    return {"recall": float(np.mean(recalls)), "mean_ms": float(np.mean(latencies)),
+            "p90_ms": float(np.percentile(latencies, 90))}
+
+
+_index: Optional[IVFInt8Index] = None
+_index_lock = threading.Lock()
+_load_failed = False
+
+
+def get_ann_index(path: str = ANN_INDEX_DIR) -> Optional[IVFInt8Index]:
+    """Process-wide memory-mapped index, or None if numpy or the built index is missing."""
+    global _index, _load_failed
+    with _index_lock:
+        if _index is None and not _load_failed:
+            try:
+                _index = IVFInt8Index(path)
+            except (RuntimeError, OSError, ValueError, KeyError) as e:
+                logger.warning(f"No ANN index loaded from {path}: {e}")
+                _load_failed = True
+        return _index
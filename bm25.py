@@ -0,0 +1,130 @@
+"""
+Local BM25 index over the guideline chunks, plus reciprocal rank fusion.
+
+Protocol lookups are keyword heavy (drug names, "CPR", "AED", street names) and
+an embedding of a query that is mostly recent history often misses them. rag.py
+builds a BM25Index from the same chunks it upserts to Pinecone and saves it to
+BM25_INDEX_PATH; DispatcherAgent loads it once and fuses its ranking with the
+Pinecone ranking via reciprocal_rank_fusion(), or uses it alone when the
+embedding call would blow the retrieval latency budget.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("bm25")
+
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "bm25_index.json")
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60   # rank constant from the original RRF paper; damps the head of each list
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = {
+    "a", "an", "the", "and", "or", "but", "is", "are", "was", "were", "be", "been", "to", "of", "in", "on",
+    "at", "for", "with", "as", "by", "it", "its", "this", "that", "these", "those", "if", "then", "from",
+    "you", "your", "he", "she", "they", "we", "i", "me", "my", "his", "her", "their", "our", "do", "does",
+    "did", "have", "has", "had", "can", "will", "would", "should", "could", "not", "no", "so", "what",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOP_WORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over (id, text) documents, with an inverted index of term frequencies."""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.doc_lens: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}   # term -> [(doc, tf)]
+        self.positions: Dict[str, int] = {}
+        self.avg_len = 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[str, str]], **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc, (doc_id, text) in enumerate(docs):
+            tokens = tokenize(text)
+            index.positions[doc_id] = len(index.ids)
+            index.ids.append(doc_id)
+            index.texts.append(text)
+            index.doc_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append((doc, tf))
+        index.postings = dict(postings)
+        index.avg_len = sum(index.doc_lens) / len(index.doc_lens) if index.doc_lens else 0.0
+        return index
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.ids) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """(doc_id, score) for the top_k documents sharing at least one term with the query."""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf(term)
+            for doc, tf in plist:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[doc] / self.avg_len)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.ids[doc], score) for doc, score in ranked]
+
+    def text(self, doc_id: str) -> Optional[str]:
+        doc = self.positions.get(doc_id)
+        return self.texts[doc] if doc is not None else None
+
+    def save(self, path: str = BM25_INDEX_PATH) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": list(zip(self.ids, self.texts))}, f)
+
+    @classmethod
+    def load(cls, path: str = BM25_INDEX_PATH) -> "BM25Index":
+        # Only the documents are stored; postings are rebuilt (milliseconds for two manuals)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls.build(((doc_id, text) for doc_id, text in data["docs"]), k1=data["k1"], b=data["b"])
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fuse several ranked id lists: score(d) = sum over lists of 1 / (k + rank(d))."""
+    fused: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+_index: Optional[BM25Index] = None
+_index_lock = threading.Lock()
+
+
+def get_bm25_index(path: str = BM25_INDEX_PATH) -> Optional[BM25Index]:
+    """Process-wide index, loaded on first use; None if rag.py hasn't built one yet."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            try:
+                _index = BM25Index.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"No BM25 index loaded from {path}: {e}")
+                _index = BM25Index()
+        return _index if len(_index) else None
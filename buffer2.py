@@ -1,14 +1,29 @@
 import os
+import re
+import time
 import asyncio
 import json
 import logging
+import uuid
 import websockets
 from collections import deque
-from typing import Dict, List, Tuple
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor
 
-from groq import Groq
-from agent import DispatcherAgent
+import clients
+import http_pool
+from agent import DispatcherAgent, memory_writer, merge_fragments, model_router
+from call_journal import recover_call, recover_calls
+from deadline import TurnBudget
+from fact_extractor import extract_facts, max_criticality
+from metrics import metrics
+from rate_governor import estimate_chat_tokens, estimate_tokens, rate_governor
+from speculation import Speculator
+from token_accounting import TurnTokens, token_ledger
+from traffic_capture import recorder_from_env
+from turn_scheduler import TurnScheduler
+from turn_store import BoundedCache
 
 # ── Configuration ─────────────────────────────────────────────────────────────
 WS_URL = "wss://e30c-2607-f140-400-21-d1c3-a928-d6c1-dd17.ngrok-free.app/"
@@ -17,30 +32,114 @@ BUFFER_INTERVAL = 5.5
 MAX_WORKERS = 3
 MAX_BUFFERED_MESSAGES = 1000
 GROQ_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+SPECULATIVE_MODE = True     # start retrieval on interim utterances before the flush
+SPECULATE_ADVICE = False    # also speculate the Groq advice call (costs extra tokens)
+# Consolidate fragments and advise in one Groq call (agent fused mode) instead of two in a row
+FUSED_TURNS = os.getenv("FUSED_TURNS", "0") == "1"
+METRICS_INTERVAL = 30.0
+CALL_END_EVENTS = ("call-ended", "call_ended")
+CONNECTION_CALL_PREFIX = "conn-"    # call ids minted for producers that send no callId (one call per connection)
+LEGACY_CALL_IDS = ("default",)      # the single shared id older builds used; never recovered
+ENDED_CALLS_REMEMBERED = 10000      # ended call ids whose late messages are dropped
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger("buffer")
 logger.setLevel(logging.DEBUG)
 
-# ── Clients ───────────────────────────────────────────────────────────────────
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-agent = DispatcherAgent()
+# ── Executors ─────────────────────────────────────────────────────────────────
 executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+spec_executor = ThreadPoolExecutor(max_workers=1)
+# Consolidation + agent turns on MAX_WORKERS threads, plus the speculation thread
+http_pool.configure(workers=MAX_WORKERS + 1)
 
 # ── Queues & Buffers ─────────────────────────────────────────────────────────
 raw_queue: deque = deque(maxlen=MAX_BUFFERED_MESSAGES)
-task_queue: asyncio.Queue = asyncio.Queue()
+task_queue = TurnScheduler()   # per-call batches, most critical call first
 
-# ── Dialogue Consolidation ────────────────────────────────────────────────────
-def consolidate_dialogue_with_groq(raw_messages: List[Dict]) -> List[Tuple[str, str]]:
+# ── Per-call Sessions ─────────────────────────────────────────────────────────
+@dataclass
+class CallSession:
+    agent: DispatcherAgent
+    speculator: Speculator
+
+sessions: Dict[str, CallSession] = {}
+ended_calls = BoundedCache(ENDED_CALLS_REMEMBERED)
+
+class CallEndedError(LookupError):
+    """A session was requested for a call that has already ended."""
+
+def call_id_of(msg: Dict) -> Optional[str]:
+    """Call id from the message metadata, made safe for use as a journal directory name."""
+    metadata = msg.get('metadata') or {}
+    call_id = metadata.get('callId') or metadata.get('callSid') or msg.get('callId')
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(call_id)) if call_id else None
+
+def new_connection_call_id() -> str:
+    return f"{CONNECTION_CALL_PREFIX}{uuid.uuid4().hex[:12]}"
+
+def is_connection_call(call_id: str) -> bool:
+    """Ids that only live as long as one connection: they can't resume after a restart."""
+    return call_id.startswith(CONNECTION_CALL_PREFIX) or call_id in LEGACY_CALL_IDS
+
+def attribute_to_connection(msg: Dict, connection_call_id: str) -> Dict:
+    """Messages without call metadata belong to the connection's own call."""
+    metadata = msg.get('metadata') or {}
+    if call_id_of(msg) is None and isinstance(metadata, dict):
+        msg['metadata'] = dict(metadata, callId=connection_call_id)
+    return msg
+
+def get_session(call_id: str, agent: DispatcherAgent = None) -> CallSession:
+    session = sessions.get(call_id)
+    if session is None:
+        if call_id in ended_calls:
+            raise CallEndedError(call_id)
+        if agent is None:
+            # A call this process hasn't seen may still have a journal: it was moved
+            # here from a worker process that died (supervisor mode)
+            state = recover_call(call_id) if call_id not in LEGACY_CALL_IDS else None
+            agent = DispatcherAgent.from_journal(state) if state else DispatcherAgent(call_id=call_id)
+        speculator = Speculator(agent, spec_executor, speculate_advice=SPECULATE_ADVICE)
+        session = sessions[call_id] = CallSession(agent, speculator)
+    return session
+
+def recover_sessions():
+    """Rebuild every call that was still live when the previous process stopped."""
+    start = time.time()
+    states = recover_calls()
+    for call_id in [c for c in states if is_connection_call(c)]:
+        # Its connection closed with the previous process; nothing will resume or end it
+        del states[call_id]
+        DispatcherAgent(call_id=call_id).end_call()
+        logger.info(f"Discarded journal of connection call {call_id}")
+    for call_id, state in states.items():
+        get_session(call_id, DispatcherAgent.from_journal(state))
+    if states:
+        logger.info(f"Recovered {len(states)} active call(s) from journal in {(time.time() - start) * 1000:.1f}ms")
+
+async def end_session(call_id: str):
     """
-    Call Groq to merge fragmented ASR messages into clean dialogue.
-    Returns list of (role, text).
+    End a call: drop its buffered fragments and queued turn, let a turn already
+    in flight finish, then tear the call down. Later messages for it are dropped.
     """
-    if not raw_messages:
-        return []
-    # Group and sort fragments
-    fragments_by_role: Dict[str, List[Dict]] = {}
+    ended_calls[call_id] = True
+    pending = [msg for msg in raw_queue if call_id_of(msg) != call_id]
+    if len(pending) != len(raw_queue):
+        raw_queue.clear()
+        raw_queue.extend(pending)
+    if await task_queue.discard(call_id) is not None:
+        metrics.incr("turn.dropped_call_ended")
+    await task_queue.wait_done(call_id)
+    session = sessions.pop(call_id, None)
+    if session is not None:
+        session.speculator.close()
+        logger.info(f"Call {call_id} tokens: {token_ledger.call_totals(call_id)}")
+        await asyncio.get_running_loop().run_in_executor(None, session.agent.end_call)
+        logger.info(f"Call {call_id} ended")
+
+# ── Dialogue Consolidation ────────────────────────────────────────────────────
+def order_fragments(raw_messages: List[Dict]) -> List[Dict]:
+    """The batch's fragments as {'role', 'text', 'ts', 'seq'} in capture order."""
+    fragments = []
     for msg in raw_messages:
         role = msg.get('metadata', {}).get('role', 'unknown')
         if role == 'agent':
@@ -48,13 +147,27 @@ def consolidate_dialogue_with_groq(raw_messages: List[Dict]) -> List[Tuple[str,
         text = msg.get('text', '').strip()
         timestamp = msg.get('metadata', {}).get('timestamp', '0')
         sequence = msg.get('metadata', {}).get('sequenceNumber', 0)
-        fragments_by_role.setdefault(role, []).append({
+        fragments.append({
+            'role': role,
             'text': text,
             'ts': int(timestamp) if str(timestamp).isdigit() else 0,
             'seq': sequence,
         })
-    for role, frags in fragments_by_role.items():
-        frags.sort(key=lambda x: (x['ts'], x['seq']))
+    fragments.sort(key=lambda x: (x['ts'], x['seq']))
+    return fragments
+
+def consolidate_dialogue_with_groq(raw_messages: List[Dict], priority: str = None) -> List[Tuple[str, str]]:
+    """
+    Call Groq to merge fragmented ASR messages into clean dialogue, queueing for
+    rate-limit quota at `priority` (the call's criticality).
+    Returns list of (role, text).
+    """
+    if not raw_messages:
+        return []
+    # Group and sort fragments
+    fragments_by_role: Dict[str, List[Dict]] = {}
+    for f in order_fragments(raw_messages):
+        fragments_by_role.setdefault(f['role'], []).append(f)
     # Build prompt
     fragments_text = ''
     for role, frags in fragments_by_role.items():
@@ -66,17 +179,34 @@ def consolidate_dialogue_with_groq(raw_messages: List[Dict]) -> List[Tuple[str,
         f"Return ONLY valid JSON array of {{'role':..., 'text':...}}.\n"
         f"Fragments:{fragments_text}"
     )
+    messages = [
+        {"role": "system", "content": "Always respond with valid JSON array only."},
+        {"role": "user",   "content": prompt}
+    ]
+    reservation = None
     try:
-        resp = groq_client.chat.completions.create(
+        prompt_tokens = estimate_chat_tokens(messages)
+        reservation = rate_governor.acquire(GROQ_MODEL, prompt_tokens + 500, priority)
+        start = time.time()
+        resp = clients.groq_client().chat.completions.create(
             model=GROQ_MODEL,
-            messages=[
-                {"role": "system", "content": "Always respond with valid JSON array only."},
-                {"role": "user",   "content": prompt}
-            ],
+            messages=messages,
             temperature=0.1,
             max_tokens=500
         )
+        latency_ms = (time.time() - start) * 1000
         content = resp.choices[0].message.content.strip()
+        usage = getattr(resp, "usage", None)
+        if usage is not None:
+            rate_governor.settle(reservation, usage.total_tokens)
+        token_ledger.record(call_id_of(raw_messages[0]), TurnTokens(
+            model=GROQ_MODEL,
+            kind="consolidation",
+            prompt_tokens=usage.prompt_tokens if usage is not None else prompt_tokens,
+            completion_tokens=usage.completion_tokens if usage is not None else estimate_tokens(content),
+            reported=usage is not None,
+            latency_ms=latency_ms,
+        ))
         data = json.loads(content)
         if not isinstance(data, list):
             raise ValueError("Expected list JSON from Groq")
@@ -88,13 +218,16 @@ def consolidate_dialogue_with_groq(raw_messages: List[Dict]) -> List[Tuple[str,
                 cleaned.append((r, t))
         return cleaned
     except Exception as e:
+        if reservation is not None:
+            rate_governor.report_error(GROQ_MODEL, e)
         logger.error(f"Consolidation error: {e}")
         return []
 
 # ── Buffer Collector ───────────────────────────────────────────────────────────
 async def buffer_collector():
     """
-    Every BUFFER_INTERVAL seconds, batch raw_queue into task_queue.
+    Every BUFFER_INTERVAL seconds, batch raw_queue into task_queue, prioritised by
+    the call's latest criticality (raised by red flags in the new fragments).
     """
     loop = asyncio.get_running_loop()
     next_flush = loop.time() + BUFFER_INTERVAL
@@ -105,8 +238,20 @@ async def buffer_collector():
         if raw_queue:
             batch = list(raw_queue)
             raw_queue.clear()
-            await task_queue.put(batch)
-            logger.info(f"Queued batch of {len(batch)} messages")
+            by_call: Dict[str, List[Dict]] = {}
+            for msg in batch:
+                by_call.setdefault(call_id_of(msg), []).append(msg)
+            for call_id, messages in by_call.items():
+                if call_id in ended_calls:
+                    continue
+                session = get_session(call_id)
+                session.speculator.reset_utterance()
+                caller_text = " ".join(m.get('text', '') for m in messages
+                                        if m.get('metadata', {}).get('role') == 'caller')
+                red_flags = extract_facts(caller_text, include_name=False)
+                level = max_criticality(session.agent.criticality_level, red_flags.criticality_level)
+                await task_queue.put(call_id, messages, level)
+            logger.info(f"Queued batch of {len(batch)} messages across {len(by_call)} call(s)")
         else:
             logger.debug("No messages to flush this interval")
 
@@ -114,25 +259,53 @@ async def buffer_collector():
 async def processing_worker(worker_id: str, websocket):
     """
     Consume batches from task_queue, consolidate via Groq, update memory, run agent, send reply.
+    With FUSED_TURNS the agent consolidates and advises in a single call instead.
     """
     loop = asyncio.get_running_loop()
     while True:
-        batch: List[Dict] = await task_queue.get()
+        turn = await task_queue.get()
+        call_id, batch = turn.call_id, turn.batch
+        # The latency budget runs from capture of the newest fragment, so queueing
+        # and consolidation count against it
+        budget = TurnBudget.from_fragments(batch)
+        abandoned = None    # agent run still going after the turn was dropped
         try:
-            # 1) Consolidate fragments
-            coherent = await loop.run_in_executor(executor, consolidate_dialogue_with_groq, batch)
+            if call_id in ended_calls:
+                metrics.incr("turn.dropped_call_ended")
+                continue
+            session = get_session(call_id)
+            agent = session.agent
+            fragments = None
+            if FUSED_TURNS:
+                # 1) The agent merges the fragments itself; until it answers, the
+                #    fragments joined per speaker stand in for the dialogue
+                fragments = [(f['role'], f['text']) for f in order_fragments(batch) if f['text']]
+                coherent = merge_fragments(fragments)
+            else:
+                # 1) Consolidate fragments
+                coherent = await loop.run_in_executor(executor, consolidate_dialogue_with_groq, batch,
+                                                      turn.criticality_level)
             if not coherent:
                 logger.debug(f"[{worker_id}] No coherent dialogue extracted")
-                task_queue.task_done()
                 continue
             
-            # Log Groq preprocessing output
-            logger.info(f"[{worker_id}] Groq preprocessing output:")
-            for role, text in coherent:
-                logger.info("   %s: %s", role, text)
-            # 2) Debounced memory update
-            for role, text in coherent:
-                agent._update_conversation_async(role, text)
+            if fragments is None:
+                # Log Groq preprocessing output
+                logger.info(f"[{worker_id}] Groq preprocessing output:")
+                for role, text in coherent:
+                    logger.info("   %s: %s", role, text)
+                # 2) Record every consolidated line in memory
+                for role, text in coherent:
+                    agent._update_conversation_async(role, text)
+            # 2b) Push rule-based facts (age, address, red flags) before the LLM answers
+            provisional = agent.provisional_update(coherent)
+            if provisional is not None:
+                await websocket.send(json.dumps({
+                    "event": "distribute_suggestions",
+                    "data": dict(provisional, role="assistant", call_id=call_id, worker_id=worker_id,
+                                 source="ai_buffer_processor")
+                }))
+                logger.info(f"[{worker_id}] Sent provisional update ({provisional['extraction_ms']:.2f}ms extraction)")
             # 3) Choose last caller statement or last item
             callers = [t for r, t in coherent if r == 'caller']
             if callers:
@@ -140,25 +313,39 @@ async def processing_worker(worker_id: str, websocket):
                 last_role = 'caller'
             else:
                 last_role, chunk_text = coherent[-1]
-            # 4) Run agent
-            future = loop.run_in_executor(
-                executor,
+            # 4) Run agent, reusing speculative retrieval/advice when it matches
+            speculation = await session.speculator.claim(chunk_text, last_role) if SPECULATIVE_MODE else None
+            run = executor.submit(
                 agent.process_chunk_fast,
                 chunk_text,
-                last_role
+                last_role,
+                speculation,
+                fragments is None,  # consolidated lines were recorded above
+                budget,
+                fragments
             )
             try:
-                out = await asyncio.wait_for(future, timeout=15)
+                # Shielded: the timeout must not cancel the wrapper while the thread still runs
+                out = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(run)), timeout=budget.timeout_s())
             except asyncio.TimeoutError:
-                logger.error(f"[{worker_id}] Agent processing timed out")
-                task_queue.task_done()
+                logger.error(f"[{worker_id}] Agent processing exceeded the turn's hard limit; dropping it")
+                metrics.incr("turn.dropped")
+                abandoned = run
                 continue
+            if fragments is not None:
+                coherent = out.get("dialogue") or coherent
+                logger.info(f"[{worker_id}] Fused consolidation output:")
+                for role, text in coherent:
+                    logger.info("   %s: %s", role, text)
             # 5) Emit suggestions_update event to the main WebSocket server
             payload = {
                 "event": "distribute_suggestions",
                 "data": {
                     "role": "assistant",
+                    "call_id": call_id,
                     "summary": out.get("summary", []),
+                    "summary_fields": out.get("summary_fields"),
+                    "summary_changes": out.get("summary_changes", []),
                     "advice": out.get("advice", ""),
                     "patient_age": out.get("patient_age", None),
                     "criticality_level": out.get("criticality_level", "low"),
@@ -176,35 +363,123 @@ async def processing_worker(worker_id: str, websocket):
         except Exception as e:
             logger.error(f"[{worker_id}] Error: {e}")
         finally:
-            task_queue.task_done()
+            # The call's next turn waits until this one (or its abandoned agent run) is finished
+            if abandoned is None:
+                await task_queue.done(turn)
+            else:
+                # Runs on the executor thread once process_chunk_fast returns
+                abandoned.add_done_callback(lambda _, turn=turn: loop.call_soon_threadsafe(
+                    lambda: loop.create_task(task_queue.done(turn))))
+
+# ── Metrics Reporter ──────────────────────────────────────────────────────────
+async def metrics_reporter():
+    """
+    Every METRICS_INTERVAL seconds, log a snapshot of the process-wide metrics.
+    """
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        logger.info(f"Metrics: {json.dumps(metrics.snapshot())}")
+        logger.info(f"Routes: {model_router.stats()}")
+        logger.info(f"Memory writer: {memory_writer.stats()}")
+        logger.info(f"Scheduler: {TurnScheduler.stats()}")
+        logger.info(f"Rate limit headroom: {rate_governor.headroom()}")
+        logger.info(f"Call memory: {memory_report()}")
+        logger.info(f"Tokens: {token_ledger.stats()}")
+        logger.info(f"HTTP pools: {http_pool.stats()} pinecone={clients.pinecone_pool_stats()}")
+        if SPECULATIVE_MODE:
+            logger.info(f"Speculation: {Speculator.stats()}")
+
+def memory_report() -> Dict:
+    """Bytes of in-process state per active call."""
+    per_call = {call_id: session.agent.memory_bytes()["total"] for call_id, session in list(sessions.items())}
+    total = sum(per_call.values())
+    metrics.gauge("calls.active", len(per_call))
+    metrics.gauge("calls.memory_bytes", total)
+    return {
+        "active_calls": len(per_call),
+        "total_bytes": total,
+        "mean_bytes": total // len(per_call) if per_call else 0,
+        "largest": sorted(per_call.items(), key=lambda item: item[1], reverse=True)[:5],
+    }
+
+# ── Message Handling ──────────────────────────────────────────────────────────
+async def handle_message(msg: Dict):
+    if msg.get('event') in ('interim-transcription', *CALL_END_EVENTS) and call_id_of(msg) is None:
+        metrics.incr("messages.no_call_id")
+        logger.warning(f"Dropped {msg.get('event')} without a call id")
+    elif call_id_of(msg) in ended_calls:
+        metrics.incr("messages.after_call_end")
+        logger.debug(f"Dropped {msg.get('event')} for ended call {call_id_of(msg)}")
+    elif msg.get('event') == 'interim-transcription':
+        raw_queue.append(msg)
+        if SPECULATIVE_MODE:
+            get_session(call_id_of(msg)).speculator.observe(msg)
+        logger.debug(f"📨 Queued: {msg.get('metadata', {}).get('role', 'unknown')} - {msg.get('text', '')[:30]}...")
+    elif msg.get('event') in CALL_END_EVENTS:
+        await end_session(call_id_of(msg))
+
+async def decode_messages(ws, connection_call_id: Optional[str] = None) -> AsyncIterator[Dict]:
+    """Messages from the socket; those without a call id go to `connection_call_id`."""
+    async for raw in ws:
+        try:
+            msg = json.loads(raw)
+        except json.JSONDecodeError:
+            logger.warning(f"Invalid JSON: {raw}")
+            continue
+        yield attribute_to_connection(msg, connection_call_id) if connection_call_id and isinstance(msg, dict) else msg
+
+async def run_pipeline(sender, messages: AsyncIterator[Dict],
+                       reporter: Callable[[], Awaitable] = metrics_reporter):
+    """
+    Collector, processing workers and reporter for one stream of messages.
+    `sender` is anything with an async send(str): the WebSocket itself, or the
+    supervisor's queue back to it when running as a worker process.
+    """
+    collector = asyncio.create_task(buffer_collector())
+    reporter_task = asyncio.create_task(reporter())
+    workers = [
+        asyncio.create_task(processing_worker(f"worker-{i}", sender))
+        for i in range(MAX_WORKERS)
+    ]
+    try:
+        async for msg in messages:
+            await handle_message(msg)
+    except Exception as e:
+        logger.error(f"Message stream error: {e}")
+    finally:
+        # Shutdown
+        collector.cancel()
+        reporter_task.cancel()
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(collector, reporter_task, *workers, return_exceptions=True)
+        # A connection's own call ends with it; other calls stay recoverable, so
+        # only flush their queued memory/journal updates
+        for call_id in [c for c in sessions if is_connection_call(c)]:
+            await end_session(call_id)
+        for session in sessions.values():
+            await asyncio.get_running_loop().run_in_executor(None, session.agent.close)
 
 # ── WebSocket Handler ─────────────────────────────────────────────────────────
 async def ws_handler():
-    async with websockets.connect(WS_URL) as ws:
-        logger.info(f"Connected to {WS_URL}")
-        # Start collector and workers
-        collector = asyncio.create_task(buffer_collector())
-        workers = [
-            asyncio.create_task(processing_worker(f"worker-{i}", ws))
-            for i in range(MAX_WORKERS)
-        ]
-        try:
-            async for raw in ws:
-                try:
-                    msg = json.loads(raw)
-                    if msg.get('event') == 'interim-transcription':
-                        raw_queue.append(msg)
-                        logger.debug(f"📨 Queued: {msg.get('metadata', {}).get('role', 'unknown')} - {msg.get('text', '')[:30]}...")
-                except json.JSONDecodeError:
-                    logger.warning(f"Invalid JSON: {raw}")
-        except Exception as e:
-            logger.error(f"WebSocket error: {e}")
-        finally:
-            # Shutdown
-            collector.cancel()
-            for w in workers:
-                w.cancel()
-            await asyncio.gather(collector, *workers, return_exceptions=True)
+    recover_sessions()
+    # Open connections to every API now so the first turn doesn't pay for handshakes
+    warmer = clients.connection_warmer()
+    await asyncio.get_running_loop().run_in_executor(None, warmer.warm_up)
+    warmer.start()
+    recorder = recorder_from_env("buffer2")
+    try:
+        async with websockets.connect(WS_URL) as ws:
+            logger.info(f"Connected to {WS_URL}")
+            messages = decode_messages(ws, new_connection_call_id())
+            if recorder is None:
+                await run_pipeline(ws, messages)
+            else:
+                await run_pipeline(recorder.wrap(ws), recorder.tap(messages))
+    finally:
+        warmer.stop()
+        if recorder is not None:
+            recorder.close()
 
 # ── Entry Point ────────────────────────────────────────────────────────────────
 def main():
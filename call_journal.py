@@ -0,0 +1,245 @@
+"""
+Append-only per-call journal for crash recovery and fast replay.
+
+Every state change of a DispatcherAgent (turn appended, summary replaced, advice
+produced) is appended as a record to the call's journal by a background thread, so
+the hot path only pays for a queue put. Records are length-prefixed and
+checksummed:
+
+    [4-byte big-endian payload length][4-byte big-endian CRC32][JSON payload]
+
+Each call has its own directory of numbered segment files, rotated once a segment
+exceeds SEGMENT_MAX_BYTES, and dirty segments are fsync'd every FSYNC_INTERVAL_S.
+After a crash, recover_calls() reads the segments back (stopping cleanly at a torn
+final record) and returns the state needed to rebuild every call that had not
+ended.
+"""
+
+import json
+import logging
+import os
+import queue
+import shutil
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from metrics import metrics
+from turn_store import BoundedCache
+
+logger = logging.getLogger("call_journal")
+
+JOURNAL_DIR = os.getenv("CALL_JOURNAL_DIR", "call_journal")
+SEGMENT_MAX_BYTES = 1 << 20
+FSYNC_INTERVAL_S = 0.2
+DELETE_ENDED_CALLS = True   # ended calls are fully persisted elsewhere; drop their journal
+ENDED_CALLS_REMEMBERED = 10000  # ended call ids whose late writes are ignored
+
+_HEADER = struct.Struct(">II")
+
+
+def encode_record(record: Dict) -> bytes:
+    payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_records(data: bytes) -> Tuple[List[Dict], int]:
+    """Decode consecutive records; returns (records, bytes consumed before any torn/corrupt tail)."""
+    records, offset = [], 0
+    while offset + _HEADER.size <= len(data):
+        length, crc = _HEADER.unpack_from(data, offset)
+        start = offset + _HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        records.append(json.loads(payload))
+        offset = start + length
+    return records, offset
+
+
+@dataclass
+class CallState:
+    call_id: str
+    turns: List[Tuple[str, str]] = field(default_factory=list)
+    summary: str = ""
+    summary_fields: Optional[Dict] = None   # structured summary (call_summary.py), if journalled
+    advice_history: List = field(default_factory=list)
+    patient_age: Optional[int] = None
+    criticality_level: Optional[str] = None
+    ended: bool = False
+
+    def apply(self, record: Dict) -> None:
+        kind = record.get("t")
+        if kind == "turn":
+            self.turns.append((record["role"], record["text"]))
+        elif kind == "summary":
+            self.summary = record["value"]
+            self.summary_fields = record.get("fields")
+        elif kind == "advice":
+            self.advice_history.append(record.get("advice"))
+            if record.get("patient_age") is not None:
+                self.patient_age = record["patient_age"]
+            if record.get("criticality_level"):
+                self.criticality_level = record["criticality_level"]
+        elif kind == "end":
+            self.ended = True
+
+
+class _Segment:
+    def __init__(self, directory: str, number: int):
+        self.number = number
+        self.path = os.path.join(directory, f"{number:08d}.seg")
+        self.file = open(self.path, "ab")
+        self.size = self.file.tell()
+        self.dirty = False
+
+
+class CallJournal:
+    def __init__(self, directory: str = JOURNAL_DIR, segment_max_bytes: int = SEGMENT_MAX_BYTES,
+                 fsync_interval_s: float = FSYNC_INTERVAL_S):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_interval_s = fsync_interval_s
+        self._queue: "queue.Queue[Tuple[str, Optional[bytes], bool]]" = queue.Queue()
+        self._segments: Dict[str, _Segment] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._idle = threading.Condition()
+        self._unwritten = 0
+        # Late writes for an ended call would recreate its journal, to be recovered as live
+        self._ended = BoundedCache(ENDED_CALLS_REMEMBERED)
+        self._ended_lock = threading.Lock()
+
+    # ── Producer side (hot path) ─────────────────────────────────────────────
+    def append(self, call_id: str, record: Dict) -> None:
+        record.setdefault("ts", time.time())
+        data = encode_record(record)
+        # Checked and queued under one lock, so nothing lands behind the end record
+        with self._ended_lock:
+            if call_id in self._ended:
+                metrics.incr("journal.after_end")
+                return
+            self._enqueue(call_id, data, False)
+
+    def end_call(self, call_id: str) -> None:
+        """Mark the call finished and release (or delete) its journal; later appends are ignored."""
+        with self._ended_lock:
+            if call_id in self._ended:
+                return
+            self._ended[call_id] = True
+            self._enqueue(call_id, encode_record({"t": "end", "ts": time.time()}), True)
+
+    def _enqueue(self, call_id: str, data: bytes, close: bool) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="call-journal", daemon=True)
+                self._thread.start()
+        with self._idle:
+            self._unwritten += 1
+        self._queue.put((call_id, data, close))
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until everything queued so far is written and fsync'd."""
+        deadline = time.time() + timeout
+        with self._idle:
+            while self._unwritten:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    # ── Writer thread ────────────────────────────────────────────────────────
+    def _segment_for(self, call_id: str) -> _Segment:
+        segment = self._segments.get(call_id)
+        if segment is None:
+            call_dir = os.path.join(self.directory, call_id)
+            os.makedirs(call_dir, exist_ok=True)
+            existing = sorted(f for f in os.listdir(call_dir) if f.endswith(".seg"))
+            number = int(existing[-1].split(".")[0]) if existing else 0
+            segment = self._segments[call_id] = _Segment(call_dir, number)
+        elif segment.size >= self.segment_max_bytes:
+            self._sync(segment)
+            segment.file.close()
+            segment = self._segments[call_id] = _Segment(os.path.dirname(segment.path), segment.number + 1)
+            metrics.incr("journal.rotations")
+        return segment
+
+    def _sync(self, segment: _Segment) -> None:
+        if segment.dirty:
+            segment.file.flush()
+            os.fsync(segment.file.fileno())
+            segment.dirty = False
+
+    def _run(self) -> None:
+        next_sync = time.time() + self.fsync_interval_s
+        written = 0
+        while True:
+            try:
+                call_id, data, close = self._queue.get(timeout=max(0.0, next_sync - time.time()))
+            except queue.Empty:
+                call_id = None
+            if call_id is not None:
+                written += 1
+                try:
+                    segment = self._segment_for(call_id)
+                    segment.file.write(data)
+                    segment.size += len(data)
+                    segment.dirty = True
+                    metrics.incr("journal.records")
+                    if close:
+                        self._sync(segment)
+                        segment.file.close()
+                        del self._segments[call_id]
+                        if DELETE_ENDED_CALLS:
+                            shutil.rmtree(os.path.join(self.directory, call_id), ignore_errors=True)
+                except OSError as e:
+                    logger.error(f"Journal write for {call_id} failed: {e}")
+                    metrics.incr("journal.errors")
+
+            if time.time() >= next_sync:
+                sync_start = time.time()
+                for segment in self._segments.values():
+                    self._sync(segment)
+                metrics.observe("journal.fsync_ms", (time.time() - sync_start) * 1000)
+                next_sync = time.time() + self.fsync_interval_s
+                with self._idle:
+                    self._unwritten -= written
+                    written = 0
+                    self._idle.notify_all()
+
+
+def recover_call(call_id: str, directory: str = JOURNAL_DIR) -> Optional[CallState]:
+    """State of one call from its journal, or None if it has none or it ended."""
+    call_dir = os.path.join(directory, call_id)
+    if not os.path.isdir(call_dir):
+        return None
+    state = CallState(call_id)
+    for name in sorted(f for f in os.listdir(call_dir) if f.endswith(".seg")):
+        with open(os.path.join(call_dir, name), "rb") as f:
+            data = f.read()
+        records, consumed = decode_records(data)
+        for record in records:
+            state.apply(record)
+        if consumed < len(data):
+            # Cut the torn record off so appends after restart stay readable
+            logger.warning(f"Journal {call_id}/{name}: truncating {len(data) - consumed} torn trailing bytes")
+            with open(os.path.join(call_dir, name), "r+b") as f:
+                f.truncate(consumed)
+    return None if state.ended else state
+
+
+def recover_calls(directory: str = JOURNAL_DIR) -> Dict[str, CallState]:
+    """Rebuild the state of every call whose journal has no end record."""
+    states: Dict[str, CallState] = {}
+    if not os.path.isdir(directory):
+        return states
+    for call_id in sorted(os.listdir(directory)):
+        state = recover_call(call_id, directory)
+        if state is not None:
+            states[call_id] = state
+    return states
@@ -0,0 +1,174 @@
+"""
+Structured call summary, updated by field-level operations.
+
+The model used to re-emit the whole summary bullet list every turn: output
+tokens (the slowest part of generation) grew with the call, and facts drifted as
+bullets were reworded. The agent now keeps the summary as fields and the model
+returns only `summary_ops`, applied here:
+
+    {"op": "set",    "field": "location", "value": "123 Oak St, blue house"}
+    {"op": "add",    "field": "symptoms", "value": "chest pain since 2pm"}
+    {"op": "update", "field": "actions",  "index": 1, "value": "CPR in progress"}
+    {"op": "remove", "field": "hazards",  "index": 2}
+
+Scalar fields (location, patient) take set/remove; list fields take
+add/update/remove, with items addressed by their 1-based number in the prompt
+rendering (or by their text). apply() returns the changes actually made, which
+buffer2 forwards to the dashboard.
+"""
+
+import logging
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger("call_summary")
+
+SCALAR_FIELDS = ("location", "patient")                         # patient: age/sex, e.g. "45 M"
+LIST_FIELDS = ("symptoms", "hazards", "actions", "notes")       # actions: taken by caller/dispatcher
+LABELS = {
+    "location": "Location",
+    "patient": "Patient",
+    "symptoms": "Symptoms",
+    "hazards": "Hazards",
+    "actions": "Actions taken",
+    "notes": "Notes",
+}
+MAX_VALUE_CHARS = 80        # longer values are cut (bullets are meant to be 5-8 words)
+MAX_LIST_ITEMS = 12         # per list field; the oldest item goes first
+
+
+@dataclass
+class CallSummary:
+    location: str = ""
+    patient: str = ""
+    symptoms: List[str] = field(default_factory=list)
+    hazards: List[str] = field(default_factory=list)
+    actions: List[str] = field(default_factory=list)
+    notes: List[str] = field(default_factory=list)
+    version: int = field(default=0, compare=False)  # bumped by every apply() that changes something
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CallSummary":
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: (list(v) if isinstance(v, list) else v) for k, v in data.items() if k in known})
+
+    @classmethod
+    def from_bullets(cls, text: str) -> "CallSummary":
+        """A summary from bullet text written before it was structured (kept as notes)."""
+        return cls(notes=[line.lstrip("• ").strip() for line in text.splitlines() if line.strip()])
+
+    def to_dict(self) -> Dict:
+        return {name: (list(getattr(self, name)) if name in LIST_FIELDS else getattr(self, name))
+                for name in SCALAR_FIELDS + LIST_FIELDS}
+
+    def is_empty(self) -> bool:
+        return not any(getattr(self, name) for name in SCALAR_FIELDS + LIST_FIELDS)
+
+    def bullets(self) -> List[str]:
+        """Display bullets, one per non-empty field (notes one each)."""
+        bullets = [f"{LABELS[name]}: {getattr(self, name)}" for name in SCALAR_FIELDS if getattr(self, name)]
+        bullets += [f"{LABELS[name]}: {'; '.join(getattr(self, name))}" for name in LIST_FIELDS[:-1]
+                    if getattr(self, name)]
+        return bullets + self.notes
+
+    def text(self) -> str:
+        """Bullet text, as stored in the memory backend."""
+        return "\n".join(f"• {bullet}" for bullet in self.bullets())
+
+    def render(self) -> str:
+        """Prompt form: every field, list items numbered for update/remove ops."""
+        lines = [f"{name}: {getattr(self, name) or '(unknown)'}" for name in SCALAR_FIELDS]
+        for name in LIST_FIELDS:
+            items = getattr(self, name)
+            lines.append(f"{name}: " + ("; ".join(f"[{i + 1}] {item}" for i, item in enumerate(items))
+                                        if items else "(none)"))
+        return "\n".join(lines)
+
+    def _find(self, items: List[str], op: Dict) -> Optional[int]:
+        index = op.get("index")
+        if isinstance(index, str) and index.strip().isdigit():
+            index = int(index)
+        if isinstance(index, int) and 1 <= index <= len(items):
+            return index - 1
+        target = str(op.get("old") or (op.get("value") if op.get("op") == "remove" else "") or "").strip().lower()
+        if target:
+            for i, item in enumerate(items):
+                if item.lower() == target:
+                    return i
+            for i, item in enumerate(items):
+                if target in item.lower() or item.lower() in target:
+                    return i
+        return None
+
+    def apply(self, ops: List[Any]) -> List[Dict]:
+        """
+        Apply the model's summary_ops; returns the changes made as {"op", "field", "value", "previous"}.
+        Items are addressed as numbered in the prompt, so every op is resolved against
+        the summary as it was before this turn; removals run last, highest index first.
+        """
+        resolved = [(op, self._resolve(op)) for op in ops]
+        changes, removals = [], []
+        for op, index in resolved:
+            if isinstance(op, dict) and op.get("op") == "remove" and op.get("field") in LIST_FIELDS:
+                change = None
+                if index is not None and (op["field"], index) not in removals:
+                    removals.append((op["field"], index))
+                    continue
+            else:
+                change = self._apply_one(op, index) if isinstance(op, dict) else None
+            if change is None:
+                metrics.incr("call_summary.ops_ignored")
+                logger.debug(f"Ignored summary op {op!r}")
+            else:
+                changes.append(change)
+        for name, index in sorted(removals, key=lambda removal: removal[1], reverse=True):
+            previous = getattr(self, name).pop(index)
+            changes.append({"op": "remove", "field": name, "value": None, "previous": previous})
+        for name in LIST_FIELDS:
+            del getattr(self, name)[:-MAX_LIST_ITEMS]
+        if changes:
+            self.version += 1
+        metrics.incr("call_summary.ops_applied", len(changes))
+        return changes
+
+    def _resolve(self, op: Any) -> Optional[int]:
+        if not isinstance(op, dict) or op.get("field") not in LIST_FIELDS or op.get("op") not in ("update", "set", "remove"):
+            return None
+        return self._find(getattr(self, op["field"]), op)
+
+    def _apply_one(self, op: Dict, index: Optional[int]) -> Optional[Dict]:
+        kind, name = op.get("op"), op.get("field")
+        value = str(op.get("value") or "").strip()[:MAX_VALUE_CHARS]
+        if name in SCALAR_FIELDS:
+            previous = getattr(self, name)
+            if kind in ("set", "add", "update") and value and value != previous:
+                setattr(self, name, value)
+                return {"op": "set", "field": name, "value": value, "previous": previous or None}
+            if kind == "remove" and previous:
+                setattr(self, name, "")
+                return {"op": "remove", "field": name, "value": None, "previous": previous}
+            return None
+        if name not in LIST_FIELDS:
+            return None
+        items = getattr(self, name)
+        if kind == "add" and value:
+            if any(item.lower() == value.lower() for item in items):
+                return None
+            items.append(value)
+            return {"op": "add", "field": name, "value": value, "previous": None}
+        if index is None:
+            return None
+        previous = items[index]
+        if kind in ("update", "set") and value and value != previous:
+            items[index] = value
+            return {"op": "update", "field": name, "value": value, "previous": previous}
+        return None
+
+    def absorb_bullets(self, bullets: List[Any]) -> List[Dict]:
+        """A full bullet list (the model ignored the ops format): bullets not already present become notes."""
+        known = {bullet.lower() for bullet in self.bullets()}
+        metrics.incr("call_summary.full_rewrites")
+        return self.apply([{"op": "add", "field": "notes", "value": bullet} for bullet in bullets
+                           if str(bullet).strip().lower() not in known])
@@ -0,0 +1,138 @@
+"""
+Lazy, process-wide API clients.
+
+Importing agent.py used to build OpenAI, Pinecone (including `pc.Index`, which
+resolves the index host over the network), Groq and Letta clients, and rag.py
+listed (and possibly created) the Pinecone index at import. Every entry point,
+simulator and script therefore started slowly and failed without network.
+
+Each client here is built on first use, once per process, behind a lock; the
+SDK module is imported at the same time, so its import cost is paid only by code
+that actually talks to the service. override() swaps in a replacement (a fake
+for offline replay, or a differently configured client).
+
+All four share the pooling configuration in http_pool.py: the httpx-based
+clients get a pooled, traced httpx.Client and Pinecone's urllib3 pool is sized
+from the same config. connection_warmer() pre-opens and keeps them alive.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from dotenv import load_dotenv
+
+import http_pool
+from metrics import metrics
+
+load_dotenv()
+
+PINECONE_INDEX_NAME = "subitis-guides"
+LETTA_BASE_URL = os.getenv("LETTA_BASE_URL", "https://api.letta.com")   # http://localhost:8283 if self-hosted
+
+_instances: Dict[str, Any] = {}
+_lock = threading.RLock()
+
+
+def _lazy(name: str, factory: Callable[[], Any]) -> Any:
+    client = _instances.get(name)
+    if client is not None:
+        return client
+    with _lock:
+        if name not in _instances:
+            start = time.time()
+            _instances[name] = factory()
+            metrics.observe(f"clients.{name}.init_ms", (time.time() - start) * 1000)
+        return _instances[name]
+
+
+def override(name: str, client: Any) -> None:
+    """Use `client` for `name` ("openai", "groq", "pinecone", "pinecone_index", "letta") from now on."""
+    with _lock:
+        _instances[name] = client
+
+
+def is_initialized(name: str) -> bool:
+    return name in _instances
+
+
+def openai_client():
+    def build():
+        from openai import OpenAI
+        return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_pool.make_http_client("openai"))
+    return _lazy("openai", build)
+
+
+def groq_client():
+    def build():
+        from groq import Groq
+        return Groq(api_key=os.getenv("GROQ_API_KEY"), http_client=http_pool.make_http_client("groq"))
+    return _lazy("groq", build)
+
+
+def pinecone_client():
+    def build():
+        from pinecone import Pinecone
+        return Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return _lazy("pinecone", build)
+
+
+def pinecone_index():
+    """Handle to the guidelines index (resolving its host is a network call)."""
+    def build():
+        config = http_pool.pool_config()
+        return pinecone_client().Index(PINECONE_INDEX_NAME, pool_threads=config.max_keepalive_connections,
+                                       connection_pool_maxsize=config.max_connections)
+    return _lazy("pinecone_index", build)
+
+
+def letta_client():
+    def build():
+        from letta_client import Letta
+        return Letta(
+            token=os.getenv("LETTA_API_KEY"),
+            base_url=LETTA_BASE_URL,
+            httpx_client=http_pool.make_http_client("letta", follow_redirects=True),
+        )
+    return _lazy("letta", build)
+
+
+def connection_warmer() -> http_pool.ConnectionWarmer:
+    """Warm-up / keep-alive pings for every service, each over that service's own pooled client."""
+    def ping_openai():
+        client = openai_client()
+        http_pool.ping_url(client._client, str(client.base_url))
+
+    def ping_groq():
+        client = groq_client()
+        http_pool.ping_url(client._client, str(client.base_url))
+
+    def ping_letta():
+        http_pool.ping_url(letta_client()._client_wrapper.httpx_client.httpx_client, LETTA_BASE_URL)
+
+    def ping_pinecone():
+        # Also resolves the index host, which pinecone_index() would otherwise do on the first turn
+        pinecone_index().describe_index_stats()
+
+    return http_pool.ConnectionWarmer({
+        "openai": ping_openai,
+        "groq": ping_groq,
+        "letta": ping_letta,
+        "pinecone": ping_pinecone,
+    })
+
+
+def pinecone_pool_stats() -> Dict[str, int]:
+    """Requests and new connections of Pinecone's urllib3 pools (it doesn't go through httpx)."""
+    if not is_initialized("pinecone_index"):
+        return {"requests": 0, "new_connections": 0}
+    try:
+        pools = _instances["pinecone_index"]._api_client.rest_client.pool_manager.pools
+        stats = [pools.get(key) for key in pools.keys()]
+    except AttributeError:  # overridden or a different SDK version
+        return {}
+    return {
+        "requests": sum(p.num_requests for p in stats if p is not None),
+        "new_connections": sum(p.num_connections for p in stats if p is not None),
+    }
@@ -12,7 +12,13 @@ import json
 from datetime import datetime
 from typing import List, Dict, Tuple
 import threading
+import statistics
+from collections import Counter
+from dataclasses import asdict
+import clients
 from agent import DispatcherAgent
+from deadline import TURN_BUDGET_MS
+from token_accounting import predict_breach, token_ledger
 
 class ConversationSimulator:
     def __init__(self, interval_seconds: float = 3.0):
@@ -62,6 +68,13 @@ class ConversationSimulator:
             
             webhook_call_end = time.time()
             webhook_duration = (webhook_call_end - webhook_call_start) * 1000
+            self.performance_history.append({
+                "call_number": i,
+                "webhook_duration": webhook_duration,
+                "context_length": len(conversation_context),
+                "timings": result.get("timings", []),
+                "tokens": result.get("tokens"),
+            })
             
             # Add to conversation history
             self.full_conversation_history.append(
@@ -111,9 +124,11 @@ class ConversationSimulator:
                 time.sleep(self.interval)
         
         total_duration = (time.time() - total_start_time) * 1000
+        call_tokens = token_ledger.call_totals(self.agent.call_id)
+        self.agent.end_call()  # flush pending memory writes and retire the journal
         
         # Generate final analysis
-        analysis = self._generate_performance_analysis(total_duration)
+        analysis = self._generate_performance_analysis(total_duration, call_tokens)
         
         print(f"\n{'='*80}")
         print(f"🏁 CONVERSATION SIMULATION COMPLETE")
@@ -161,7 +176,25 @@ class ConversationSimulator:
         if agent_total > 0:
             print(f"   📈 Breakdown: RAG {rag_time/agent_total*100:.1f}% | Letta {letta_time/agent_total*100:.1f}% | Groq {groq_time/agent_total*100:.1f}%")
 
-    def _generate_performance_analysis(self, total_simulation_time: float) -> Dict:
+    def _project_latency(self) -> Dict:
+        """Fit latency vs tokens for the call's main model and predict the turn where it breaches the target"""
+        turns = [p for p in self.performance_history if p["tokens"] and p["tokens"]["model"]]
+        if len(turns) < 2:
+            return {}
+        model = Counter(p["tokens"]["model"] for p in turns).most_common(1)[0][0]
+        turns = [p for p in turns if p["tokens"]["model"] == model]
+        fit = token_ledger.latency_model(model)
+        if fit is None or len(turns) < 2:
+            return {"model": model, "latency_model": None}
+        # Everything in a turn but the LLM call (retrieval, memory, prompt building)
+        overhead_ms = statistics.median(p["webhook_duration"] - p["tokens"]["latency_ms"] for p in turns)
+        completion_tokens = statistics.mean(p["tokens"]["completion_tokens"] for p in turns)
+        projection = predict_breach([p["tokens"]["prompt_tokens"] for p in turns], fit, TURN_BUDGET_MS,
+                                    overhead_ms=overhead_ms, completion_tokens=completion_tokens)
+        return dict(projection, model=model, latency_model=asdict(fit), target_ms=TURN_BUDGET_MS,
+                    overhead_ms=overhead_ms)
+
+    def _generate_performance_analysis(self, total_simulation_time: float, call_tokens: Dict = None) -> Dict:
         """Generate comprehensive performance analysis"""
         if not self.performance_history:
             return {}
@@ -210,7 +243,14 @@ class ConversationSimulator:
             "conversation_stats": {
                 "total_exchanges": len(self.full_conversation_history),
                 "context_growth_per_exchange": (context_lengths[-1] - context_lengths[0]) / num_calls if num_calls > 0 else 0
-            }
+            },
+            "tokens": {
+                "call": call_tokens,
+                "prompt_per_turn": [p["tokens"]["prompt_tokens"] if p["tokens"] else None for p in self.performance_history],
+                "completion_per_turn": [p["tokens"]["completion_tokens"] if p["tokens"] else None
+                                        for p in self.performance_history],
+            },
+            "latency_projection": self._project_latency(),
         }
         
         # Display analysis
@@ -246,6 +286,28 @@ class ConversationSimulator:
         
         conv_stats = analysis['conversation_stats']
         print(f"   Total Exchanges: {conv_stats['total_exchanges']}")
+
+        call_tokens = analysis["tokens"]["call"]
+        if call_tokens:
+            print(f"\n🔢 TOKENS:")
+            print(f"   Requests: {call_tokens['requests']} | Prompt: {call_tokens['prompt_tokens']} | "
+                  f"Completion: {call_tokens['completion_tokens']} | Cost: ${call_tokens['cost_usd']:.5f}")
+            print(f"   Prompt by section: {call_tokens['sections']}")
+            print(f"   Prompt per turn: {analysis['tokens']['prompt_per_turn']}")
+
+        projection = analysis["latency_projection"]
+        if projection.get("latency_model"):
+            fit = projection["latency_model"]
+            print(f"\n🔮 LATENCY MODEL ({projection['model']}, {fit['samples']} samples, R² {fit['r2']:.2f}):")
+            print(f"   {fit['intercept_ms']:.0f}ms + {fit['ms_per_prompt_token']:.3f}ms/prompt token "
+                  f"+ {fit['ms_per_completion_token']:.3f}ms/completion token")
+            print(f"   Prompt growth: {projection['prompt_growth_per_turn']:.0f} tokens/turn, "
+                  f"non-LLM overhead {projection['overhead_ms']:.0f}ms")
+            if projection["breach_turn"] is not None:
+                print(f"   ⚠️  Predicted to exceed {projection['target_ms']:.0f}ms at turn {projection['breach_turn']} "
+                      f"(~{projection['breach_prompt_tokens']} prompt tokens, {projection['breach_predicted_ms']:.0f}ms)")
+            else:
+                print(f"   No breach of {projection['target_ms']:.0f}ms predicted within the projection window")
         print(f"   Avg Growth/Exchange: {conv_stats['context_growth_per_exchange']:.1f} chars")
 
 
@@ -315,6 +377,9 @@ def main():
     print(f"   • Dispatcher responses are simulated human responses")
     print(f"   • Agent tracks full conversation context for better advice")
     
+    # Open API connections up front so the first turn isn't charged for handshakes
+    clients.connection_warmer().warm_up()
+
     # Run simulation
     results = simulator.simulate_conversation(conversation)
     
@@ -0,0 +1,89 @@
+"""
+Per-turn latency budget, measured from speech capture.
+
+The target is TURN_BUDGET_MS from the moment the newest fragment of a batch was
+captured to the moment its advice is displayed. buffer2.py starts a TurnBudget
+from the fragment timestamps and passes it to DispatcherAgent.process_chunk_fast;
+each stage compares the time left against what the remaining stages usually
+cost (recent p50s from the metrics registry) and degrades when it can't afford
+the full version: reused or lexical-only guidelines, a trimmed history, the fast
+model. Every decision is recorded on the budget so it shows
+up in the turn's timings.
+
+TURN_HARD_LIMIT_MS bounds how long a turn may run at all; past it the advice is
+stale and buffer2 drops the turn.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from metrics import metrics
+
+TURN_BUDGET_MS = 1200.0         # capture-to-display target
+TURN_HARD_LIMIT_MS = 10000.0    # past this the turn is abandoned
+MIN_TURN_TIMEOUT_S = 3.0        # a turn that starts late (queued under load) still gets this long
+MAX_CLOCK_SKEW_S = 30.0         # fragment timestamps further off than this are ignored
+
+
+def _epoch_seconds(timestamp) -> Optional[float]:
+    """Fragment timestamps are epoch milliseconds (digits, possibly as a string); seconds are accepted too."""
+    try:
+        value = float(timestamp)
+    except (TypeError, ValueError):
+        return None
+    if value <= 0:
+        return None
+    return value / 1000 if value > 1e11 else value
+
+
+@dataclass
+class TurnBudget:
+    started_at: float                   # epoch seconds of capture
+    budget_ms: float = TURN_BUDGET_MS
+    hard_limit_ms: float = TURN_HARD_LIMIT_MS
+    degraded: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_fragments(cls, fragments: Iterable[Dict], budget_ms: float = TURN_BUDGET_MS) -> "TurnBudget":
+        """Budget starting at the newest fragment's capture time (now, if none carries a usable timestamp)."""
+        now = time.time()
+        stamps = [_epoch_seconds(f.get('metadata', {}).get('timestamp')) for f in fragments]
+        stamps = [s for s in stamps if s is not None and abs(now - s) <= MAX_CLOCK_SKEW_S]
+        return cls(started_at=min(max(stamps), now) if stamps else now, budget_ms=budget_ms)
+
+    def elapsed_ms(self) -> float:
+        return (time.time() - self.started_at) * 1000
+
+    def remaining_ms(self) -> float:
+        return self.budget_ms - self.elapsed_ms()
+
+    def hard_remaining_s(self) -> float:
+        return max(0.0, (self.hard_limit_ms - self.elapsed_ms()) / 1000)
+
+    def timeout_s(self) -> float:
+        """How long the caller should wait for the turn."""
+        return max(MIN_TURN_TIMEOUT_S, self.hard_remaining_s())
+
+    def affords(self, stage_ms: float, reserve_ms: float = 0.0) -> bool:
+        """Whether a stage expected to take stage_ms still leaves reserve_ms for the stages after it."""
+        return self.remaining_ms() - stage_ms >= reserve_ms
+
+    def degrade(self, decision: str) -> None:
+        self.degraded.append(decision)
+        metrics.incr(f"budget.degraded.{decision}")
+
+    def finish(self) -> float:
+        """Record the capture-to-output latency of the turn; returns it in ms."""
+        elapsed = self.elapsed_ms()
+        metrics.observe("turn.capture_to_output_ms", elapsed)
+        if elapsed > self.budget_ms:
+            metrics.incr("turn.over_budget")
+        return elapsed
+
+
+def stage_estimate_ms(*names: str, default: float = 0.0) -> float:
+    """Typical (p50) duration of a stage made of the given histograms; `default` until there are samples."""
+    if not any(metrics.sample_count(name) for name in names):
+        return default
+    return sum(metrics.quantile(name, 50) for name in names)
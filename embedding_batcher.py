@@ -0,0 +1,144 @@
+"""
+Cross-call embedding micro-batcher.
+
+Every DispatcherAgent turn needs one query embedding. Sending each as its own
+``embeddings.create(input=[text])`` costs one HTTPS round-trip and one rate-limit
+slot per query, so with many concurrent calls the EmbeddingBatcher collects
+requests from all agents for a short window (or until a size cap), issues a
+single batched request and resolves each caller's future. Each batch queues for
+rate-governor quota at the priority of its most critical caller.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+from fact_extractor import CRITICALITY_ORDER
+from metrics import metrics
+from rate_governor import RateGovernor, estimate_tokens, rate_governor
+
+logger = logging.getLogger("embedding_batcher")
+
+EMBED_MODEL = "text-embedding-ada-002"
+BATCH_WINDOW_MS = 5.0      # how long the first request in a batch waits for company
+MAX_BATCH_SIZE = 64        # flush immediately once this many texts are queued
+MAX_INFLIGHT_BATCHES = 4   # batched requests allowed on the wire at once
+
+
+def _resolve(future: Future, result=None, exception: Optional[BaseException] = None) -> None:
+    # Callers may have cancelled (or timed out and cancelled) their future meanwhile
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        model: str = EMBED_MODEL,
+        window_ms: float = BATCH_WINDOW_MS,
+        max_batch: int = MAX_BATCH_SIZE,
+        max_inflight: int = MAX_INFLIGHT_BATCHES,
+        governor: RateGovernor = rate_governor,
+    ):
+        self.client_factory = client_factory   # OpenAI client, built on first batch
+        self.model = model
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self.governor = governor
+        self._cond = threading.Condition()
+        self._pending: List[Tuple[str, Future, float, Optional[str]]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._sender = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="embed-batch")
+
+    def configure(self, window_ms: Optional[float] = None, max_batch: Optional[int] = None) -> None:
+        """Retune the batching window / size cap at runtime."""
+        with self._cond:
+            if window_ms is not None:
+                self.window_ms = window_ms
+            if max_batch is not None:
+                self.max_batch = max_batch
+            self._cond.notify()
+
+    def submit(self, text: str, priority: Optional[str] = None) -> Future:
+        """Queue a text for embedding; the future resolves to its vector."""
+        future: Future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._thread.start()
+            self._pending.append((text, future, time.time(), priority))
+            self._cond.notify()
+        return future
+
+    def embed(self, text: str, timeout: Optional[float] = None, priority: Optional[str] = None) -> List[float]:
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(text, priority).result(timeout=timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # The oldest request sets the deadline for the whole batch
+                deadline = self._pending[0][2] + self.window_ms / 1000
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[: self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+                metrics.gauge("embedding.queue_depth", len(self._pending))
+            self._sender.submit(self._send, batch)
+
+    def _send(self, batch: List[Tuple[str, Future, float, Optional[str]]]) -> None:
+        # Identical texts (e.g. the same query from a speculative and a real turn)
+        # are only embedded once
+        unique_texts = list(dict.fromkeys(text for text, _, _, _ in batch))
+        priorities = [p for _, _, _, p in batch if p in CRITICALITY_ORDER]
+        priority = max(priorities, key=CRITICALITY_ORDER.index) if priorities else None
+        reservation = None
+        request_start = time.time()
+        try:
+            reservation = self.governor.acquire(self.model, sum(estimate_tokens(t) for t in unique_texts), priority)
+            request_start = time.time()
+            resp = self.client_factory().embeddings.create(model=self.model, input=unique_texts)
+            vectors = {text: d.embedding for text, d in zip(unique_texts, resp.data)}
+            usage = getattr(resp, "usage", None)
+            if usage is not None:
+                self.governor.settle(reservation, usage.prompt_tokens)
+        except Exception as e:
+            logger.warning(f"Batched embedding request failed ({len(batch)} texts): {e}")
+            if reservation is not None:
+                self.governor.report_error(self.model, e)
+            for _, future, _, _ in batch:
+                _resolve(future, exception=e)
+            metrics.incr("embedding.failed_batches")
+            return
+        request_ms = (time.time() - request_start) * 1000
+
+        for text, future, queued_at, _ in batch:
+            metrics.observe("embedding.queue_wait_ms", (request_start - queued_at) * 1000)
+            _resolve(future, result=vectors[text])
+        metrics.incr("embedding.requests")
+        metrics.incr("embedding.texts", len(batch))
+        metrics.observe("embedding.batch_size", len(batch))
+        metrics.observe("embedding.request_ms", request_ms)
+
+    def stats(self) -> dict:
+        requests = metrics.counter("embedding.requests")
+        return {
+            "window_ms": self.window_ms,
+            "max_batch": self.max_batch,
+            "texts_per_request": metrics.counter("embedding.texts") / requests if requests else 0.0,
+            "batch_size_p90": metrics.quantile("embedding.batch_size", 90),
+            "queue_wait_ms_p90": metrics.quantile("embedding.queue_wait_ms", 90),
+        }
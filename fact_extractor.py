@@ -0,0 +1,151 @@
+"""
+Instant rule-based fact extraction.
+
+Age, address, caller name and red-flag phrases used to appear on the dashboard
+only after the full Groq round-trip. extract_facts() pulls them out of a freshly
+consolidated chunk with precompiled regexes in well under a millisecond, so
+buffer2.py can push a provisional update immediately; the LLM result reconciles
+it when it lands.
+
+Red flags only count when asserted: a flag in a question ("Is she
+unresponsive?") or after a negation in the same clause ("he is not
+unconscious") is ignored. Callers pass caller lines only; the dispatcher's
+questions are full of red-flag words.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+CRITICALITY_ORDER = ["low", "medium", "high", "critical"]
+
+# phrase → criticality it implies on its own
+RED_FLAGS: Dict[str, str] = {
+    "not breathing": "critical",
+    "stopped breathing": "critical",
+    "can't breathe": "critical",
+    "cannot breathe": "critical",
+    "no pulse": "critical",
+    "cardiac arrest": "critical",
+    "choking": "critical",
+    "unresponsive": "critical",
+    "not responding": "critical",
+    "bleeding heavily": "critical",
+    "been shot": "critical",
+    "stabbed": "critical",
+    "gun": "critical",
+    "overdose": "high",
+    "overdosed": "high",
+    "took too many pills": "high",
+    "chest pain": "high",
+    "unconscious": "high",
+    "collapsed": "high",
+    "seizure": "high",
+    "stroke": "high",
+    "suicide": "high",
+    "kill myself": "high",
+    "end my life": "high",
+    "bleeding": "medium",
+}
+
+_RED_FLAG_RE = re.compile(
+    r"\b(" + "|".join(re.escape(p) for p in sorted(RED_FLAGS, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+_AGE_RES = [
+    re.compile(r"\b(\d{1,3})[\s-]*(?:years?|yrs?)[\s-]*old\b", re.IGNORECASE),
+    re.compile(r"\bage(?:d)?\s*(?:is\s*)?(\d{1,3})\b", re.IGNORECASE),
+    re.compile(r"\b(?:he|she|they)(?:'s|\s+is|\s+are)\s+(\d{1,3})\b(?!\s*(?:minutes?|hours?|feet|blocks?|miles?))", re.IGNORECASE),
+]
+_STREET_SUFFIX = r"(?:Street|St|Avenue|Ave|Road|Rd|Boulevard|Blvd|Drive|Dr|Lane|Ln|Way|Court|Ct|Place|Pl|Terrace|Parkway|Pkwy)"
+_ADDRESS_RE = re.compile(r"\b(\d{1,6}\s+(?:[A-Z][a-z]+\s+){1,3}" + _STREET_SUFFIX + r")\b")
+_NAME_RE = re.compile(r"\b(?i:my name is|this is|i'm|i am)\s+([A-Z][a-z]+)\b")
+_NOT_NAMES = {"Not", "So", "Sorry", "Just", "Really", "Very", "Here", "At", "In", "The", "Okay", "Ok", "Yes", "No"}
+# Clauses end at punctuation or "but"; a flag in a clause ending in "?" or opening
+# like a question, or after a negation within NEGATION_WINDOW words, isn't asserted
+_CLAUSE_RE = re.compile(r"[^.?!;,]+[.?!;,]*")
+_BUT_RE = re.compile(r"\bbut\b", re.IGNORECASE)
+_QUESTION_START_RE = re.compile(
+    r"^\s*(?:is|are|was|were|does|did|do|has|have|had|can|could|will|would|any|anyone)\b", re.IGNORECASE)
+_NEGATION_RE = re.compile(r"\b(?:no|not|never|without|denies|nobody|none)\b|n't\b", re.IGNORECASE)
+NEGATION_WINDOW = 4
+
+
+def max_criticality(*levels: Optional[str]) -> Optional[str]:
+    known = [level for level in levels if level in CRITICALITY_ORDER]
+    return max(known, key=CRITICALITY_ORDER.index) if known else None
+
+
+@dataclass
+class ExtractedFacts:
+    patient_age: Optional[int] = None
+    address: Optional[str] = None
+    caller_name: Optional[str] = None
+    red_flags: List[str] = field(default_factory=list)
+    criticality_level: Optional[str] = None
+
+    def is_empty(self) -> bool:
+        return not (self.patient_age or self.address or self.caller_name or self.red_flags)
+
+    def bullets(self) -> List[str]:
+        bullets = []
+        if self.red_flags:
+            bullets.append(f"RED FLAG: {', '.join(self.red_flags)}")
+        if self.patient_age is not None:
+            bullets.append(f"Patient age: {self.patient_age}")
+        if self.address:
+            bullets.append(f"Location: {self.address}")
+        if self.caller_name:
+            bullets.append(f"Caller: {self.caller_name}")
+        return bullets
+
+    def merge(self, other: "ExtractedFacts") -> "ExtractedFacts":
+        """Facts not already known (self) that `other` adds; also folds them into self."""
+        new = ExtractedFacts()
+        if other.patient_age is not None and other.patient_age != self.patient_age:
+            self.patient_age = new.patient_age = other.patient_age
+        if other.address and other.address != self.address:
+            self.address = new.address = other.address
+        if other.caller_name and not self.caller_name:
+            self.caller_name = new.caller_name = other.caller_name
+        new.red_flags = [flag for flag in other.red_flags if flag not in self.red_flags]
+        self.red_flags.extend(new.red_flags)
+        new.criticality_level = max_criticality(*(RED_FLAGS[f] for f in new.red_flags))
+        self.criticality_level = max_criticality(self.criticality_level, new.criticality_level)
+        return new
+
+
+def asserted_red_flags(text: str) -> List[str]:
+    """Red-flag phrases in `text`, leaving out those asked about or negated."""
+    flags = []
+    for sentence in _CLAUSE_RE.findall(text):
+        if sentence.rstrip().endswith("?") or _QUESTION_START_RE.match(sentence):
+            continue
+        for clause in _BUT_RE.split(sentence):
+            for match in _RED_FLAG_RE.finditer(clause):
+                before = clause[:match.start()].split()[-NEGATION_WINDOW:]
+                if not _NEGATION_RE.search(" ".join(before)):
+                    flags.append(match.group(1).lower())
+    return flags
+
+
+def extract_facts(text: str, include_name: bool = True) -> ExtractedFacts:
+    facts = ExtractedFacts()
+    for age_re in _AGE_RES:
+        match = age_re.search(text)
+        if match and 0 < int(match.group(1)) < 120:
+            facts.patient_age = int(match.group(1))
+            break
+    address = _ADDRESS_RE.search(text)
+    if address:
+        facts.address = address.group(1)
+    if include_name:
+        for match in _NAME_RE.finditer(text):
+            if match.group(1) not in _NOT_NAMES:
+                facts.caller_name = match.group(1)
+                break
+    for flag in asserted_red_flags(text):
+        if flag not in facts.red_flags:
+            facts.red_flags.append(flag)
+    facts.criticality_level = max_criticality(*(RED_FLAGS[f] for f in facts.red_flags))
+    return facts
@@ -0,0 +1,157 @@
+"""
+Offline stand-ins for the OpenAI, Groq and Pinecone clients.
+
+install() registers them through clients.override(), so the pipeline runs
+unchanged without network or API keys: replays (replay.py), load tests and smoke
+runs. Each fake sleeps for a configurable latency so timings stay meaningful.
+
+- Groq consolidation echoes the fragments back as one line per role; advice is
+  a fixed JSON reply whose summary ops and criticality follow the facts in the prompt. Fused
+  prompts (agent FUSED mode) get both in one reply. Latency grows with the
+  prompt (prompt_ms_per_1k) and usage is reported like Groq's.
+- Embeddings are deterministic pseudo-random vectors derived from the text.
+- Pinecone returns FAKE_PASSAGES in a text-dependent order.
+"""
+
+import hashlib
+import json
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+import clients
+from fact_extractor import extract_facts
+
+EMBED_DIM = 1536
+FAKE_PASSAGES = 20
+DEFAULT_LLM_MS = 300.0
+DEFAULT_EMBED_MS = 60.0
+DEFAULT_VECTOR_MS = 40.0
+DEFAULT_PROMPT_MS_PER_1K = 20.0   # extra Groq latency per 1k prompt tokens (prefill)
+STREAM_CHUNK_CHARS = 24
+
+_FRAGMENT_RE = re.compile(r"^  \d+\. \[[^\]]*\] '(.*)'$")
+_ROLE_RE = re.compile(r"^([A-Z_]+) FRAGMENTS:$")
+_FUSED_FRAGMENT_RE = re.compile(r"^  \d+\. \[([^\]]*)\] '(.*)'$")
+
+
+def _sleep_ms(ms: float) -> None:
+    if ms > 0:
+        time.sleep(ms / 1000)
+
+
+def _consolidate(prompt: str) -> str:
+    lines: Dict[str, List[str]] = {}
+    role = None
+    for line in prompt.splitlines():
+        header = _ROLE_RE.match(line)
+        if header:
+            role = header.group(1).lower()
+            continue
+        fragment = _FRAGMENT_RE.match(line)
+        if fragment and role:
+            lines.setdefault(role, []).append(fragment.group(1))
+    return json.dumps([{"role": r, "text": " ".join(texts)} for r, texts in lines.items()])
+
+
+def _advice(prompt: str) -> Dict:
+    facts = extract_facts(prompt, include_name=False)
+    ops = [{"op": "add", "field": "symptoms", "value": flag} for flag in facts.red_flags]
+    if facts.address:
+        ops.append({"op": "set", "field": "location", "value": facts.address})
+    if facts.patient_age is not None:
+        ops.append({"op": "set", "field": "patient", "value": f"{facts.patient_age} years old"})
+    return {
+        "summary_ops": ops,
+        "advice": ["Confirm the exact address", "Ask whether the patient is breathing"],
+        "patient_age": facts.patient_age,
+        "criticality_level": facts.criticality_level or "medium",
+    }
+
+
+def _advise(prompt: str) -> str:
+    return json.dumps(_advice(prompt))
+
+
+def _advise_fused(prompt: str) -> str:
+    dialogue: List[Dict] = []
+    for line in prompt.splitlines():
+        fragment = _FUSED_FRAGMENT_RE.match(line)
+        if not fragment:
+            continue
+        role, text = fragment.groups()
+        if dialogue and dialogue[-1]["role"] == role:
+            dialogue[-1]["text"] += f" {text}"
+        else:
+            dialogue.append({"role": role, "text": text})
+    return json.dumps(dict(_advice(prompt), dialogue=dialogue))
+
+
+class _Completions:
+    def __init__(self, llm_ms: float, prompt_ms_per_1k: float = DEFAULT_PROMPT_MS_PER_1K):
+        self.llm_ms = llm_ms
+        self.prompt_ms_per_1k = prompt_ms_per_1k
+
+    def create(self, model: str, messages: List[Dict], stream: bool = False, **kwargs):
+        prompt = messages[-1]["content"]
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        if "=== NEW ASR FRAGMENTS ===" in prompt:
+            content = _advise_fused(prompt)
+        else:
+            content = _consolidate(prompt) if "FRAGMENTS:" in prompt else _advise(prompt)
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(content) // 4,
+                                total_tokens=prompt_tokens + len(content) // 4)
+        prefill_ms = self.prompt_ms_per_1k * prompt_tokens / 1000
+        if not stream:
+            _sleep_ms(self.llm_ms + prefill_ms)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+        def chunks():
+            _sleep_ms(self.llm_ms / 2 + prefill_ms)   # time to first token
+            pieces = range(0, len(content), STREAM_CHUNK_CHARS)
+            for i in pieces:
+                _sleep_ms(self.llm_ms / 2 / len(pieces))
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + STREAM_CHUNK_CHARS]))])
+            # Groq reports usage on a final chunk without choices
+            yield SimpleNamespace(choices=[], x_groq=SimpleNamespace(usage=usage))
+        return chunks()
+
+
+class _Embeddings:
+    def __init__(self, embed_ms: float):
+        self.embed_ms = embed_ms
+
+    def create(self, model: str, input: List[str]):
+        _sleep_ms(self.embed_ms)
+        data = []
+        for text in input:
+            rng = random.Random(hashlib.md5(text.encode()).digest())
+            data.append(SimpleNamespace(embedding=[rng.uniform(-1, 1) for _ in range(EMBED_DIM)]))
+        return SimpleNamespace(data=data, usage=SimpleNamespace(prompt_tokens=sum(len(t) // 4 for t in input)))
+
+
+class _Index:
+    def __init__(self, vector_ms: float):
+        self.vector_ms = vector_ms
+
+    def query(self, vector, top_k: int, include_metadata: bool = True, **kwargs):
+        _sleep_ms(self.vector_ms)
+        order = sorted(range(FAKE_PASSAGES), key=lambda i: (vector[i % len(vector)] * (i + 1)) % 1)
+        return {"matches": [
+            {"id": f"fake_{i}", "score": 1.0 - rank / FAKE_PASSAGES,
+             "metadata": {"text": f"# Protocol {i}\nStep {i}: follow dispatch protocol {i}."}}
+            for rank, i in enumerate(order[:top_k])
+        ]}
+
+    def describe_index_stats(self):
+        return {"total_vector_count": FAKE_PASSAGES}
+
+
+def install(llm_ms: float = DEFAULT_LLM_MS, embed_ms: float = DEFAULT_EMBED_MS,
+            vector_ms: float = DEFAULT_VECTOR_MS, prompt_ms_per_1k: float = DEFAULT_PROMPT_MS_PER_1K) -> None:
+    """Replace the OpenAI, Groq and Pinecone clients with the fakes for the rest of the process."""
+    clients.override("openai", SimpleNamespace(embeddings=_Embeddings(embed_ms)))
+    clients.override("groq", SimpleNamespace(chat=SimpleNamespace(completions=_Completions(llm_ms, prompt_ms_per_1k))))
+    clients.override("pinecone_index", _Index(vector_ms))
@@ -0,0 +1,165 @@
+"""
+Latency / quality benchmark: fused consolidate-and-advise vs the two-call path.
+
+Splits the simulator's scripted call into ASR-like fragments (a few words each,
+with the occasional repeated interim fragment), one batch per exchange, and runs
+every batch through both turn paths of buffer2 on fresh agents:
+
+- two-call: consolidate_dialogue_with_groq, then process_chunk_fast
+- fused:    process_chunk_fast(fragments=...), one Groq call
+
+Per path it reports turn latency and how faithfully the recorded dialogue
+matches the script (word-level similarity); across paths, how often criticality
+and patient age agree and how much the summaries and advice overlap. The novelty
+gate is off so both paths call the model on every turn.
+
+    python fused_benchmark.py [--repeat 3] [--fake --llm-ms 300]
+"""
+
+import argparse
+import difflib
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from metrics import percentile
+
+FRAGMENT_WORDS = (2, 5)     # words per ASR fragment
+REPEAT_FRAGMENT_P = 0.15    # chance an interim fragment is delivered twice
+
+
+def fragment_script(exchanges: List[Tuple[str, str]], seed: int = 0) -> List[Tuple[List[Dict], List[Tuple[str, str]]]]:
+    """One (raw buffer2 messages, true dialogue lines) batch per (caller, dispatcher) exchange."""
+    rng = random.Random(seed)
+    clock_ms, seq, batches = int(time.time() * 1000), 0, []
+    for caller, dispatcher in exchanges:
+        messages, truth = [], [("caller", caller), ("dispatcher", dispatcher)]
+        for role, line in truth:
+            words = line.split()
+            while words:
+                n = rng.randint(*FRAGMENT_WORDS)
+                piece, words = " ".join(words[:n]), words[n:]
+                for _ in range(2 if rng.random() < REPEAT_FRAGMENT_P else 1):
+                    seq += 1
+                    clock_ms += rng.randint(150, 400)
+                    messages.append({"event": "interim-transcription", "text": piece, "metadata": {
+                        "callId": "benchmark", "role": role, "timestamp": str(clock_ms), "sequenceNumber": seq}})
+        batches.append((messages, truth))
+    return batches
+
+
+def _words(lines: List[Tuple[str, str]]) -> List[str]:
+    return [w.lower().strip(".,?!'\"") for _, text in lines for w in text.split()]
+
+
+def _overlap(a: List[str], b: List[str]) -> float:
+    from advice_filter import shingles
+    sa, sb = shingles(" ".join(a)), shingles(" ".join(b))
+    return len(sa & sb) / len(sa | sb) if sa | sb else 1.0
+
+
+def _chunk(coherent: List[Tuple[str, str]]) -> Tuple[str, str]:
+    callers = [t for r, t in coherent if r == "caller"]
+    return ("caller", callers[-1]) if callers else coherent[-1]
+
+
+def run_path(batches, fused: bool) -> List[Dict]:
+    import buffer2
+    from agent import DispatcherAgent, merge_fragments
+
+    agent = DispatcherAgent(journal=None)
+    turns = []
+    for messages, truth in batches:
+        start = time.time()
+        if fused:
+            fragments = [(f["role"], f["text"]) for f in buffer2.order_fragments(messages)]
+            role, chunk = _chunk(merge_fragments(fragments))
+            out = agent.process_chunk_fast(chunk, role, None, False, None, fragments)
+            dialogue, llm_calls = out.get("dialogue", []), 1
+        else:
+            dialogue = buffer2.consolidate_dialogue_with_groq(messages, agent.criticality_level)
+            for role, text in dialogue:
+                agent._update_conversation_async(role, text)
+            role, chunk = _chunk(dialogue or truth)
+            out = agent.process_chunk_fast(chunk, role, None, True, None)
+            llm_calls = 2
+        turns.append({
+            "ms": (time.time() - start) * 1000,
+            "llm_calls": llm_calls,
+            "fidelity": difflib.SequenceMatcher(None, _words(truth), _words(dialogue)).ratio(),
+            "summary": out.get("summary", []),
+            "advice": out.get("advice") if isinstance(out.get("advice"), list) else [],
+            "patient_age": out.get("patient_age"),
+            "criticality_level": out.get("criticality_level"),
+        })
+    agent.end_call()
+    return turns
+
+
+def summarize(turns: List[Dict]) -> Dict:
+    latencies = [t["ms"] for t in turns]
+    return {
+        "turns": len(turns),
+        "llm_calls_per_turn": statistics.mean(t["llm_calls"] for t in turns),
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "fidelity": statistics.mean(t["fidelity"] for t in turns),
+    }
+
+
+def compare(two_call: List[Dict], fused: List[Dict]) -> Dict:
+    pairs = list(zip(two_call, fused))
+    return {
+        "criticality_agreement": sum(a["criticality_level"] == b["criticality_level"] for a, b in pairs) / len(pairs),
+        "age_agreement": sum(a["patient_age"] == b["patient_age"] for a, b in pairs) / len(pairs),
+        "summary_overlap": statistics.mean(_overlap(a["summary"], b["summary"]) for a, b in pairs),
+        "advice_overlap": statistics.mean(_overlap(a["advice"], b["advice"]) for a, b in pairs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=1, help="calls per path (different fragmentations)")
+    parser.add_argument("--fake", action="store_true", help="use fake OpenAI/Groq/Pinecone backends")
+    parser.add_argument("--llm-ms", type=float, default=None, help="fake Groq latency")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    # Before agent is imported: keep benchmark calls out of the real memory DB and journal
+    os.environ.setdefault("MEMORY_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="fused_benchmark_"), "memory.db"))
+    os.environ.setdefault("CALL_JOURNAL", "0")
+    if args.fake:
+        os.environ.setdefault("LETTA_MIRROR", "0")
+        import fake_backends
+        fake_backends.install(**({"llm_ms": args.llm_ms} if args.llm_ms is not None else {}))
+    import agent
+    from conversation_simulator import create_realistic_emergency_conversation
+
+    agent.novelty_gate.enabled = False
+    two_call, fused = [], []
+    for i in range(args.repeat):
+        batches = fragment_script(create_realistic_emergency_conversation(), seed=i)
+        two_call += run_path(batches, fused=False)
+        fused += run_path(batches, fused=True)
+    results = {"two_call": summarize(two_call), "fused": summarize(fused), "agreement": compare(two_call, fused)}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'path':<9} {'turns':>6} {'calls/turn':>11} {'mean ms':>9} {'p50 ms':>9} {'p90 ms':>9} {'fidelity':>9}")
+    for name in ("two_call", "fused"):
+        r = results[name]
+        print(f"{name:<9} {r['turns']:>6} {r['llm_calls_per_turn']:>11.1f} {r['mean_ms']:>9.1f} "
+              f"{r['p50_ms']:>9.1f} {r['p90_ms']:>9.1f} {r['fidelity']:>9.2f}")
+    a = results["agreement"]
+    print(f"agreement: criticality {a['criticality_agreement']:.2f}  age {a['age_agreement']:.2f}  "
+          f"summary overlap {a['summary_overlap']:.2f}  advice overlap {a['advice_overlap']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
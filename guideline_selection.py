@@ -0,0 +1,96 @@
+"""
+Guideline passage selection and cross-turn deduplication.
+
+Every turn used to paste the top-3 raw ~500-token chunks into the prompt, even
+when they were the same passages as last turn or near-duplicates of each other.
+mmr_select() picks a diverse set from a larger candidate pool (maximal marginal
+relevance), and GuidelineTracker remembers per call which passages the model has
+been shown in full. Repeats are rendered as a one-line "still applicable"
+reference until GUIDELINE_REFRESH_TURNS have passed; the reference keeps the
+title and lead sentence because each Groq request is stateless and the model
+cannot look the full text up by id.
+"""
+
+import re
+from typing import Dict, List, Tuple
+
+from bm25 import tokenize
+from metrics import metrics
+
+MMR_LAMBDA = 0.7               # relevance vs. diversity trade-off (1.0 = plain top-k)
+MMR_POOL_FACTOR = 3            # candidates retrieved per passage kept
+GUIDELINE_REFRESH_TURNS = 6    # re-send a passage in full after this many prompted turns
+REFERENCE_MAX_CHARS = 160
+
+_HEADING_RE = re.compile(r"^\s*#+\s*(.+?)\s*#*\s*$", re.MULTILINE)
+_SENTENCE_RE = re.compile(r"(.+?[.!?])(?:\s|$)", re.DOTALL)
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def mmr_select(candidates: List[Dict], top_k: int, lambda_: float = MMR_LAMBDA) -> List[Dict]:
+    """
+    Maximal marginal relevance over ranked {"id", "text"} candidates. Relevance is
+    taken from rank (the pool may come from RRF, Pinecone or a bundle, whose raw
+    scores aren't comparable); redundancy is word-set overlap with passages already
+    picked.
+    """
+    tokens = [set(tokenize(c["text"])) for c in candidates]
+    relevance = [1 - rank / len(candidates) for rank in range(len(candidates))]
+    selected: List[int] = []
+    remaining = list(range(len(candidates)))
+    while remaining and len(selected) < top_k:
+        best = max(remaining, key=lambda i: lambda_ * relevance[i] - (1 - lambda_) * max(
+            (_jaccard(tokens[i], tokens[j]) for j in selected), default=0.0))
+        selected.append(best)
+        remaining.remove(best)
+    return [candidates[i] for i in selected]
+
+
+def passage_reference(text: str) -> str:
+    """Title (first markdown heading, else first line) and lead sentence of a chunk."""
+    heading = _HEADING_RE.search(text)
+    title = heading.group(1) if heading else text.strip().split("\n", 1)[0]
+    body = _HEADING_RE.sub("", text).strip()
+    lead = _SENTENCE_RE.match(body)
+    lead = " ".join((lead.group(1) if lead else body).split())
+    reference = f"{title}: {lead}" if lead and lead != title else title
+    return reference if len(reference) <= REFERENCE_MAX_CHARS else reference[:REFERENCE_MAX_CHARS - 1] + "…"
+
+
+class GuidelineTracker:
+    """Per-call record of which guideline passages were last sent in full, and when."""
+
+    def __init__(self, refresh_turns: int = GUIDELINE_REFRESH_TURNS):
+        self.refresh_turns = refresh_turns
+        self.turn = 0
+        self.sent: Dict[str, int] = {}   # passage id -> prompted turn its full text was sent
+
+    def render(self, passages: List[Dict]) -> Tuple[str, List[str]]:
+        """
+        Guidelines prompt section and the ids it sends in full. Read-only: call
+        mark_sent() once the prompt has actually been used.
+        """
+        full, references, full_ids = [], [], []
+        for p in passages:
+            last_sent = self.sent.get(p["id"])
+            if last_sent is not None and self.turn - last_sent < self.refresh_turns:
+                references.append(f"- [{p['id']}] {passage_reference(p['text'])}")
+            else:
+                full.append(f"[{p['id']}]\n{p['text']}")
+                full_ids.append(p["id"])
+        if references:
+            full.append("Still applicable (shown in full on an earlier turn):\n" + "\n".join(references))
+
+        context = "\n\n".join(full)
+        metrics.incr("guidelines.passages_full", len(full_ids))
+        metrics.incr("guidelines.passages_referenced", len(references))
+        metrics.observe("guidelines.context_chars", len(context))
+        return context, full_ids
+
+    def mark_sent(self, ids: List[str]) -> None:
+        for passage_id in ids:
+            self.sent[passage_id] = self.turn
+        self.turn += 1
@@ -0,0 +1,250 @@
+"""
+Hedged, deadline-bounded Groq chat completions.
+
+A single slow Groq response used to stall the whole turn. HedgedGroq streams the
+primary request and, if no first token has arrived within a delay derived from the
+recent first-token latency distribution (e.g. its p90), fires a duplicate request
+(optionally to a faster fallback model). Whichever completes first wins and the
+other stream is closed, so tail latency is bounded while only the slowest ~10% of
+requests pay for a second call. Calls that must not be downgraded hedge on their
+own model instead.
+
+A cancelled attempt is closed and settled by the side that cancels it, so a stalled
+stream neither holds its quota until the read times out nor outlives the deadline:
+each request's HTTP timeout is the time left before it.
+
+Both attempts take quota from the rate governor: the primary queues for it by
+priority, while a hedge is only fired if quota is free right now.
+"""
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import metrics
+from rate_governor import RateGovernor, Reservation, estimate_chat_tokens, estimate_tokens, rate_governor
+
+logger = logging.getLogger("hedging")
+
+HEDGE_PERCENTILE = 90          # hedge once we're slower than this percentile of first-token latency
+HEDGE_MIN_SAMPLES = 20         # use HEDGE_DEFAULT_DELAY_MS until we have this many samples
+HEDGE_DEFAULT_DELAY_MS = 600.0
+HEDGE_MIN_DELAY_MS = 150.0
+HEDGE_MAX_DELAY_MS = 2000.0
+DEFAULT_DEADLINE_S = 10.0      # hard upper bound for one completion, hedge included
+
+
+@dataclass
+class _Attempt:
+    model: str
+    label: str                  # "primary" or "hedge"
+    started_at: float
+    reservation: Reservation
+    prompt_tokens: int
+    first_token: threading.Event = field(default_factory=threading.Event)
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    deadline: float = 0.0
+    first_token_ms: Optional[float] = None
+    usage: Any = None           # provider-reported usage, if the stream carried it
+    stream: Any = None
+    parts: List[str] = field(default_factory=list)
+    settled: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class HedgedGroq:
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        fallback_model: Optional[str] = None,
+        percentile: float = HEDGE_PERCENTILE,
+        min_delay_ms: float = HEDGE_MIN_DELAY_MS,
+        max_delay_ms: float = HEDGE_MAX_DELAY_MS,
+        deadline_s: float = DEFAULT_DEADLINE_S,
+        enabled: bool = True,
+        governor: RateGovernor = rate_governor,
+    ):
+        self.client_factory = client_factory   # Groq client, built on first request
+        self.fallback_model = fallback_model
+        self.percentile = percentile
+        self.min_delay_ms = min_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.deadline_s = deadline_s
+        self.enabled = enabled
+        self.governor = governor
+
+    def hedge_delay_ms(self, model: str) -> float:
+        """Delay before hedging, from the model's recent first-token latency percentile."""
+        name = f"groq.first_token_ms.{model}"
+        if metrics.sample_count(name) < HEDGE_MIN_SAMPLES:
+            delay = HEDGE_DEFAULT_DELAY_MS
+        else:
+            delay = metrics.quantile(name, self.percentile)
+        return max(self.min_delay_ms, min(self.max_delay_ms, delay))
+
+    def create(self, model: str, messages: List[Dict], deadline_s: Optional[float] = None,
+               priority: Optional[str] = None, downgrade: bool = True, **kwargs) -> Tuple[str, Dict]:
+        """
+        Run a chat completion with hedging. Returns (content, info) where info records
+        the winning model, whether a hedge was fired, first-token/total latency and the
+        winner's prompt/completion tokens (provider usage if reported, else estimated).
+        `priority` (a criticality level) orders the request in the rate governor's queue.
+        With downgrade=False the hedge goes to `model` rather than the fallback model.
+
+        Raises TimeoutError if nothing completes before the deadline (time spent
+        waiting for quota included), or the last error if every attempt failed.
+        """
+        start = time.time()
+        deadline = start + (deadline_s if deadline_s is not None else self.deadline_s)
+        results: "queue.Queue[Tuple[_Attempt, Optional[str], Optional[BaseException]]]" = queue.Queue()
+        prompt_tokens = estimate_chat_tokens(messages)
+        tokens = prompt_tokens + kwargs.get("max_tokens", 0)
+
+        reservation = self.governor.acquire(model, tokens, priority, timeout=deadline - time.time())
+        primary = self._start(model, "primary", messages, kwargs, results, reservation, prompt_tokens, deadline)
+        attempts = [primary]
+        metrics.incr("groq.requests")
+
+        delay_s = self.hedge_delay_ms(model) / 1000
+        if self.enabled and not primary.first_token.wait(min(delay_s, max(0.0, deadline - time.time()))):
+            if results.empty() and time.time() < deadline:
+                hedge_model = (self.fallback_model if downgrade else None) or model
+                hedge_reservation = self.governor.try_acquire(hedge_model, tokens)
+                if hedge_reservation is None:
+                    metrics.incr("groq.hedge_skipped_quota")
+                else:
+                    attempts.append(self._start(hedge_model, "hedge", messages, kwargs, results,
+                                                hedge_reservation, prompt_tokens, deadline))
+                    metrics.incr("groq.hedged")
+                    logger.debug(f"No first token after {delay_s * 1000:.0f}ms, hedging to {hedge_model}")
+
+        last_error: Optional[BaseException] = None
+        pending = len(attempts)
+        while pending:
+            try:
+                attempt, content, error = results.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                for a in attempts:
+                    self._cancel(a)
+                metrics.incr("groq.deadline_exceeded")
+                raise TimeoutError(f"Groq completion exceeded {deadline - start:.1f}s deadline")
+            pending -= 1
+            if error is not None:
+                last_error = error
+                continue
+
+            for other in attempts:
+                if other is not attempt:
+                    self._cancel(other)
+            hedged = len(attempts) > 1
+            if hedged:
+                metrics.incr("groq.hedge_won" if attempt.label == "hedge" else "groq.primary_won")
+            total_ms = (time.time() - start) * 1000
+            metrics.observe("groq.completion_ms", total_ms)
+            usage = attempt.usage
+            return content, {
+                "model": attempt.model,
+                "winner": attempt.label,
+                "hedged": hedged,
+                "first_token_ms": attempt.first_token_ms,
+                "total_ms": total_ms,
+                "prompt_tokens": usage.prompt_tokens if usage is not None else attempt.prompt_tokens,
+                "completion_tokens": usage.completion_tokens if usage is not None else estimate_tokens(content),
+                "usage_reported": usage is not None,
+            }
+
+        raise last_error if last_error is not None else RuntimeError("Groq completion failed")
+
+    def _start(self, model: str, label: str, messages: List[Dict], kwargs: Dict, results: queue.Queue,
+               reservation: Reservation, prompt_tokens: int, deadline: float) -> _Attempt:
+        attempt = _Attempt(model=model, label=label, started_at=time.time(), reservation=reservation,
+                           prompt_tokens=prompt_tokens, deadline=deadline)
+        thread = threading.Thread(
+            target=self._stream, args=(attempt, messages, kwargs, results), name=f"groq-{label}", daemon=True
+        )
+        thread.start()
+        return attempt
+
+    def _stream(self, attempt: _Attempt, messages: List[Dict], kwargs: Dict, results: queue.Queue) -> None:
+        failed = False
+        try:
+            # No single read may outlast the deadline, even if nobody cancels the attempt
+            timeout = max(0.1, attempt.deadline - time.time())
+            attempt.stream = self.client_factory().chat.completions.create(
+                model=attempt.model, messages=messages, stream=True, timeout=timeout, **kwargs)
+            if attempt.cancelled.is_set():
+                # Cancelled while connecting; _cancel() may not have seen the stream
+                self._close(attempt)
+                return
+            for chunk in attempt.stream:
+                if attempt.cancelled.is_set():
+                    return
+                # Groq reports usage on the last chunk (x_groq.usage); OpenAI-style servers on chunk.usage
+                usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+                if usage is not None:
+                    attempt.usage = usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not attempt.first_token.is_set():
+                        attempt.first_token_ms = (time.time() - attempt.started_at) * 1000
+                        metrics.observe(f"groq.first_token_ms.{attempt.model}", attempt.first_token_ms)
+                        attempt.first_token.set()
+                    attempt.parts.append(delta)
+            attempt.first_token.set()
+            results.put((attempt, "".join(attempt.parts), None))
+        except Exception as e:
+            # Unblock the hedge wait in create(); the error itself goes through results
+            attempt.first_token.set()
+            failed = True
+            self.governor.report_error(attempt.model, e)
+            if not attempt.cancelled.is_set():
+                # A stream closed by _cancel() fails its pending read; that's not worth a warning
+                logger.warning(f"Groq {attempt.label} request to {attempt.model} failed: {e}")
+                results.put((attempt, None, e))
+        finally:
+            self._settle(attempt, failed)
+
+    def _cancel(self, attempt: _Attempt) -> None:
+        """Stop a losing or timed-out attempt now: close its stream and return its quota."""
+        attempt.cancelled.set()
+        self._close(attempt)
+        self._settle(attempt)
+
+    @staticmethod
+    def _close(attempt: _Attempt) -> None:
+        if attempt.stream is None:
+            return
+        try:
+            attempt.stream.close()
+        except Exception:
+            pass  # e.g. a generator stream that is mid-read in its own thread
+
+    def _settle(self, attempt: _Attempt, failed: bool = False) -> None:
+        """Settle the attempt's reservation once, with whatever it has used so far."""
+        with attempt.lock:
+            if attempt.settled:
+                return
+            attempt.settled = True
+        if attempt.stream is None:
+            used = 0 if failed else attempt.prompt_tokens   # failed to connect, or cancelled while connecting
+        elif attempt.usage is not None:
+            used = attempt.usage.total_tokens
+        elif failed:
+            used = attempt.prompt_tokens    # a failed request isn't billed for output
+        else:
+            used = attempt.prompt_tokens + estimate_tokens("".join(attempt.parts))
+        self.governor.settle(attempt.reservation, used)
+
+    def stats(self) -> Dict:
+        requests = metrics.counter("groq.requests")
+        hedged = metrics.counter("groq.hedged")
+        return {
+            "hedge_rate": hedged / requests if requests else 0.0,
+            "hedge_win_rate": metrics.counter("groq.hedge_won") / hedged if hedged else 0.0,
+            "completion_ms_p99": metrics.quantile("groq.completion_ms", 99),
+        }
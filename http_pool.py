@@ -0,0 +1,178 @@
+"""
+Shared HTTP connection pooling and pre-warmed connections for the API clients.
+
+OpenAI, Groq, Pinecone and Letta clients each managed their own connections with
+library defaults, so the first turn of a call (and the first after a quiet spell,
+since httpx drops idle connections after 5 s) paid DNS + TCP + TLS handshakes.
+clients.py builds every httpx-based client (OpenAI, Groq, Letta) with
+make_http_client() and sizes Pinecone's urllib3 pool from the same PoolConfig:
+keep-alive long enough to span the gaps between turns, HTTP/2 where the h2
+package is installed, and pool sizes derived from the worker count.
+
+ConnectionWarmer opens one connection per service at startup and pings services
+that have been idle for KEEPALIVE_PING_S so the pool never goes cold. Each httpx
+request carries a trace hook that counts new TCP connections and TLS handshakes,
+so stats() reports connection reuse per service.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import httpx
+
+from metrics import metrics
+
+logger = logging.getLogger("http_pool")
+
+try:
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+HTTP_WORKERS = int(os.getenv("HTTP_WORKERS", "4"))   # turns the process serves concurrently
+CONNECTIONS_PER_WORKER = 2      # a hedged completion holds two connections at once
+KEEPALIVE_EXPIRY_S = 120.0      # keep idle pooled connections well past the gap between turns
+KEEPALIVE_PING_S = 45.0         # ping a service after this long without traffic
+CONNECT_TIMEOUT_S = 5.0
+READ_TIMEOUT_S = 60.0
+WARMUP_TIMEOUT_S = 10.0
+
+
+@dataclass
+class PoolConfig:
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry_s: float = KEEPALIVE_EXPIRY_S
+    http2: bool = HTTP2_AVAILABLE
+
+
+def pool_config_for(workers: int) -> PoolConfig:
+    return PoolConfig(max_connections=workers * CONNECTIONS_PER_WORKER, max_keepalive_connections=workers)
+
+
+_config = pool_config_for(HTTP_WORKERS)
+_last_used: Dict[str, float] = {}
+
+
+def configure(workers: int) -> None:
+    """Size the pools for `workers` concurrent turns; affects clients built afterwards."""
+    global _config
+    _config = pool_config_for(workers)
+
+
+def pool_config() -> PoolConfig:
+    return _config
+
+
+def mark_used(service: str) -> None:
+    _last_used[service] = time.time()
+
+
+class _ConnectionTracer:
+    """httpcore trace hook: counts connections opened (vs. reused from the pool)."""
+
+    def __init__(self, service: str):
+        self.service = service
+
+    def __call__(self, event_name: str, info: Dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            metrics.incr(f"http.{self.service}.new_connections")
+        elif event_name == "connection.start_tls.complete":
+            metrics.incr(f"http.{self.service}.tls_handshakes")
+
+
+def make_http_client(service: str, config: Optional[PoolConfig] = None, follow_redirects: bool = False) -> httpx.Client:
+    config = config or _config
+    tracer = _ConnectionTracer(service)
+
+    def on_request(request: httpx.Request) -> None:
+        request.extensions["trace"] = tracer
+        metrics.incr(f"http.{service}.requests")
+        mark_used(service)
+
+    return httpx.Client(
+        http2=config.http2,
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry_s,
+        ),
+        timeout=httpx.Timeout(READ_TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+        follow_redirects=follow_redirects,
+        event_hooks={"request": [on_request]},
+    )
+
+
+def ping_url(http_client: httpx.Client, url: str) -> None:
+    """Cheapest request that opens (or keeps alive) a pooled connection; any status will do."""
+    http_client.head(url)
+
+
+class ConnectionWarmer:
+    """Opens pooled connections at startup and keeps idle ones alive with cheap pings."""
+
+    def __init__(self, pings: Dict[str, Callable[[], None]], ping_interval_s: float = KEEPALIVE_PING_S):
+        self.pings = pings
+        self.ping_interval_s = ping_interval_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _ping(self, service: str) -> Optional[float]:
+        start = time.time()
+        try:
+            self.pings[service]()
+        except Exception as e:
+            logger.warning(f"Warm-up ping to {service} failed: {e}")
+            metrics.incr(f"http.{service}.ping_failures")
+            return None
+        mark_used(service)
+        elapsed_ms = (time.time() - start) * 1000
+        metrics.observe(f"http.{service}.ping_ms", elapsed_ms)
+        return elapsed_ms
+
+    def warm_up(self, timeout: float = WARMUP_TIMEOUT_S) -> Dict[str, Optional[float]]:
+        """Ping every service concurrently; returns ms per service (None if it failed or timed out)."""
+        with ThreadPoolExecutor(max_workers=len(self.pings), thread_name_prefix="warm-up") as pool:
+            futures = {service: pool.submit(self._ping, service) for service in self.pings}
+            wait(futures.values(), timeout=timeout)
+        results = {service: f.result() if f.done() else None for service, f in futures.items()}
+        logger.info("Connections warmed: " + ", ".join(
+            f"{s}={'failed' if ms is None else f'{ms:.0f}ms'}" for s, ms in results.items()))
+        return results
+
+    def start(self) -> None:
+        """Background keep-alive: ping each service that has been idle for ping_interval_s."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="http-keepalive", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.ping_interval_s / 3):
+            now = time.time()
+            for service in self.pings:
+                if now - _last_used.get(service, 0.0) >= self.ping_interval_s:
+                    self._ping(service)
+
+
+def stats(services=("openai", "groq", "letta")) -> Dict:
+    """Per-service requests, new connections and the share of requests that reused one."""
+    report = {}
+    for service in services:
+        requests = metrics.counter(f"http.{service}.requests")
+        new = metrics.counter(f"http.{service}.new_connections")
+        report[service] = {
+            "requests": requests,
+            "new_connections": new,
+            "tls_handshakes": metrics.counter(f"http.{service}.tls_handshakes"),
+            "reuse_rate": max(0.0, 1 - new / requests) if requests else 0.0,
+        }
+    return report
@@ -0,0 +1,128 @@
+"""
+Precomputed guideline bundles keyed by incident type.
+
+Most calls fall into a handful of incident types that the two ingested manuals
+cover. rag.py retrieves a ranked passage bundle per incident type at index time
+and saves them to GUIDELINE_BUNDLES_PATH. At call time DispatcherAgent classifies
+the call locally with a keyword classifier and, when confident, serves guidelines
+from the in-memory bundle instead of running an embedding + Pinecone query.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("incident_bundles")
+
+GUIDELINE_BUNDLES_PATH = os.getenv("GUIDELINE_BUNDLES_PATH", "guideline_bundles.json")
+BUNDLE_SIZE = 12                 # passages kept per incident type
+BUNDLE_CONFIDENCE = 0.6          # below this, fall back to live retrieval
+CLASSIFIER_PRIOR = 1.0           # smoothing: a single weak keyword isn't a confident match
+
+INCIDENT_TYPES: Dict[str, Dict] = {
+    "cardiac": {
+        "query": "Caller reports chest pain, heart attack, cardiac arrest or collapse; dispatcher CPR and AED instructions",
+        "keywords": {
+            "chest pain": 3, "heart attack": 3, "cardiac": 3, "heart": 1, "not breathing": 2, "cpr": 3,
+            "aed": 3, "defibrillator": 3, "collapsed": 2, "no pulse": 3, "pale": 1, "sweaty": 1, "aspirin": 2,
+        },
+    },
+    "trauma": {
+        "query": "Caller reports injury from a fall, car crash, assault, stabbing or gunshot with bleeding; bleeding control and scene safety",
+        "keywords": {
+            "bleeding": 3, "blood": 2, "crash": 3, "accident": 2, "fell": 2, "fall": 1, "broken": 2, "shot": 3,
+            "stabbed": 3, "knife": 2, "gun": 2, "hit": 1, "injured": 2, "wound": 2, "head injury": 3,
+        },
+    },
+    "overdose": {
+        "query": "Caller reports drug overdose, poisoning or too many pills; naloxone, breathing checks and recovery position",
+        "keywords": {
+            "overdose": 3, "overdosed": 3, "pills": 3, "drugs": 2, "heroin": 3, "fentanyl": 3, "opioid": 3,
+            "naloxone": 3, "narcan": 3, "poison": 3, "swallowed": 2, "drank": 1, "needle": 2,
+        },
+    },
+    "suicidal_ideation": {
+        "query": "Caller expresses suicidal thoughts or self-harm; crisis line risk assessment, de-escalation and safety planning",
+        "keywords": {
+            "suicide": 3, "suicidal": 3, "kill myself": 3, "end my life": 3, "want to die": 3, "self harm": 3,
+            "hurt myself": 3, "cutting": 2, "hopeless": 2, "no reason to live": 3, "goodbye": 1, "plan": 1,
+        },
+    },
+}
+
+_KEYWORD_RES = {
+    incident: [(re.compile(r"\b" + re.escape(k) + r"\b", re.IGNORECASE), w) for k, w in spec["keywords"].items()]
+    for incident, spec in INCIDENT_TYPES.items()
+}
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def classify_incident(text: str) -> Tuple[Optional[str], float]:
+    """Keyword classifier: (incident_type, confidence in [0, 1)), or (None, 0.0) with no evidence."""
+    scores = {
+        incident: sum(w * len(pattern.findall(text)) for pattern, w in patterns)
+        for incident, patterns in _KEYWORD_RES.items()
+    }
+    best = max(scores, key=scores.get)
+    if scores[best] == 0:
+        return None, 0.0
+    return best, scores[best] / (sum(scores.values()) + CLASSIFIER_PRIOR)
+
+
+def build_bundles(embed_fn: Callable[[List[str]], List[List[float]]], query_fn: Callable[[List[float], int], List[Dict]],
+                  path: str = GUIDELINE_BUNDLES_PATH, bundle_size: int = BUNDLE_SIZE) -> Dict:
+    """
+    Index-time step (rag.py): retrieve a ranked passage bundle per incident type.
+
+    embed_fn embeds a list of texts; query_fn(vector, top_k) returns
+    [{"id", "text", "score"}] from the vector index.
+    """
+    incidents = list(INCIDENT_TYPES)
+    vectors = embed_fn([INCIDENT_TYPES[i]["query"] for i in incidents])
+    bundles = {
+        incident: {"query": INCIDENT_TYPES[incident]["query"], "passages": query_fn(vector, bundle_size)}
+        for incident, vector in zip(incidents, vectors)
+    }
+    data = {"built_at": time.time(), "bundles": bundles}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    return data
+
+
+class GuidelineBundles:
+    """In-memory view of the precomputed bundles, loaded lazily on first use."""
+
+    def __init__(self, path: str = GUIDELINE_BUNDLES_PATH):
+        self.path = path
+        self._bundles: Optional[Dict[str, List[Dict]]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, List[Dict]]:
+        with self._lock:
+            if self._bundles is None:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        data = json.load(f)
+                    self._bundles = {k: v["passages"] for k, v in data["bundles"].items()}
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"No guideline bundles loaded from {self.path}: {e}")
+                    self._bundles = {}
+            return self._bundles
+
+    def passages_for(self, incident: str, query: str, top_k: int = 3) -> List[Dict]:
+        """
+        Top passages of an incident's bundle for this turn: bundle rank re-ordered by
+        word overlap with the query, so the turn's specifics still steer the choice.
+        """
+        bundle = self._load().get(incident, [])
+        query_words = set(_WORD_RE.findall(query.lower()))
+        scored = [
+            (len(query_words & set(_WORD_RE.findall(p["text"].lower()))) - rank * 0.5, p)
+            for rank, p in enumerate(bundle)
+        ]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [p for _, p in scored[:top_k]]
@@ -10,6 +10,8 @@ import logging
 import websockets
 from typing import Set
 
+from traffic_capture import recorder_from_env
+
 # Configuration
 SERVER_HOST = "localhost"
 SERVER_PORT = 8765
@@ -20,11 +22,16 @@ logger = logging.getLogger("main_server")
 # Connected clients
 connected_clients: Set[websockets.WebSocketServerProtocol] = set()
 
+# Inbound client messages and broadcasts, when TRAFFIC_CAPTURE is set
+recorder = None
+
 async def broadcast_to_all(message: str, exclude_client: websockets.WebSocketServerProtocol = None):
     """Send message to all connected clients"""
     if not connected_clients:
         logger.debug("No clients connected, dropping message")
         return
+    if recorder is not None:
+        recorder.record("out", message)
         
     disconnected = set()
     sent_count = 0
@@ -64,6 +71,8 @@ async def handle_client(websocket, path):
         
         # Listen for messages from this client
         async for message in websocket:
+            if recorder is not None:
+                recorder.record("in", message)
             try:
                 data = json.loads(message)
                 event = data.get("event")
@@ -132,6 +141,8 @@ async def handle_client(websocket, path):
 
 async def main():
     """Start the WebSocket server"""
+    global recorder
+    recorder = recorder_from_env("main_server")
     logger.info(f"🚀 Starting Emergency Dispatch WebSocket Server on {SERVER_HOST}:{SERVER_PORT}")
     
     async with websockets.serve(handle_client, SERVER_HOST, SERVER_PORT):
@@ -0,0 +1,417 @@
+"""
+Pluggable call-memory backends for DispatcherAgent.
+
+The agent only needs four things from memory: the running summary, the
+transcript, appending a turn and replacing the summary. MemoryBackend is that
+interface.
+
+- LettaMemoryBackend keeps the original behaviour: remote Letta blocks, reads over
+  the network (summary cached for SUMMARY_TTL_S), writes via the write-behind queue.
+  Its Letta agent is created on first use, normally by the writer thread's first
+  write, so opening a call never waits on Letta.
+- LocalMemoryBackend keeps the summary and transcript in process memory, so reads
+  cost microseconds, persists them to SQLite (WAL) from a background thread, and
+  can mirror every write to Letta asynchronously. Letta is then a mirror, not the
+  source of truth.
+
+Both keep the transcript in a TurnStore. teardown() ends a call: it flushes,
+cancels whatever the flush didn't get to, drops the in-memory state and deletes
+the call's SQLite rows and Letta agent (unless LETTA_RETAIN_ENDED_CALLS=1).
+Writes arriving after teardown are ignored, so a late write can't recreate them.
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import metrics
+from turn_store import TurnStore
+
+logger = logging.getLogger("memory_backend")
+
+MEMORY_DB_PATH = os.getenv("MEMORY_DB_PATH", "call_memory.db")
+SUMMARY_TTL_S = 5.0
+SQLITE_COMMIT_INTERVAL_S = 0.05   # writer groups everything queued within this window into one transaction
+LETTA_RETAIN_ENDED_CALLS = os.getenv("LETTA_RETAIN_ENDED_CALLS", "0") == "1"   # keep Letta agents after teardown
+
+
+class MemoryBackend(ABC):
+    @abstractmethod
+    def get_summary(self) -> str:
+        ...
+
+    @abstractmethod
+    def set_summary(self, summary: str) -> None:
+        ...
+
+    @abstractmethod
+    def append_turn(self, role: str, message: str) -> None:
+        ...
+
+    @abstractmethod
+    def get_conversation(self) -> str:
+        ...
+
+    @abstractmethod
+    def restore(self, summary: str, turns: List[Tuple[str, str]]) -> None:
+        """Replace the in-memory state wholesale (crash recovery)."""
+        ...
+
+    def close(self, timeout: float = 10.0) -> bool:
+        """Flush anything not yet persisted. Returns False if it timed out."""
+        return True
+
+    def teardown(self, timeout: float = 10.0) -> bool:
+        """The call is over: flush, then release in-memory and remote resources."""
+        return self.close(timeout=timeout)
+
+    def memory_bytes(self) -> int:
+        """Approximate bytes of call state held in this process."""
+        return 0
+
+
+# ── Letta ─────────────────────────────────────────────────────────────────────
+class LettaMemoryBackend(MemoryBackend):
+    def __init__(self, get_client: Callable[[], Any], writer):
+        self.get_client = get_client
+        self.writer = writer
+        self._agent = None
+        self._agent_lock = threading.Lock()
+        self.summary_cache = None
+        self.summary_cache_time = 0
+        self.transcript: Optional[TurnStore] = None     # None until loaded from Letta or written
+        self._conversation_lock = threading.Lock()
+        self.ended = False
+
+    def __repr__(self) -> str:
+        return f"LettaMemoryBackend({self._agent.id if self._agent is not None else 'agent not created'})"
+
+    @property
+    def agent_id(self) -> str:
+        with self._agent_lock:
+            if self._agent is None:
+                if self.ended:
+                    raise RuntimeError("call ended; its Letta agent is gone")
+                self._agent = self._create_agent()
+            return self._agent.id
+
+    def _create_agent(self):
+        # Create a Letta agent for memory management
+        return self.get_client().agents.create(
+            memory_blocks=[
+                {
+                    "label": "call_history",
+                    "value": "",
+                    "description": "Rolling bullet-point summary of the call so far"
+                },
+                {
+                    "label": "full_conversation",
+                    "value": "",
+                    "description": "Complete conversation history in format: [role]: [message]"
+                }
+            ],
+            system="You are a memory manager for crisis dispatch calls.",
+            model="openai/gpt-4o-mini",
+            embedding="openai/text-embedding-3-small"
+        )
+
+    def write_block(self, block_label: str, value: str) -> None:
+        """Write-behind target: called from the writer thread."""
+        if self.ended:
+            return
+        self.get_client().agents.blocks.modify(agent_id=self.agent_id, block_label=block_label, value=value)
+
+    def get_summary(self) -> str:
+        current_time = time.time()
+        # Use cache if it's fresh or Letta hasn't caught up with our last write yet
+        if self.summary_cache and ((current_time - self.summary_cache_time) < SUMMARY_TTL_S
+                                   or self.writer.is_pending(self, "call_history")):
+            return self.summary_cache
+        try:
+            block = self.get_client().agents.blocks.retrieve(agent_id=self.agent_id, block_label="call_history")
+            self.summary_cache = block.value if block else ""
+            self.summary_cache_time = current_time
+            return self.summary_cache
+        except Exception:
+            return ""
+
+    def set_summary(self, summary: str) -> None:
+        if self.ended:
+            return
+        self.summary_cache = summary
+        self.summary_cache_time = time.time()
+        self.writer.put(self, "call_history", summary)
+
+    def append_turn(self, role: str, message: str) -> None:
+        if self.ended:
+            return
+        with self._conversation_lock:
+            if self.transcript is None:
+                self.transcript = TurnStore()
+            self.transcript.append(role, message)
+            conversation = self.transcript.text()
+        self.writer.put(self, "full_conversation", conversation)
+
+    def set_conversation(self, conversation: str) -> None:
+        """Mirror hook: replace the whole transcript block (the local backend owns the transcript)."""
+        if not self.ended:
+            self.writer.put(self, "full_conversation", conversation)
+
+    def get_conversation(self) -> str:
+        if self.transcript is None:
+            try:
+                block = self.get_client().agents.blocks.retrieve(agent_id=self.agent_id, block_label="full_conversation")
+                prefix = block.value if block else ""
+            except Exception as e:
+                logger.warning(f"Failed to fetch conversation: {e}")
+                prefix = ""
+            with self._conversation_lock:
+                if self.transcript is None:
+                    self.transcript = TurnStore(prefix=prefix)
+        return self.transcript.text()
+
+    def restore(self, summary: str, turns: List[Tuple[str, str]]) -> None:
+        if self.ended:
+            return
+        self.set_summary(summary)
+        with self._conversation_lock:
+            self.transcript = TurnStore(turns)
+            conversation = self.transcript.text()
+        self.writer.put(self, "full_conversation", conversation)
+
+    def close(self, timeout: float = 10.0) -> bool:
+        return self.writer.flush(self, timeout=timeout)
+
+    def teardown(self, timeout: float = 10.0) -> bool:
+        flushed = self.close(timeout=timeout)
+        with self._agent_lock:
+            self.ended = True
+        cancelled = self.writer.cancel(self)
+        if cancelled:
+            logger.warning(f"Dropped {cancelled} Letta write(s) not flushed before teardown")
+        # A write already in flight must finish before its agent is deleted
+        self.writer.flush(self, timeout=timeout)
+        with self._agent_lock:
+            agent, self._agent = self._agent, None
+        if agent is not None and not LETTA_RETAIN_ENDED_CALLS:
+            try:
+                self.get_client().agents.delete(agent_id=agent.id)
+                metrics.incr("memory_backend.letta_agents_deleted")
+            except Exception as e:
+                logger.warning(f"Failed to delete Letta agent {agent.id}: {e}")
+        self.summary_cache = None
+        self.transcript = None
+        return flushed
+
+    def memory_bytes(self) -> int:
+        transcript = self.transcript
+        return (transcript.nbytes() if transcript is not None else 0) + len(self.summary_cache or "")
+
+
+# ── Local (in-memory + SQLite) ────────────────────────────────────────────────
+class SQLiteStore:
+    """
+    Process-wide SQLite (WAL) persistence for local call memory. Writes are queued
+    and committed in small groups by one background thread, off the hot path.
+    """
+
+    def __init__(self, path: str = MEMORY_DB_PATH):
+        self.path = path
+        self._queue: "queue.Queue[Optional[Tuple[str, tuple]]]" = queue.Queue()
+        self._idle = threading.Condition()
+        self._unwritten = 0
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS blocks (
+                call_id TEXT NOT NULL, label TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL,
+                PRIMARY KEY (call_id, label)
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                call_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, text TEXT NOT NULL, ts REAL NOT NULL,
+                PRIMARY KEY (call_id, seq)
+            );
+        """)
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _submit(self, sql: str, params: tuple) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sqlite-memory", daemon=True)
+                self._thread.start()
+        with self._idle:
+            self._unwritten += 1
+        self._queue.put((sql, params))
+
+    def set_block(self, call_id: str, label: str, value: str) -> None:
+        self._submit(
+            "INSERT INTO blocks (call_id, label, value, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(call_id, label) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (call_id, label, value, time.time()),
+        )
+
+    def append_turn(self, call_id: str, seq: int, role: str, text: str) -> None:
+        self._submit(
+            "INSERT OR REPLACE INTO turns (call_id, seq, role, text, ts) VALUES (?, ?, ?, ?, ?)",
+            (call_id, seq, role, text, time.time()),
+        )
+
+    def delete_call(self, call_id: str) -> None:
+        self._submit("DELETE FROM blocks WHERE call_id = ?", (call_id,))
+        self._submit("DELETE FROM turns WHERE call_id = ?", (call_id,))
+
+    def load_call(self, call_id: str) -> Tuple[Dict[str, str], List[Tuple[str, str]]]:
+        """Blocks and ordered (role, text) turns previously persisted for a call."""
+        conn = self._connect()
+        try:
+            blocks = dict(conn.execute("SELECT label, value FROM blocks WHERE call_id = ?", (call_id,)))
+            turns = list(conn.execute("SELECT role, text FROM turns WHERE call_id = ? ORDER BY seq", (call_id,)))
+        finally:
+            conn.close()
+        return blocks, turns
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        deadline = time.time() + timeout
+        with self._idle:
+            while self._unwritten:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def _run(self) -> None:
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.time() + SQLITE_COMMIT_INTERVAL_S
+            while True:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            write_start = time.time()
+            try:
+                with conn:
+                    for sql, params in batch:
+                        conn.execute(sql, params)
+            except sqlite3.Error as e:
+                logger.error(f"SQLite memory write failed ({len(batch)} statements): {e}")
+                metrics.incr("memory_backend.sqlite_errors")
+            metrics.observe("memory_backend.sqlite_commit_ms", (time.time() - write_start) * 1000)
+            with self._idle:
+                self._unwritten -= len(batch)
+                self._idle.notify_all()
+
+
+_sqlite_store: Optional[SQLiteStore] = None
+_sqlite_store_lock = threading.Lock()
+
+
+def get_sqlite_store(path: str = MEMORY_DB_PATH) -> SQLiteStore:
+    global _sqlite_store
+    with _sqlite_store_lock:
+        if _sqlite_store is None:
+            _sqlite_store = SQLiteStore(path)
+        return _sqlite_store
+
+
+class LocalMemoryBackend(MemoryBackend):
+    def __init__(self, call_id: str, store: Optional[SQLiteStore] = None, mirror: Optional[LettaMemoryBackend] = None):
+        self.call_id = call_id
+        self.store = store
+        self.mirror = mirror
+        self._lock = threading.Lock()
+        self.summary = ""
+        self.turns = TurnStore()
+        self.ended = False
+        if store is not None:
+            # Pick up where a previous process left off for this call id
+            blocks, turns = store.load_call(call_id)
+            self.summary = blocks.get("call_history", "")
+            self.turns = TurnStore(turns)
+
+    def get_summary(self) -> str:
+        return self.summary
+
+    def set_summary(self, summary: str) -> None:
+        with self._lock:
+            if self.ended:
+                return
+            self.summary = summary
+            if self.store is not None:
+                self.store.set_block(self.call_id, "call_history", summary)
+        if self.mirror is not None:
+            self.mirror.set_summary(summary)
+
+    @property
+    def turn_count(self) -> int:
+        return len(self.turns)
+
+    def append_turn(self, role: str, message: str) -> None:
+        with self._lock:
+            if self.ended:
+                return
+            seq = len(self.turns)
+            self.turns.append(role, message)
+            conversation = self.turns.text() if self.mirror is not None else None
+            if self.store is not None:
+                self.store.append_turn(self.call_id, seq, role, message)
+        if self.mirror is not None:
+            self.mirror.set_conversation(conversation)
+
+    def get_conversation(self) -> str:
+        with self._lock:
+            return self.turns.text()
+
+    def restore(self, summary: str, turns: List[Tuple[str, str]]) -> None:
+        # Only turns the store hasn't seen yet need persisting
+        with self._lock:
+            if self.ended:
+                return
+            persisted = len(self.turns)
+            self.summary = summary
+            self.turns = TurnStore(turns)
+            if self.store is not None:
+                self.store.set_block(self.call_id, "call_history", summary)
+                for seq in range(persisted, len(turns)):
+                    self.store.append_turn(self.call_id, seq, *turns[seq])
+        if self.mirror is not None:
+            self.mirror.restore(summary, turns)
+
+    def close(self, timeout: float = 10.0) -> bool:
+        ok = True
+        if self.store is not None:
+            ok = self.store.flush(timeout=timeout) and ok
+        if self.mirror is not None:
+            ok = self.mirror.close(timeout=timeout) and ok
+        return ok
+
+    def teardown(self, timeout: float = 10.0) -> bool:
+        with self._lock:
+            self.ended = True
+            self.summary = ""
+            self.turns = TurnStore()
+        ok = True
+        if self.store is not None:
+            # Queued behind the call's pending writes, so nothing re-inserts its rows
+            self.store.delete_call(self.call_id)
+            ok = self.store.flush(timeout=timeout)
+        if self.mirror is not None:
+            ok = self.mirror.teardown(timeout=timeout) and ok
+        return ok
+
+    def memory_bytes(self) -> int:
+        return self.turns.nbytes() + len(self.summary) + (self.mirror.memory_bytes() if self.mirror else 0)
@@ -0,0 +1,186 @@
+"""
+Single write-behind queue for Letta memory block updates.
+
+DispatcherAgent used to spawn a daemon thread per conversation/summary update and
+skip (or revert) writes while one was in flight. Instead, every update goes into
+one process-wide WriteBehindQueue: pending writes are coalesced per
+(target, block_label) so only the latest value is ever sent, a fixed number of
+writer threads drain the queue with retry and exponential backoff, and callers can
+flush() on call end or shutdown.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger("memory_writer")
+
+WRITER_THREADS = 1
+MAX_WRITE_ATTEMPTS = 5
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 10.0
+FLUSH_TIMEOUT_S = 10.0
+
+# (target, block_label); the target is whatever write_fn needs to address the
+# block, e.g. a LettaMemoryBackend that resolves its Letta agent id lazily
+BlockKey = Tuple[Hashable, str]
+
+
+@dataclass
+class _PendingWrite:
+    value: str
+    enqueued_at: float      # when the oldest unwritten value for this block was queued
+    attempts: int = 0
+    not_before: float = 0.0
+
+
+class WriteBehindQueue:
+    def __init__(self, write_fn: Callable[[Any, str, str], None], threads: int = WRITER_THREADS,
+                 max_attempts: int = MAX_WRITE_ATTEMPTS):
+        self.write_fn = write_fn
+        self.threads = threads
+        self.max_attempts = max_attempts
+        self._cond = threading.Condition()
+        self._pending: Dict[BlockKey, _PendingWrite] = {}
+        self._in_flight: Set[BlockKey] = set()
+        self._workers = []
+        self._stopping = False
+
+    def put(self, target: Hashable, block_label: str, value: str) -> None:
+        """Queue the latest value of a block; replaces any not-yet-written value."""
+        key = (target, block_label)
+        with self._cond:
+            self._ensure_started()
+            current = self._pending.get(key)
+            if current is not None:
+                current.value = value
+                metrics.incr("memory_writer.coalesced")
+            else:
+                self._pending[key] = _PendingWrite(value=value, enqueued_at=time.time())
+            metrics.gauge("memory_writer.queue_depth", len(self._pending))
+            self._cond.notify()
+
+    def is_pending(self, target: Hashable, block_label: str) -> bool:
+        key = (target, block_label)
+        with self._cond:
+            return key in self._pending or key in self._in_flight
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._pending) + len(self._in_flight)
+
+    def flush(self, target: Optional[Hashable] = None, timeout: float = FLUSH_TIMEOUT_S) -> bool:
+        """
+        Block until every pending write (or only those of target) has been written
+        or given up on. Backoff delays are skipped while flushing. Returns False on timeout.
+        """
+        deadline = time.time() + timeout
+
+        def outstanding():
+            keys = set(self._pending) | self._in_flight
+            return [k for k in keys if target is None or k[0] == target]
+
+        with self._cond:
+            for key, write in self._pending.items():
+                if target is None or key[0] == target:
+                    write.not_before = 0.0
+            self._cond.notify_all()
+            while outstanding():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    logger.warning(f"Flush timed out with {len(outstanding())} writes outstanding")
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def cancel(self, target: Hashable) -> int:
+        """Drop target's pending writes (writes already in flight still finish); returns how many."""
+        with self._cond:
+            keys = [key for key in self._pending if key[0] == target]
+            for key in keys:
+                del self._pending[key]
+            metrics.gauge("memory_writer.queue_depth", len(self._pending))
+            self._cond.notify_all()
+        metrics.incr("memory_writer.cancelled", len(keys))
+        return len(keys)
+
+    def shutdown(self, timeout: float = FLUSH_TIMEOUT_S) -> bool:
+        flushed = self.flush(timeout=timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        return flushed
+
+    def _ensure_started(self) -> None:
+        if self._workers:
+            return
+        for i in range(self.threads):
+            worker = threading.Thread(target=self._run, name=f"memory-writer-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _next_ready(self) -> Tuple[Optional[BlockKey], float]:
+        """Oldest ready write not already in flight, or (None, seconds until one is ready)."""
+        now = time.time()
+        ready, wait = None, 1.0
+        for key, write in self._pending.items():
+            if key in self._in_flight:
+                continue
+            if write.not_before <= now:
+                if ready is None or write.enqueued_at < self._pending[ready].enqueued_at:
+                    ready = key
+            else:
+                wait = min(wait, write.not_before - now)
+        return ready, wait
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                key, wait = self._next_ready()
+                while key is None:
+                    if self._stopping:
+                        return
+                    self._cond.wait(wait)
+                    key, wait = self._next_ready()
+                write = self._pending.pop(key)
+                self._in_flight.add(key)
+
+            target, block_label = key
+            try:
+                self.write_fn(target, block_label, write.value)
+                error = None
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                self._in_flight.discard(key)
+                if error is None:
+                    metrics.incr("memory_writer.writes")
+                    metrics.observe("memory_writer.write_lag_ms", (time.time() - write.enqueued_at) * 1000)
+                elif key in self._pending:
+                    # A newer value arrived while we were writing; it supersedes the retry
+                    self._pending[key].enqueued_at = write.enqueued_at
+                    metrics.incr("memory_writer.failures")
+                elif write.attempts + 1 >= self.max_attempts:
+                    logger.error(f"Giving up on {block_label} write for {target} after {self.max_attempts} attempts: {error}")
+                    metrics.incr("memory_writer.dropped")
+                else:
+                    write.attempts += 1
+                    write.not_before = time.time() + min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (write.attempts - 1))
+                    self._pending[key] = write
+                    metrics.incr("memory_writer.failures")
+                    logger.warning(f"Retrying {block_label} write for {target} (attempt {write.attempts + 1}): {error}")
+                metrics.gauge("memory_writer.queue_depth", len(self._pending))
+                self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self.depth(),
+            "write_lag_ms_p90": metrics.quantile("memory_writer.write_lag_ms", 90),
+            "coalesced": metrics.counter("memory_writer.coalesced"),
+            "dropped": metrics.counter("memory_writer.dropped"),
+        }
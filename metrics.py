@@ -0,0 +1,107 @@
+"""
+Process-wide counters and latency histograms.
+
+Every optimisation in the pipeline (speculation, batching, hedging, ...) reports
+into the shared ``metrics`` registry so buffer2.py can log one snapshot instead of
+each component inventing its own stats format.
+"""
+
+import threading
+from collections import deque
+from typing import Dict, Deque, Iterable
+
+HISTOGRAM_WINDOW = 2048  # samples kept per histogram (rolling)
+
+
+def percentile(samples, pct: float) -> float:
+    """Nearest-rank percentile of an iterable of numbers (0.0 if empty)."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[rank]
+
+
+class Metrics:
+    def __init__(self, window: int = HISTOGRAM_WINDOW):
+        self._lock = threading.Lock()
+        self._window = window
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._histograms: Dict[str, Deque[float]] = {}
+
+    def incr(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = deque(maxlen=self._window)
+            hist.append(value)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def sample_count(self, name: str) -> int:
+        with self._lock:
+            return len(self._histograms.get(name, ()))
+
+    def quantile(self, name: str, pct: float, default: float = 0.0) -> float:
+        with self._lock:
+            samples = list(self._histograms.get(name, ()))
+        return percentile(samples, pct) if samples else default
+
+    def export(self) -> Dict:
+        """Raw counters, gauges and histogram samples, for merging across processes."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {name: list(samples) for name, samples in self._histograms.items()},
+            }
+
+    @classmethod
+    def merged(cls, exports: Iterable[Dict], window: int = HISTOGRAM_WINDOW) -> "Metrics":
+        """One registry from several processes' exports: counters and gauges summed, samples pooled."""
+        exports = list(exports)
+        merged = cls(window=window * max(1, len(exports)))
+        for export in exports:
+            for name, value in export["counters"].items():
+                merged.incr(name, value)
+            for name, value in export["gauges"].items():
+                merged._gauges[name] = merged._gauges.get(name, 0) + value
+            for name, samples in export["histograms"].items():
+                for value in samples:
+                    merged.observe(name, value)
+        return merged
+
+    def snapshot(self) -> Dict:
+        """JSON-serialisable view of all counters, gauges and histogram summaries."""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {name: list(samples) for name, samples in self._histograms.items()}
+        return {
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": {
+                name: {
+                    "count": len(samples),
+                    "mean": sum(samples) / len(samples) if samples else 0.0,
+                    "p50": percentile(samples, 50),
+                    "p90": percentile(samples, 90),
+                    "p99": percentile(samples, 99),
+                }
+                for name, samples in histograms.items()
+            },
+        }
+
+
+metrics = Metrics()
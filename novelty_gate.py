@@ -0,0 +1,115 @@
+"""
+Cheap pre-LLM novelty gate.
+
+Backchannel turns ("okay", "uh-huh") and repeated confirmations ("yes, 123 Oak
+Street") add nothing to the call summary, yet each used to cost a full embedding +
+Pinecone + Groq cycle. NoveltyGate scores a consolidated chunk against the running
+transcript and summary with a few local signals and tells process_chunk_fast when
+it can skip the LLM and simply re-emit the current state.
+
+A chunk that answers the dispatcher's last question ("no" to "is he conscious?")
+or contains a negation ("he is not awake" after "he is awake") is never skipped:
+a one-word answer or a flipped fact can change the whole assessment.
+"""
+
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Set
+
+from metrics import metrics
+
+NOVELTY_THRESHOLD = 0.34      # fraction of content words never seen before in the call
+FILLER_RATIO_THRESHOLD = 0.8  # chunks that are (almost) all filler are skipped
+
+FILLER_WORDS = {
+    "ok", "okay", "k", "uh", "uhh", "um", "umm", "hmm", "mm", "mhm", "uh-huh", "alright", "sure", "got",
+    "it", "thanks", "thank", "you", "please", "hello", "hi", "hey", "so", "well", "like", "just", "oh", "ah",
+    "sorry", "huh", "i", "see", "understand",
+}
+STOP_WORDS = {
+    "a", "an", "the", "and", "or", "but", "is", "are", "was", "were", "be", "been", "am", "to", "of", "in",
+    "on", "at", "for", "with", "he", "she", "they", "we", "me", "my", "his", "her", "their", "our", "your",
+    "that", "this", "there", "here", "it's", "i'm", "he's", "she's", "they're", "we're", "you're", "do",
+    "does", "did", "have", "has", "had", "can", "will", "would", "should", "could", "now", "still",
+}
+# Words that always make a turn worth analysing, even if they were said before
+ALWAYS_RELEVANT = {
+    "breathing", "breathe", "unconscious", "unresponsive", "bleeding", "blood", "seizure", "overdose",
+    "pills", "gun", "knife", "weapon", "fire", "smoke", "suicide", "kill", "dying", "dead", "pain",
+    "chest", "collapsed", "choking", "cpr", "pulse", "worse", "stopped",
+}
+NEGATIONS = {"no", "not", "nope", "never", "none", "nothing", "nobody", "neither", "nor", "cannot"}
+DISPATCHER_ROLES = ("dispatcher", "agent")
+
+_NON_ENTITIES = FILLER_WORDS | STOP_WORDS
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9'-]*")
+_ENTITY_RE = re.compile(r"\b\d+\b|\b[A-Z][a-z]+\b")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words of `text`, keeping contractions and hyphenated words whole."""
+    return _WORD_RE.findall(text.lower())
+
+
+def _answers_question(prior_transcript: str) -> bool:
+    """The transcript so far ends with a question from the dispatcher."""
+    lines = prior_transcript.rstrip().rsplit("\n", 1)
+    role, _, text = lines[-1].partition(": ")
+    return role.strip().lower() in DISPATCHER_ROLES and text.rstrip().endswith("?")
+
+
+@dataclass
+class NoveltyScore:
+    novelty: float
+    filler_ratio: float
+    new_entities: int
+    skip: bool
+    reason: str
+    duration_ms: float
+
+
+class NoveltyGate:
+    def __init__(self, novelty_threshold: float = NOVELTY_THRESHOLD,
+                 filler_ratio_threshold: float = FILLER_RATIO_THRESHOLD, enabled: bool = True):
+        self.novelty_threshold = novelty_threshold
+        self.filler_ratio_threshold = filler_ratio_threshold
+        self.enabled = enabled
+
+    def score(self, chunk: str, prior_transcript: str, summary: str) -> NoveltyScore:
+        """Score `chunk` against what the call already contains (transcript before this chunk + summary)."""
+        start = time.time()
+        words = tokenize(chunk)
+        seen: Set[str] = set(tokenize(prior_transcript)) | set(tokenize(summary))
+        content = [w for w in words if w not in FILLER_WORDS and w not in STOP_WORDS]
+
+        filler_ratio = 1 - len(content) / len(words) if words else 1.0
+        novelty = sum(1 for w in content if w not in seen) / len(content) if content else 0.0
+        # Numbers and capitalised words (ages, house numbers, names, streets) not seen before
+        new_entities = sum(1 for e in _ENTITY_RE.findall(chunk) if e.lower() not in seen and e.lower() not in _NON_ENTITIES)
+        relevant = any(w in ALWAYS_RELEVANT for w in content)
+        negated = any(w in NEGATIONS or w.endswith("n't") for w in words)
+
+        if not self.enabled:
+            skip, reason = False, "disabled"
+        elif relevant or new_entities:
+            skip, reason = False, "relevant" if relevant else "new_entity"
+        elif negated:
+            skip, reason = False, "negation"
+        elif _answers_question(prior_transcript):
+            skip, reason = False, "answer"
+        elif filler_ratio >= self.filler_ratio_threshold:
+            skip, reason = True, "filler"
+        elif novelty < self.novelty_threshold:
+            skip, reason = True, "repeat"
+        else:
+            skip, reason = False, "novel"
+
+        duration_ms = (time.time() - start) * 1000
+        metrics.incr("novelty_gate.evaluated")
+        if skip:
+            metrics.incr("novelty_gate.skipped")
+            metrics.incr(f"novelty_gate.skipped.{reason}")
+            # What the skipped LLM call would have cost, from recent completions
+            metrics.incr("novelty_gate.llm_ms_saved", metrics.quantile("groq.completion_ms", 50))
+        return NoveltyScore(novelty, filler_ratio, new_entities, skip, reason, duration_ms)
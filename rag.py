@@ -1,15 +1,21 @@
 import os
 import time
 import logging
+from functools import lru_cache
 from glob import glob
 from typing import List, Tuple
 
 import tiktoken
-from openai import OpenAI, RateLimitError, APITimeoutError, APIError, APIConnectionError, InternalServerError
-from pinecone import Pinecone, ServerlessSpec
+from openai import RateLimitError, APITimeoutError, APIError, APIConnectionError, InternalServerError
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, before_sleep_log
 import dotenv
 
+import clients
+from ann_index import IVFInt8Index, recall_at_k, sample_queries
+from bm25 import BM25Index
+from incident_bundles import build_bundles
+from rate_governor import estimate_tokens, rate_governor
+
 dotenv.load_dotenv()
 logging.basicConfig(
     level=logging.INFO,
@@ -22,22 +28,31 @@ logger = logging.getLogger(__name__)
 OPENAI_EMBED_MODEL = "text-embedding-ada-002"
 EMBED_BATCH_SIZE     = 50
 UPSERT_BATCH_SIZE    = 50
-INDEX_NAME           = "subitis-guides"
-
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-pinecone_api_key = os.getenv("PINECONE_API_KEY")
-pc = Pinecone(api_key=pinecone_api_key)
-
-if INDEX_NAME not in pc.list_indexes().names():
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=1536,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
-    )
-index = pc.Index(INDEX_NAME)
-
-enc = tiktoken.get_encoding("cl100k_base")
+INGEST_QUOTA_WAIT_S  = 120.0   # ingestion can wait much longer for embedding quota than a live turn
+INDEX_NAME           = clients.PINECONE_INDEX_NAME
+BUILD_ANN_INDEX      = os.getenv("BUILD_ANN_INDEX", "0") == "1"   # also build the local IVF-int8 index (needs numpy)
+ANN_KEEP_EXACT       = os.getenv("ANN_KEEP_EXACT", "0") == "1"    # keep float32 vectors for rerank and recall checks
+ANN_RECALL_QUERIES   = 200
+ANN_RECALL_TOP_K     = 10
+
+def ensure_index():
+    """Create the Pinecone index if it doesn't exist yet and return a handle to it."""
+    from pinecone import ServerlessSpec
+
+    pc = clients.pinecone_client()
+    if INDEX_NAME not in pc.list_indexes().names():
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=1536,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region="us-east-1")
+        )
+    return clients.pinecone_index()
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    # Loading the BPE ranks may download them on first use, so not at import time
+    return tiktoken.get_encoding("cl100k_base")
 
 @retry(
     stop=stop_after_attempt(5),
@@ -46,7 +61,10 @@ enc = tiktoken.get_encoding("cl100k_base")
     before_sleep=before_sleep_log(logger, logging.WARNING)
 )
 def get_embeddings(texts: List[str]) -> List[List[float]]:
-    resp = openai_client.embeddings.create(
+    # Ingestion yields to live calls' embedding requests and paces itself to the quota
+    rate_governor.acquire(OPENAI_EMBED_MODEL, sum(estimate_tokens(t) for t in texts), "low",
+                          timeout=INGEST_QUOTA_WAIT_S)
+    resp = clients.openai_client().embeddings.create(
         model=OPENAI_EMBED_MODEL,
         input=texts
     )
@@ -55,6 +73,7 @@ def get_embeddings(texts: List[str]) -> List[List[float]]:
 def chunk_text(md: str, max_tokens: int = 500) -> List[str]:
     """Split markdown into chunks of ≤max_tokens (approx)."""
     paragraphs = md.split("\n\n")
+    enc = get_encoding()
     chunks, current = [], []
     curr_tokens = 0
 
@@ -79,7 +98,7 @@ def chunk_text(md: str, max_tokens: int = 500) -> List[str]:
         chunks.append("\n\n".join(current))
     return chunks
 
-def process_file(path: str):
+def process_file(path: str) -> List[Tuple[str, str, List[float]]]:
     text = open(path, encoding="utf-8").read()
     chunks = chunk_text(text, max_tokens=500)
     logger.info(f"{os.path.basename(path)} → {len(chunks)} chunks")
@@ -88,11 +107,13 @@ def process_file(path: str):
         (f"{os.path.splitext(os.path.basename(path))[0]}_chunk_{i}", chunk)
         for i, chunk in enumerate(chunks, 1)
     ]
+    embedded = []
 
     for i in range(0, len(items), EMBED_BATCH_SIZE):
         batch = items[i : i + EMBED_BATCH_SIZE]
         ids, texts = zip(*batch)
         embeddings = get_embeddings(list(texts))
+        embedded.extend(zip(ids, texts, embeddings))
 
         # Create vectors with metadata containing the actual text
         vectors = [
@@ -102,19 +123,51 @@ def process_file(path: str):
         
         for j in range(0, len(vectors), UPSERT_BATCH_SIZE):
             sub = vectors[j : j + UPSERT_BATCH_SIZE]
-            index.upsert(vectors=sub)
+            clients.pinecone_index().upsert(vectors=sub)
             logger.info(f"Upserted {len(sub)} vectors from {os.path.basename(path)}")
 
+    return embedded
+
+def build_guideline_bundles():
+    """Precompute the ranked passage bundle for each incident type from the live index."""
+    def query_fn(vector: List[float], top_k: int):
+        result = clients.pinecone_index().query(vector=vector, top_k=top_k, include_metadata=True)
+        return [
+            {"id": m["id"], "text": m["metadata"]["text"], "score": m["score"]}
+            for m in result["matches"]
+        ]
+
+    data = build_bundles(get_embeddings, query_fn)
+    for incident, bundle in data["bundles"].items():
+        logger.info(f"Bundle {incident}: {len(bundle['passages'])} passages")
+
 if __name__ == "__main__":
     start = time.time()
+    ensure_index()
     md_files = [
         "DC_Crisis_Line_Responder_Training_Manual_structured.md",
         "Dispatch_Training_Manual_structured.md"
     ]
     total = 0
+    all_chunks = []
 
     for md in md_files:
-        process_file(md)
+        all_chunks.extend(process_file(md))
         total += 1
 
     logger.info(f"✅ Indexed {total} files in {time.time() - start:.1f}s")
+
+    # Local lexical index over the same chunk ids, for hybrid retrieval in agent.py
+    BM25Index.build((id_val, text) for id_val, text, _ in all_chunks).save()
+    logger.info(f"Built BM25 index over {len(all_chunks)} chunks")
+
+    if BUILD_ANN_INDEX:
+        ids, texts, embeddings = zip(*all_chunks)
+        ann = IVFInt8Index.build(ids, texts, embeddings, keep_exact=ANN_KEEP_EXACT)
+        if ANN_KEEP_EXACT:
+            # Recall of the real index at the serving nprobe; ann_benchmark.py --index sweeps it
+            r = recall_at_k(ann, sample_queries(ann, ANN_RECALL_QUERIES), ANN_RECALL_TOP_K)
+            logger.info(f"ANN recall@{ANN_RECALL_TOP_K} at nprobe={ann.nprobe}: {r['recall']:.3f} "
+                        f"(mean {r['mean_ms']:.2f}ms, p90 {r['p90_ms']:.2f}ms)")
+
+    build_guideline_bundles()
@@ -0,0 +1,250 @@
+"""
+Process-wide request/token rate governor for Groq and OpenAI calls.
+
+Consolidation, advice and embedding calls from every worker thread used to hit
+the APIs independently, so a surge of calls ran into 429s (and the 15 s agent
+timeout) with nothing but rag.py's ingestion retrying. Every Groq completion and
+embedding request now acquires from RateGovernor first:
+
+- Per model, two token buckets refilled continuously: requests per minute and
+  tokens per minute. Prompt tokens are estimated with tiktoken before sending
+  (plus max_tokens for completions) and settled against actual usage afterwards.
+- A request that doesn't fit waits in a per-model queue ordered by its call's
+  criticality, instead of failing; only after MAX_QUEUE_WAIT_S does it give up
+  with RateLimitTimeout. Hedged duplicates never queue (try_acquire).
+- A 429 pauses the model for its retry-after so queued requests don't pile on.
+- headroom() reports remaining requests/tokens and queue length per model.
+
+Limits are per process. Under supervisor.py each worker gets RATE_LIMIT_SHARE =
+1/N of them, so the workers together stay within the account's quota.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fact_extractor import CRITICALITY_ORDER
+from metrics import metrics
+
+logger = logging.getLogger("rate_governor")
+
+RATE_LIMIT_SHARE = float(os.getenv("RATE_LIMIT_SHARE", "1.0"))   # fraction of the quota this process may use
+MAX_QUEUE_WAIT_S = 8.0          # give up (RateLimitTimeout) after waiting this long for quota
+DEFAULT_PRIORITY = "medium"
+DEFAULT_RETRY_AFTER_S = 2.0     # pause after a 429 without a retry-after header
+MESSAGE_OVERHEAD_TOKENS = 4     # role/separator tokens per chat message
+
+
+@dataclass
+class RateLimit:
+    requests_per_minute: float
+    tokens_per_minute: float
+
+
+# Account limits per model; set these from the provider dashboards. Models not
+# listed are not governed.
+RATE_LIMITS: Dict[str, RateLimit] = {
+    "meta-llama/llama-4-scout-17b-16e-instruct": RateLimit(1000, 300_000),
+    "llama-3.1-8b-instant": RateLimit(1000, 250_000),
+    "text-embedding-ada-002": RateLimit(3000, 1_000_000),
+}
+
+
+class RateLimitTimeout(TimeoutError):
+    pass
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:  # not installed, or the BPE ranks can't be fetched
+        logger.warning(f"tiktoken unavailable, estimating tokens from length: {e}")
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """cl100k token count (close enough for Llama's tokenizer), or ~4 chars per token without tiktoken."""
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_chat_tokens(messages: List[Dict], max_tokens: int = 0) -> int:
+    """Tokens a chat completion will count against TPM: prompt plus the completion allowance."""
+    return sum(estimate_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages) + max_tokens
+
+
+def _rank(priority: Optional[str]) -> int:
+    return CRITICALITY_ORDER.index(priority) if priority in CRITICALITY_ORDER else CRITICALITY_ORDER.index(DEFAULT_PRIORITY)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (a request larger than the bucket only needs a full one)."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= amount    # may go negative for oversized requests; refills pay the debt
+
+    def give(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+@dataclass
+class Reservation:
+    model: str
+    tokens: int
+
+
+class RateGovernor:
+    def __init__(self, limits: Dict[str, RateLimit] = RATE_LIMITS, share: float = RATE_LIMIT_SHARE,
+                 max_wait_s: float = MAX_QUEUE_WAIT_S):
+        self.limits = limits
+        self.share = share
+        self.max_wait_s = max_wait_s
+        self._cond = threading.Condition()
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self._waiters: Dict[str, List[Tuple[int, int]]] = {}    # model -> heap of (-priority rank, seq)
+        self._paused_until: Dict[str, float] = {}
+        self._seq = itertools.count()
+
+    def _model_buckets(self, model: str) -> Optional[Tuple[TokenBucket, TokenBucket]]:
+        buckets = self._buckets.get(model)
+        if buckets is None and model in self.limits:
+            limit = self.limits[model]
+            buckets = self._buckets[model] = (TokenBucket(limit.requests_per_minute * self.share),
+                                              TokenBucket(limit.tokens_per_minute * self.share))
+        return buckets
+
+    def _wait_time(self, model: str, tokens: int, now: float) -> float:
+        requests, token_bucket = self._buckets[model]
+        paused = self._paused_until.get(model, 0.0) - now
+        return max(paused, requests.wait_time(1, now), token_bucket.wait_time(tokens, now))
+
+    def _take(self, model: str, tokens: int) -> None:
+        requests, token_bucket = self._buckets[model]
+        requests.take(1)
+        token_bucket.take(tokens)
+        metrics.gauge(f"ratelimit.{model}.tpm_headroom", token_bucket.level)
+
+    def acquire(self, model: str, tokens: int, priority: Optional[str] = None,
+                timeout: Optional[float] = None) -> Reservation:
+        """
+        Block until one request of `tokens` fits `model`'s limits, serving waiters
+        in priority order. Raises RateLimitTimeout after `timeout` (default max_wait_s).
+        """
+        priority = priority if priority in CRITICALITY_ORDER else DEFAULT_PRIORITY
+        start = time.monotonic()
+        deadline = start + (self.max_wait_s if timeout is None else timeout)
+        with self._cond:
+            if self._model_buckets(model) is None:
+                return Reservation(model, 0)
+            ticket = (-_rank(priority), next(self._seq))
+            waiters = self._waiters.setdefault(model, [])
+            heapq.heappush(waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._wait_time(model, tokens, now) if waiters[0] == ticket else None
+                    if wait == 0.0:
+                        self._take(model, tokens)
+                        break
+                    if now >= deadline:
+                        metrics.incr(f"ratelimit.timeouts.{priority}")
+                        raise RateLimitTimeout(f"No {model} quota within {deadline - start:.1f}s")
+                    # Waiters behind the head sleep until it is served
+                    self._cond.wait(deadline - now if wait is None else min(wait, deadline - now))
+            finally:
+                waiters.remove(ticket)
+                heapq.heapify(waiters)
+                self._cond.notify_all()
+        waited_ms = (time.monotonic() - start) * 1000
+        metrics.observe(f"ratelimit.wait_ms.{priority}", waited_ms)
+        if waited_ms >= 1.0:
+            metrics.incr(f"ratelimit.throttled.{model}")
+        return Reservation(model, tokens)
+
+    def try_acquire(self, model: str, tokens: int) -> Optional[Reservation]:
+        """Take quota only if it is available now and nobody is queued for it."""
+        with self._cond:
+            if self._model_buckets(model) is None:
+                return Reservation(model, 0)
+            if self._waiters.get(model) or self._wait_time(model, tokens, time.monotonic()) > 0:
+                metrics.incr(f"ratelimit.declined.{model}")
+                return None
+            self._take(model, tokens)
+            return Reservation(model, tokens)
+
+    def settle(self, reservation: Reservation, actual_tokens: int) -> None:
+        """Correct the token bucket once the actual usage of a request is known."""
+        if not reservation.tokens:
+            return
+        with self._cond:
+            self._buckets[reservation.model][1].give(reservation.tokens - actual_tokens)
+            self._cond.notify_all()
+
+    def pause(self, model: str, retry_after_s: Optional[float] = None) -> None:
+        """The provider answered 429: hold back every request for `model` for retry_after_s."""
+        seconds = retry_after_s if retry_after_s is not None else DEFAULT_RETRY_AFTER_S
+        with self._cond:
+            self._paused_until[model] = max(self._paused_until.get(model, 0.0), time.monotonic() + seconds)
+        metrics.incr(f"ratelimit.429.{model}")
+        logger.warning(f"{model} rate limited by provider; pausing {seconds:.1f}s")
+
+    def report_error(self, model: str, error: BaseException) -> None:
+        """Pause the model if `error` is an HTTP 429 from the OpenAI or Groq SDK."""
+        if getattr(error, "status_code", None) != 429:
+            return
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                pass
+        self.pause(model, retry_after)
+
+    def headroom(self, models: Optional[Iterable[str]] = None) -> Dict:
+        """Requests and tokens available right now, and requests queued, per model."""
+        report = {}
+        now = time.monotonic()
+        with self._cond:
+            for model in models or list(self._buckets):
+                buckets = self._model_buckets(model)
+                if buckets is None:
+                    continue
+                requests, token_bucket = buckets
+                requests.wait_time(0, now)      # refill
+                token_bucket.wait_time(0, now)
+                report[model] = {
+                    "requests": int(requests.level),
+                    "tokens": int(token_bucket.level),
+                    "queued": len(self._waiters.get(model, ())),
+                    "paused_s": round(max(0.0, self._paused_until.get(model, 0.0) - now), 1),
+                }
+        return report
+
+
+# Shared by every Groq and embedding call in the process
+rate_governor = RateGovernor()
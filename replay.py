@@ -0,0 +1,163 @@
+"""
+Replay a traffic capture through buffer2's pipeline and report throughput and latency.
+
+Inbound messages of a capture (traffic_capture.py) are fed to buffer2.run_pipeline
+in process, at their recorded pace divided by --speed (--speed 0: as fast as
+possible). Fragment timestamps are rewritten to replay time so the turn budget
+starts when the fragment is replayed, and buffer2's flush interval is scaled by
+the speed so batches look like they did live. Outbound events are collected
+instead of sent.
+
+Backends are the real APIs unless --fake is given (fake_backends.py, with
+configurable latencies). Replays use a temporary memory DB and no call journal.
+
+    python replay.py capture.buffer2.jsonl.gz --speed 4 --fake --llm-ms 300
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from metrics import percentile
+
+MIN_REPLAY_BUFFER_S = 0.1   # flush interval floor when replaying faster than real time
+DRAIN_IDLE_S = 3.0          # after the last message, stop once no output has arrived for this long
+MAX_DRAIN_S = 120.0
+
+
+class _CollectingSender:
+    """Takes buffer2's outbound events in place of the WebSocket."""
+
+    def __init__(self):
+        self.events: List[Dict] = []
+        self.last_at = time.time()
+
+    async def send(self, data: str) -> None:
+        self.last_at = time.time()
+        self.events.append(json.loads(data))
+
+
+def _restamp(msg: Dict) -> Dict:
+    metadata = msg.get("metadata")
+    if not isinstance(metadata, dict) or "timestamp" not in metadata:
+        return msg
+    return dict(msg, metadata=dict(metadata, timestamp=str(int(time.time() * 1000))))
+
+
+async def replay(records, speed: float = 1.0, drain_idle_s: float = DRAIN_IDLE_S,
+                 max_drain_s: float = MAX_DRAIN_S) -> Dict:
+    """Feed the inbound records through the pipeline; returns the replay report."""
+    import buffer2
+
+    inbound = [(t, msg) for t, direction, msg in records if direction == "in"]
+    if speed > 0:
+        buffer2.BUFFER_INTERVAL = max(MIN_REPLAY_BUFFER_S, buffer2.BUFFER_INTERVAL / speed)
+    else:
+        buffer2.BUFFER_INTERVAL = MIN_REPLAY_BUFFER_S
+    sender = _CollectingSender()
+    timing = {}
+
+    # Captures taken before call ids were attributed per connection carry none
+    connection_call_id = buffer2.new_connection_call_id()
+
+    async def messages():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        timing["start"] = time.time()
+        for t, msg in inbound:
+            if speed > 0:
+                await asyncio.sleep(max(0.0, start + t / speed - loop.time()))
+            yield buffer2.attribute_to_connection(_restamp(msg), connection_call_id)
+        timing["fed"] = time.time()
+        # Let queued batches finish: stop once nothing is buffered or queued and
+        # output has been quiet for drain_idle_s
+        deadline = time.time() + max_drain_s
+        while time.time() < deadline:
+            await asyncio.sleep(0.2)
+            quiet_since = max(sender.last_at, timing["fed"] + buffer2.BUFFER_INTERVAL)
+            if not buffer2.raw_queue and not buffer2.task_queue.depth() and time.time() - quiet_since >= drain_idle_s:
+                break
+        timing["end"] = max(sender.last_at, timing["fed"])
+
+    async def no_reporter():
+        await asyncio.Event().wait()
+
+    await buffer2.run_pipeline(sender, messages(), reporter=no_reporter)
+    return build_report(inbound, sender.events, timing)
+
+
+def build_report(inbound, events: List[Dict], timing: Dict) -> Dict:
+    suggestions = [e["data"] for e in events if e.get("event") == "distribute_suggestions"]
+    final = [s for s in suggestions if not s.get("provisional")]
+    latencies, degraded = [], {}
+    for s in final:
+        for t in (s.get("raw_output") or {}).get("timings", []):
+            if t["operation"] == "capture_to_output":
+                latencies.append(t["duration_ms"])
+            elif t["operation"].startswith("degraded_"):
+                degraded[t["operation"]] = degraded.get(t["operation"], 0) + 1
+    feed_s = max(1e-9, timing["fed"] - timing["start"])
+    total_s = max(1e-9, timing["end"] - timing["start"])
+    return {
+        "messages": len(inbound),
+        "calls": len({s.get("call_id") for s in suggestions}),
+        "turns": len(final),
+        "provisional_updates": len(suggestions) - len(final),
+        "feed_s": round(feed_s, 2),
+        "total_s": round(total_s, 2),
+        "messages_per_s": round(len(inbound) / feed_s, 1),
+        "turns_per_s": round(len(final) / total_s, 2),
+        "capture_to_output_ms": {
+            "p50": round(percentile(latencies, 50), 1),
+            "p90": round(percentile(latencies, 90), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "over_1200": sum(1 for ms in latencies if ms > 1200),
+        },
+        "degraded": degraded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("capture", help="capture file written with TRAFFIC_CAPTURE (.jsonl or .jsonl.gz)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier; 0 = as fast as possible")
+    parser.add_argument("--fake", action="store_true", help="use fake OpenAI/Groq/Pinecone backends")
+    parser.add_argument("--llm-ms", type=float, default=None, help="fake Groq latency")
+    parser.add_argument("--embed-ms", type=float, default=None, help="fake embedding latency")
+    parser.add_argument("--vector-ms", type=float, default=None, help="fake Pinecone latency")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    # Before buffer2/agent are imported: keep replays out of the real memory DB and journal
+    os.environ.setdefault("MEMORY_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="replay_"), "memory.db"))
+    os.environ.setdefault("CALL_JOURNAL", "0")
+    if args.fake:
+        os.environ.setdefault("LETTA_MIRROR", "0")
+        import fake_backends
+        latencies = {k: v for k, v in (("llm_ms", args.llm_ms), ("embed_ms", args.embed_ms),
+                                       ("vector_ms", args.vector_ms)) if v is not None}
+        fake_backends.install(**latencies)
+
+    from traffic_capture import read_capture
+    header, records = read_capture(args.capture)
+    report = asyncio.run(replay(list(records), speed=args.speed))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    latency = report["capture_to_output_ms"]
+    print(f"Replayed {report['messages']} messages from {header.get('source')} capture "
+          f"({report['calls']} calls) at {'max' if args.speed <= 0 else f'{args.speed:g}x'} speed")
+    print(f"  feed {report['feed_s']}s ({report['messages_per_s']} msg/s), total {report['total_s']}s")
+    print(f"  turns {report['turns']} ({report['turns_per_s']}/s), provisional updates {report['provisional_updates']}")
+    print(f"  capture→output p50 {latency['p50']}ms  p90 {latency['p90']}ms  p99 {latency['p99']}ms  "
+          f"over 1.2s {latency['over_1200']}")
+    if report["degraded"]:
+        print(f"  degraded: {report['degraded']}")
+
+
+if __name__ == "__main__":
+    main()
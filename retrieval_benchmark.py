@@ -0,0 +1,68 @@
+"""
+Latency / recall benchmark for guideline retrieval modes (lexical, vector, hybrid).
+
+Runs a fixed set of dispatcher-style queries through HybridRetriever in each
+mode against the live Pinecone index and the local BM25 index (build both with
+`python rag.py` first). A query counts as recalled when any of its top-k
+passages mentions one of the expected terms.
+
+    python retrieval_benchmark.py [--top-k 3] [--repeat 3]
+"""
+
+import argparse
+import statistics
+import time
+
+from agent import hybrid_retriever
+from metrics import percentile
+
+# (query, terms a relevant protocol passage should mention)
+BENCHMARK_QUERIES = [
+    ("He's not breathing and I can't find a pulse, what do I do", ["cpr", "compressions"]),
+    ("Is there an AED nearby, they collapsed at the gym", ["aed", "defibrillator"]),
+    ("My friend took a bunch of pills and won't wake up", ["overdose", "poison"]),
+    ("I think it's fentanyl, do we have Narcan", ["naloxone", "narcan", "opioid"]),
+    ("There's a lot of blood from his leg after the crash", ["bleeding", "pressure", "tourniquet"]),
+    ("She's choking on food and turning blue", ["choking", "heimlich", "abdominal thrust"]),
+    ("I just don't want to be alive anymore", ["suicid", "risk", "safety"]),
+    ("He has a knife and is threatening people", ["weapon", "safety", "police"]),
+    ("My grandma fell down the stairs and hit her head", ["fall", "head", "spinal"]),
+    ("He's shaking all over on the floor, it's a seizure", ["seizure"]),
+    ("Chest pain going down his left arm, he's sweating", ["chest pain", "cardiac", "aspirin"]),
+    ("The caller won't give me the address, they keep hanging up", ["address", "location"]),
+]
+
+
+def run_mode(mode: str, top_k: int, repeat: int) -> dict:
+    latencies, hits = [], 0
+    for query, terms in BENCHMARK_QUERIES:
+        for i in range(repeat):
+            start = time.time()
+            passages, _ = hybrid_retriever.retrieve(query, top_k, mode=mode)
+            latencies.append((time.time() - start) * 1000)
+            if i == 0:
+                text = " ".join(p["text"] for p in passages).lower()
+                hits += any(term in text for term in terms)
+    return {
+        "mode": mode,
+        "recall": hits / len(BENCHMARK_QUERIES),
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'recall@' + str(args.top_k):>9} {'mean ms':>9} {'p50 ms':>9} {'p90 ms':>9}")
+    for mode in ("lexical", "vector", "hybrid"):
+        r = run_mode(mode, args.top_k, args.repeat)
+        print(f"{r['mode']:<8} {r['recall']:>9.2f} {r['mean_ms']:>9.1f} {r['p50_ms']:>9.1f} {r['p90_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
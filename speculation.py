@@ -0,0 +1,197 @@
+"""
+Speculative retrieval (and optionally advice) on interim transcripts.
+
+buffer2.py only hands the agent a consolidated utterance once per batch flush.
+The Speculator watches the interim fragments as they stream in, and whenever the
+in-progress caller utterance has grown enough it starts agent.speculate() on it in
+the background. When the batch is finally consolidated, claim() compares the final
+text with the speculated one: if they are close enough the speculative work is
+handed to process_chunk_fast, otherwise it is cancelled/discarded.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger("speculation")
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+SPEC_MIN_CHARS = 24          # don't speculate on utterances shorter than this
+SPEC_MIN_GROWTH_CHARS = 16   # re-speculate only once the utterance grew this much
+SPEC_DEBOUNCE_S = 0.4        # minimum spacing between speculative launches
+SPEC_RAG_THRESHOLD = 0.6     # similarity needed to reuse retrieved passages
+SPEC_ADVICE_THRESHOLD = 0.85 # similarity needed to reuse speculative advice
+SPEC_CLAIM_TIMEOUT_S = 2.0   # how long claim() waits for a still-running speculation
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def text_similarity(a: str, b: str) -> float:
+    """Jaccard similarity of lower-cased word sets (1.0 for identical texts)."""
+    wa = set(_WORD_RE.findall(a.lower()))
+    wb = set(_WORD_RE.findall(b.lower()))
+    if not wa and not wb:
+        return 1.0
+    if not wa or not wb:
+        return 0.0
+    return len(wa & wb) / len(wa | wb)
+
+
+def merge_fragment(current: str, fragment: str) -> str:
+    """
+    Fold an interim fragment into the in-progress utterance.
+
+    ASR interim results are usually cumulative revisions of the same utterance, so a
+    fragment that extends (or revises) the current text replaces it; anything else
+    is appended.
+    """
+    fragment = fragment.strip()
+    if not fragment:
+        return current
+    if not current or fragment.lower().startswith(current.lower()):
+        return fragment
+    if fragment.lower() in current.lower():
+        return current
+    return f"{current} {fragment}"
+
+
+@dataclass
+class Speculation:
+    text: str
+    role: str
+    started_at: float
+    future: Future
+    with_advice: bool
+
+
+class Speculator:
+    def __init__(self, agent, executor: Executor, speculate_advice: bool = False, role: str = "caller"):
+        self.agent = agent
+        self.executor = executor
+        self.speculate_advice = speculate_advice
+        self.role = role
+        self._utterance = ""
+        self._last_launch_len = 0
+        self._last_launch_at = 0.0
+        self._current: Optional[Speculation] = None
+        self._history: List[Speculation] = []
+
+    # ── Feeding fragments ────────────────────────────────────────────────────
+    def observe(self, msg: Dict) -> None:
+        """Called for every interim-transcription message as it arrives."""
+        role = msg.get('metadata', {}).get('role', 'unknown')
+        if role != self.role:
+            return
+        self._utterance = merge_fragment(self._utterance, msg.get('text', ''))
+        if len(self._utterance) < SPEC_MIN_CHARS:
+            return
+        now = time.time()
+        if len(self._utterance) - self._last_launch_len < SPEC_MIN_GROWTH_CHARS:
+            return
+        if now - self._last_launch_at < SPEC_DEBOUNCE_S:
+            return
+        self._launch(self._utterance, now)
+
+    def reset_utterance(self) -> None:
+        """Called when the buffer flushes; the next fragments start a new utterance."""
+        # Whatever arrived since the last (debounced) launch still gets a head start:
+        # it runs concurrently with the consolidation call.
+        if len(self._utterance) >= SPEC_MIN_CHARS and len(self._utterance) > self._last_launch_len:
+            self._launch(self._utterance, time.time())
+        self._utterance = ""
+        self._last_launch_len = 0
+        if self._current is not None:
+            self._history.append(self._current)
+            self._current = None
+
+    def _launch(self, text: str, now: float) -> None:
+        if self._current is not None:
+            self._cancel(self._current)
+        future = self.executor.submit(self.agent.speculate, text, self.role, self.speculate_advice)
+        self._current = Speculation(text, self.role, now, future, self.speculate_advice)
+        self._last_launch_len = len(text)
+        self._last_launch_at = now
+        metrics.incr("speculation.started")
+        logger.debug(f"Speculating on: {text[:40]}...")
+
+    def close(self) -> None:
+        """Call ended: drop every outstanding speculation."""
+        for spec in self._history + ([self._current] if self._current else []):
+            self._cancel(spec)
+        self._history = []
+        self._current = None
+        self._utterance = ""
+
+    def _cancel(self, spec: Speculation) -> None:
+        # A speculation that is already running can't be interrupted; it simply
+        # finishes in the background and its result is dropped.
+        spec.future.cancel()
+        metrics.incr("speculation.cancelled")
+
+    # ── Claiming results ─────────────────────────────────────────────────────
+    async def claim(self, final_text: str, role: str) -> Optional[Dict]:
+        """
+        Return reusable speculative work for the consolidated utterance, or None.
+
+        Only speculations on utterances already flushed (moved to the history by
+        reset_utterance) are candidates; the current one is on the next utterance.
+        The best match is awaited (bounded by SPEC_CLAIM_TIMEOUT_S); all others are
+        cancelled. Advice is stripped from the result unless the texts are similar
+        enough to trust it.
+        """
+        candidates = self._history
+        self._history = []
+        if role != self.role or not candidates:
+            for spec in candidates:
+                self._cancel(spec)
+            return None
+
+        best = max(candidates, key=lambda s: text_similarity(s.text, final_text))
+        similarity = text_similarity(best.text, final_text)
+        for spec in candidates:
+            if spec is not best:
+                self._cancel(spec)
+        if similarity < SPEC_RAG_THRESHOLD:
+            self._cancel(best)
+            metrics.incr("speculation.miss")
+            return None
+
+        wait_start = time.time()
+        try:
+            speculation = await asyncio.wait_for(asyncio.wrap_future(best.future), timeout=SPEC_CLAIM_TIMEOUT_S)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            metrics.incr("speculation.miss")
+            return None
+        except Exception as e:
+            logger.warning(f"Speculation failed: {e}")
+            metrics.incr("speculation.miss")
+            return None
+        wait_ms = (time.time() - wait_start) * 1000
+
+        saved_ms = speculation["rag_ms"]
+        if speculation.get("result") is not None and similarity >= SPEC_ADVICE_THRESHOLD:
+            saved_ms += speculation["groq_ms"]
+            metrics.incr("speculation.advice_hit")
+        else:
+            speculation = dict(speculation, result=None)
+        metrics.incr("speculation.hit")
+        metrics.observe("speculation.similarity", similarity)
+        metrics.observe("speculation.latency_saved_ms", max(0.0, saved_ms - wait_ms))
+        return speculation
+
+    @staticmethod
+    def stats() -> Dict:
+        """Process-wide speculation stats (all calls)."""
+        hits = metrics.counter("speculation.hit")
+        misses = metrics.counter("speculation.miss")
+        return {
+            "started": metrics.counter("speculation.started"),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "latency_saved_ms_p50": metrics.quantile("speculation.latency_saved_ms", 50),
+        }
@@ -0,0 +1,101 @@
+"""
+Startup-time budget check for every entry point.
+
+Each entry point is imported in a fresh interpreter with outbound connections and
+DNS lookups blocked and counted, then brought to first-turn readiness (a
+DispatcherAgent constructed for a new call) where that applies. Reports import
+time, readiness time and network attempts per entry point, and exits non-zero if
+any entry point touches the network at import or is over budget.
+
+    python startup_check.py [--import-budget-ms 1500] [--ready-budget-ms 2000]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+IMPORT_BUDGET_MS = 1500.0
+READY_BUDGET_MS = 2000.0
+
+# module -> statement that makes it ready to serve its first turn (None: import is enough)
+ENTRY_POINTS = {
+    "agent": "module.DispatcherAgent(call_id='startup-check')",
+    "buffer2": "module.get_session('startup-check')",
+    "conversation_simulator": "module.ConversationSimulator()",
+    "rag": None,
+    "main_websocket_server": None,
+    "groq_test": None,
+}
+
+_PROBE = r"""
+import importlib, json, socket, sys, time
+attempts = []
+def _blocked(name):
+    def guard(*args, **kwargs):
+        attempts.append(f"{name}{args[1:2] if name == 'connect' else args[:1]}")
+        raise ConnectionRefusedError("network disabled during startup check")
+    return guard
+socket.socket.connect = _blocked("connect")
+socket.getaddrinfo = _blocked("getaddrinfo")
+
+start = time.perf_counter()
+module = importlib.import_module(sys.argv[1])
+import_ms = (time.perf_counter() - start) * 1000
+import_attempts = len(attempts)
+error = None
+if sys.argv[2] != "None":
+    try:
+        eval(sys.argv[2])
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+ready_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({"import_ms": import_ms, "ready_ms": ready_ms, "import_network": import_attempts,
+                  "ready_network": len(attempts) - import_attempts, "error": error}))
+"""
+
+
+def probe(module: str, ready_stmt, workdir: str) -> dict:
+    env = dict(os.environ, CALL_JOURNAL="0", MEMORY_DB_PATH=os.path.join(workdir, f"{module}.db"))
+    proc = subprocess.run([sys.executable, "-c", _PROBE, module, str(ready_stmt)],
+                          capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        return {"error": (proc.stderr.strip().splitlines() or ["no output"])[-1]}
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--ready-budget-ms", type=float, default=READY_BUDGET_MS)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'entry point':<24} {'import ms':>10} {'ready ms':>10} {'net@import':>11} {'net@ready':>10}  status")
+    with tempfile.TemporaryDirectory() as workdir:
+        for module, ready_stmt in ENTRY_POINTS.items():
+            r = probe(module, ready_stmt, workdir)
+            if "import_ms" not in r:
+                print(f"{module:<24} {'-':>10} {'-':>10} {'-':>11} {'-':>10}  FAIL ({r['error']})")
+                failed = True
+                continue
+            problems = []
+            if r["import_network"]:
+                problems.append("network at import")
+            if r["import_ms"] > args.import_budget_ms:
+                problems.append("import over budget")
+            if r["ready_ms"] > args.ready_budget_ms:
+                problems.append("readiness over budget")
+            if r["error"]:
+                problems.append(r["error"])
+            failed = failed or bool(problems)
+            print(f"{module:<24} {r['import_ms']:>10.0f} {r['ready_ms']:>10.0f} {r['import_network']:>11} "
+                  f"{r['ready_network']:>10}  {'; '.join(problems) or 'ok'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
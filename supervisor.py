@@ -0,0 +1,289 @@
+"""
+Process-sharded buffer2: one supervisor process, several worker processes.
+
+buffer2.py runs every call's turns on a 3-thread pool inside one process, so JSON
+handling, prompt building and client overhead for all calls share one GIL. In
+supervisor mode this process holds the WebSocket and routes each message, by call
+id, to one of N worker processes; each worker runs buffer2's own pipeline
+(collector, processing workers, speculation) for the calls it owns.
+
+- Calls are placed with a consistent hash ring, so a call's session, speculator
+  and caches live in exactly one worker. Once placed, a call stays put until its
+  worker dies.
+- A dead worker is taken off the ring, its calls are moved to the surviving
+  workers and a replacement is started. The new owner recovers each moved call
+  from its journal (call_journal.recover_call) when the call's next message
+  arrives. Fragments still buffered in the dead worker are lost.
+- Workers push metrics.export() every METRICS_INTERVAL; the supervisor logs one
+  merged view (Metrics.merged) next to its own routing counters.
+
+    python supervisor.py [--workers 4]
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing as mp
+import os
+import queue
+import time
+from typing import Dict, List, Optional
+
+import websockets
+
+from metrics import Metrics, metrics
+from traffic_capture import recorder_from_env
+from turn_store import BoundedCache
+
+SUPERVISOR_WORKERS = int(os.getenv("SUPERVISOR_WORKERS", str(os.cpu_count() or 2)))
+RING_REPLICAS = 64              # virtual nodes per worker on the hash ring
+WORKER_CHECK_INTERVAL = 1.0     # seconds between liveness checks
+WORKER_STOP_TIMEOUT = 10.0      # grace period for workers to flush memory/journal on shutdown
+OUTBOX_POLL_S = 0.5
+ENDED_CALLS_REMEMBERED = 10000  # ended call ids whose late messages are dropped
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger("supervisor")
+
+
+# ── Consistent Hashing ────────────────────────────────────────────────────────
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring: removing a node only moves the keys that node owned."""
+
+    def __init__(self, nodes=(), replicas: int = RING_REPLICAS):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str) -> None:
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node: str) -> None:
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            if self._owners.pop(point, None) is not None:
+                self._points.remove(point)
+
+    def node_for(self, key: str) -> str:
+        if not self._points:
+            raise LookupError("hash ring is empty")
+        i = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[i]]
+
+
+# ── Worker Process ────────────────────────────────────────────────────────────
+class _QueueSender:
+    """Stands in for the WebSocket in a worker: replies go back through the supervisor."""
+
+    def __init__(self, outbox):
+        self.outbox = outbox
+
+    async def send(self, data: str) -> None:
+        self.outbox.put(("send", data))
+
+
+async def _inbox_messages(inbox):
+    loop = asyncio.get_running_loop()
+    while True:
+        msg = await loop.run_in_executor(None, inbox.get)
+        if msg is None:  # shutdown
+            return
+        yield msg
+
+
+def worker_main(worker_id: str, inbox, outbox) -> None:
+    """Entry point of a worker process: buffer2's pipeline fed from `inbox`."""
+    import buffer2
+    import clients
+
+    async def push_metrics():
+        while True:
+            await asyncio.sleep(buffer2.METRICS_INTERVAL)
+            outbox.put(("metrics", worker_id, metrics.export()))
+
+    async def run():
+        warmer = clients.connection_warmer()
+        await asyncio.get_running_loop().run_in_executor(None, warmer.warm_up)
+        warmer.start()
+        try:
+            await buffer2.run_pipeline(_QueueSender(outbox), _inbox_messages(inbox), reporter=push_metrics)
+        finally:
+            warmer.stop()
+            outbox.put(("metrics", worker_id, metrics.export()))
+
+    asyncio.run(run())
+
+
+# ── Supervisor ────────────────────────────────────────────────────────────────
+class Supervisor:
+    def __init__(self, workers: int = SUPERVISOR_WORKERS):
+        self.ctx = mp.get_context("spawn")
+        self.outbox = self.ctx.Queue()
+        self.processes: Dict[str, mp.Process] = {}
+        self.inboxes: Dict[str, mp.Queue] = {}
+        self.ring = HashRing()
+        self.assignments: Dict[str, str] = {}      # call id -> worker id, for calls seen so far
+        self.ended = BoundedCache(ENDED_CALLS_REMEMBERED)  # late messages for these are dropped
+        self.worker_metrics: Dict[str, Dict] = {}  # worker id -> latest metrics export
+        self._spawned = 0
+        # Workers inherit the environment: each may use 1/workers of the API quota
+        os.environ["RATE_LIMIT_SHARE"] = str(float(os.getenv("RATE_LIMIT_SHARE", "1.0")) / workers)
+        for _ in range(workers):
+            self.spawn()
+
+    def spawn(self) -> str:
+        worker_id = f"w{self._spawned}"
+        self._spawned += 1
+        inbox = self.ctx.Queue()
+        process = self.ctx.Process(target=worker_main, args=(worker_id, inbox, self.outbox),
+                                   name=f"buffer2-{worker_id}", daemon=True)
+        process.start()
+        self.processes[worker_id] = process
+        self.inboxes[worker_id] = inbox
+        self.ring.add(worker_id)
+        metrics.incr("supervisor.spawned")
+        logger.info(f"Started worker {worker_id} (pid {process.pid})")
+        return worker_id
+
+    def route(self, call_id: str) -> str:
+        worker_id = self.assignments.get(call_id)
+        if worker_id is None:
+            worker_id = self.assignments[call_id] = self.ring.node_for(call_id)
+        return worker_id
+
+    def dispatch(self, msg: Dict) -> None:
+        from buffer2 import CALL_END_EVENTS, call_id_of
+        call_id = call_id_of(msg)
+        if call_id is None or call_id in self.ended:
+            metrics.incr("supervisor.unrouted")
+            return
+        worker_id = self.route(call_id)
+        self.inboxes[worker_id].put(msg)
+        metrics.incr(f"supervisor.routed.{worker_id}")
+        if msg.get("event") in CALL_END_EVENTS:
+            self.assignments.pop(call_id, None)
+            self.ended[call_id] = True
+
+    def check_workers(self) -> List[str]:
+        """Replace dead workers and move their calls; returns the ids of the dead ones."""
+        dead = [w for w, p in self.processes.items() if not p.is_alive()]
+        for worker_id in dead:
+            process = self.processes.pop(worker_id)
+            self.inboxes.pop(worker_id).close()
+            self.ring.remove(worker_id)
+            metrics.incr("supervisor.worker_deaths")
+            logger.error(f"Worker {worker_id} died (exit code {process.exitcode})")
+            self.spawn()
+            moved = [c for c, w in self.assignments.items() if w == worker_id]
+            for call_id in moved:
+                self.assignments[call_id] = self.ring.node_for(call_id)
+            metrics.incr("supervisor.calls_moved", len(moved))
+            if moved:
+                logger.info(f"Moved {len(moved)} call(s) from {worker_id}: "
+                            + ", ".join(f"{c}->{self.assignments[c]}" for c in moved))
+        return dead
+
+    def merged_metrics(self) -> Metrics:
+        return Metrics.merged([metrics.export(), *self.worker_metrics.values()])
+
+    async def pump_outbox(self, ws) -> None:
+        """Forward worker replies to the WebSocket and collect their metrics."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                # Bounded wait so cancellation doesn't leave a thread blocked on the queue
+                item = await loop.run_in_executor(None, self.outbox.get, True, OUTBOX_POLL_S)
+            except queue.Empty:
+                continue
+            if item[0] == "send":
+                await ws.send(item[1])
+            elif item[0] == "metrics":
+                self.worker_metrics[item[1]] = item[2]
+
+    async def watch_workers(self) -> None:
+        while True:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+            self.check_workers()
+
+    async def report(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            calls_per_worker: Dict[str, int] = {w: 0 for w in self.processes}
+            for worker_id in self.assignments.values():
+                calls_per_worker[worker_id] = calls_per_worker.get(worker_id, 0) + 1
+            logger.info(f"Metrics (all workers): {json.dumps(self.merged_metrics().snapshot())}")
+            logger.info(f"Calls per worker: {calls_per_worker}")
+
+    def stop(self, timeout: float = WORKER_STOP_TIMEOUT) -> None:
+        for inbox in self.inboxes.values():
+            inbox.put(None)
+        deadline = time.time() + timeout
+        for worker_id, process in self.processes.items():
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                logger.warning(f"Worker {worker_id} did not stop in time; terminating")
+                process.terminate()
+        self._drain_outbox()
+
+    def _drain_outbox(self) -> None:
+        while True:
+            try:
+                item = self.outbox.get_nowait()
+            except queue.Empty:
+                return
+            if item[0] == "metrics":
+                self.worker_metrics[item[1]] = item[2]
+
+    async def run(self, url: Optional[str] = None) -> None:
+        from buffer2 import METRICS_INTERVAL, WS_URL, decode_messages, new_connection_call_id
+        url = url or WS_URL
+        recorder = recorder_from_env("supervisor")
+        async with websockets.connect(url) as ws:
+            logger.info(f"Connected to {url} with {len(self.processes)} worker processes")
+            # Workers end the connection's own call when they stop
+            messages = decode_messages(ws, new_connection_call_id())
+            if recorder is not None:
+                messages = recorder.tap(messages)
+            tasks = [
+                asyncio.create_task(self.pump_outbox(ws if recorder is None else recorder.wrap(ws))),
+                asyncio.create_task(self.watch_workers()),
+                asyncio.create_task(self.report(METRICS_INTERVAL)),
+            ]
+            try:
+                async for msg in messages:
+                    self.dispatch(msg)
+            except Exception as e:
+                logger.error(f"WebSocket error: {e}")
+            finally:
+                for t in tasks:
+                    t.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await asyncio.get_running_loop().run_in_executor(None, self.stop)
+                if recorder is not None:
+                    recorder.close()
+                logger.info(f"Final metrics (all workers): {json.dumps(self.merged_metrics().snapshot())}")
+
+
+# ── Entry Point ────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=SUPERVISOR_WORKERS)
+    parser.add_argument("--url", default=None, help="WebSocket URL (defaults to buffer2.WS_URL)")
+    args = parser.parse_args()
+    asyncio.run(Supervisor(workers=args.workers).run(args.url))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+from advice_filter import AdviceMemory, shingles, signature
+
+
+def test_shingles_drop_advice_phrasing_and_stem():
+    assert shingles("You should ask the caller whether he is breathing") == {"breath"}
+
+
+def test_identical_features_give_identical_signatures():
+    assert signature({"cpr", "chest", "compress"}) == signature({"compress", "chest", "cpr"})
+
+
+def test_rephrased_bullet_is_a_repeat():
+    memory = AdviceMemory()
+    memory.filter(["Start chest compressions now"])
+    kept, repeats = memory.filter(["Tell the caller to start chest compressions"])
+    assert kept == []
+    assert repeats == ["Tell the caller to start chest compressions"]
+
+
+def test_different_bullet_is_kept():
+    memory = AdviceMemory()
+    memory.filter(["Start chest compressions now"])
+    kept, repeats = memory.filter(["Unlock the front door for responders"])
+    assert kept == ["Unlock the front door for responders"]
+    assert repeats == []
+
+
+def test_negation_is_not_a_repeat():
+    memory = AdviceMemory()
+    memory.filter(["Move him onto his back"])
+    kept, _ = memory.filter(["Do not move him"])
+    assert kept == ["Do not move him"]
+
+
+def test_threshold_decides_partial_overlap():
+    # Half the content words shared: estimated Jaccard near 1/3
+    earlier, bullet = "Check airway breathing pulse", "Check airway bleeding wound"
+    lenient, strict = AdviceMemory(threshold=0.9), AdviceMemory(threshold=0.1)
+    for memory in (lenient, strict):
+        memory.filter([earlier])
+    assert lenient.filter([bullet])[0] == [bullet]
+    assert strict.filter([bullet])[1] == [bullet]
+
+
+def test_repeat_within_one_turn_is_dropped():
+    kept, repeats = AdviceMemory().filter(["Apply pressure to the wound", "Apply firm pressure to wound"])
+    assert kept == ["Apply pressure to the wound"]
+    assert repeats == ["Apply firm pressure to wound"]
+
+
+def test_bullet_without_content_words_is_kept():
+    memory = AdviceMemory()
+    assert memory.filter(["Okay"])[0] == ["Okay"]
+    assert memory.filter(["Okay"])[0] == ["Okay"]
+    assert len(memory) == 0
+
+
+def test_remember_restores_history():
+    memory = AdviceMemory()
+    memory.remember(["Start chest compressions now"])
+    assert memory.filter(["Start chest compressions"])[1] == ["Start chest compressions"]
@@ -0,0 +1,53 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from ann_index import IVFInt8Index, exact_search, quantize_int8, recall_at_k, sample_queries  # noqa: E402
+
+
+def clustered(n=2000, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    return centers[rng.integers(clusters, size=n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    vectors = clustered()
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    texts = [f"text of chunk {i} — ünïcode" for i in range(len(vectors))]
+    return IVFInt8Index.build(ids, texts, vectors, path=str(tmp_path_factory.mktemp("ann")), nlist=32,
+                              keep_exact=True)
+
+
+def test_int8_codes_round_trip_closely():
+    vectors = clustered(n=50)
+    codes, scales = quantize_int8(vectors)
+    assert np.abs(codes * scales[:, None] - vectors).max() <= scales.max() / 2 + 1e-6
+
+
+def test_recall_rises_with_nprobe(index):
+    queries = sample_queries(index, 50)
+    low = recall_at_k(index, queries, top_k=10, nprobe=1)["recall"]
+    high = recall_at_k(index, queries, top_k=10, nprobe=16)["recall"]
+    assert high >= low
+    assert high >= 0.9
+
+
+def test_rerank_matches_exact_search_when_every_list_is_probed(index):
+    query = sample_queries(index, 1, seed=3)[0]
+    truth = [index.ids[row] for row in exact_search(index.exact, query, 5)]
+    assert [doc_id for doc_id, _ in index.search(query, 5, nprobe=32, rerank=4)] == truth
+
+
+def test_texts_are_read_by_id(index):
+    assert index.text("chunk-1234") == "text of chunk 1234 — ünïcode"
+    assert index.text("chunk-0") == "text of chunk 0 — ünïcode"
+    assert index.text("missing") is None
+    assert len(index) == 2000
+
+
+def test_index_reloads_from_disk(index):
+    reloaded = IVFInt8Index(index.path)
+    query = sample_queries(index, 1, seed=5)[0]
+    assert reloaded.search(query, 10) == index.search(query, 10)
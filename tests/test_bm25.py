@@ -0,0 +1,49 @@
+import pytest
+
+from bm25 import RRF_K, BM25Index, reciprocal_rank_fusion
+
+DOCS = [
+    ("cpr", "Start CPR: push hard and fast in the centre of the chest"),
+    ("aed", "Send someone to fetch the AED and switch it on"),
+    ("bleeding", "Apply firm pressure to the bleeding wound with a clean cloth"),
+    ("choking", "Give five back blows, then five abdominal thrusts for choking"),
+]
+
+
+@pytest.fixture
+def index():
+    return BM25Index.build(DOCS)
+
+
+def test_keyword_query_finds_its_chunk(index):
+    assert index.search("he needs CPR now")[0][0] == "cpr"
+    assert index.search("where is the AED")[0][0] == "aed"
+
+
+def test_stop_words_and_unknown_terms_match_nothing(index):
+    assert index.search("the and of") == []
+    assert index.search("zebra") == []
+
+
+def test_rare_terms_outweigh_common_ones():
+    index = BM25Index.build(DOCS + [("pressure", "pressure pressure pressure")])
+    assert index.idf("aed") > index.idf("pressure")
+
+
+def test_round_trip_through_file(index, tmp_path):
+    path = str(tmp_path / "bm25.json")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.search("bleeding wound") == index.search("bleeding wound")
+    assert loaded.text("aed") == DOCS[1][1]
+
+
+def test_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"], ["b", "d"]])
+    assert [doc_id for doc_id, _ in fused][:2] == ["b", "a"]
+    assert dict(fused)["b"] == pytest.approx(2 / (RRF_K + 1) + 1 / (RRF_K + 2))
+
+
+def test_rank_fusion_of_one_list_keeps_its_order():
+    assert [doc_id for doc_id, _ in reciprocal_rank_fusion([["x", "y", "z"]])] == ["x", "y", "z"]
+    assert reciprocal_rank_fusion([]) == []
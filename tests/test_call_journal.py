@@ -0,0 +1,82 @@
+import os
+
+from call_journal import CallJournal, decode_records, encode_record, recover_call, recover_calls
+
+
+def _journal(tmp_path):
+    return CallJournal(directory=str(tmp_path), fsync_interval_s=0.01)
+
+
+def test_records_round_trip():
+    data = encode_record({"t": "turn", "role": "caller", "text": "help"}) + encode_record({"t": "end"})
+    records, consumed = decode_records(data)
+    assert [r["t"] for r in records] == ["turn", "end"]
+    assert consumed == len(data)
+
+
+def test_torn_tail_is_not_decoded():
+    whole = encode_record({"t": "turn", "role": "caller", "text": "help"})
+    records, consumed = decode_records(whole + encode_record({"t": "end"})[:-2])
+    assert len(records) == 1
+    assert consumed == len(whole)
+
+
+def test_recovers_live_call(tmp_path):
+    journal = _journal(tmp_path)
+    journal.append("call-1", {"t": "turn", "role": "caller", "text": "my dad collapsed"})
+    journal.append("call-1", {"t": "summary", "value": "• Patient collapsed", "fields": {"notes": ["collapsed"]}})
+    journal.append("call-1", {"t": "advice", "advice": ["Start CPR"], "patient_age": 67,
+                              "criticality_level": "critical"})
+    assert journal.flush(timeout=5)
+
+    state = recover_calls(str(tmp_path))["call-1"]
+    assert state.turns == [("caller", "my dad collapsed")]
+    assert state.summary == "• Patient collapsed"
+    assert state.summary_fields == {"notes": ["collapsed"]}
+    assert state.advice_history == [["Start CPR"]]
+    assert state.patient_age == 67
+    assert state.criticality_level == "critical"
+
+
+def test_ended_call_is_not_recovered(tmp_path):
+    journal = _journal(tmp_path)
+    journal.append("call-1", {"t": "turn", "role": "caller", "text": "fire"})
+    journal.append("call-2", {"t": "turn", "role": "caller", "text": "flood"})
+    journal.end_call("call-1")
+    assert journal.flush(timeout=5)
+
+    assert set(recover_calls(str(tmp_path))) == {"call-2"}
+    assert recover_call("call-1", str(tmp_path)) is None
+
+
+def test_recovery_stops_at_torn_record(tmp_path):
+    journal = _journal(tmp_path)
+    journal.append("call-1", {"t": "turn", "role": "caller", "text": "first"})
+    journal.append("call-1", {"t": "turn", "role": "caller", "text": "second"})
+    assert journal.flush(timeout=5)
+    segment = os.path.join(str(tmp_path), "call-1", "00000000.seg")
+    with open(segment, "r+b") as f:
+        f.truncate(os.path.getsize(segment) - 3)
+
+    assert recover_call("call-1", str(tmp_path)).turns == [("caller", "first")]
+
+
+def test_segments_rotate_and_recover_in_order(tmp_path):
+    journal = CallJournal(directory=str(tmp_path), segment_max_bytes=64, fsync_interval_s=0.01)
+    for i in range(10):
+        journal.append("call-1", {"t": "turn", "role": "caller", "text": f"fragment {i}"})
+    assert journal.flush(timeout=5)
+
+    assert len(os.listdir(os.path.join(str(tmp_path), "call-1"))) > 1
+    assert [text for _, text in recover_call("call-1", str(tmp_path)).turns] == [f"fragment {i}" for i in range(10)]
+
+
+def test_appends_after_end_are_ignored(tmp_path):
+    journal = _journal(tmp_path)
+    journal.append("call-1", {"t": "turn", "role": "caller", "text": "fire"})
+    journal.end_call("call-1")
+    journal.append("call-1", {"t": "advice", "advice": ["late"]})
+    assert journal.flush(timeout=5)
+
+    assert not os.path.exists(os.path.join(str(tmp_path), "call-1"))
+    assert recover_calls(str(tmp_path)) == {}
@@ -0,0 +1,86 @@
+from call_summary import MAX_LIST_ITEMS, CallSummary
+
+
+def summary_with_symptoms():
+    return CallSummary(symptoms=["a pain", "b cough", "c fever"])
+
+
+def test_scalar_set_and_remove():
+    summary = CallSummary()
+    changes = summary.apply([{"op": "set", "field": "location", "value": "12 Oak St"}])
+    assert summary.location == "12 Oak St"
+    assert changes == [{"op": "set", "field": "location", "value": "12 Oak St", "previous": None}]
+    summary.apply([{"op": "remove", "field": "location"}])
+    assert summary.location == ""
+
+
+def test_add_skips_duplicates():
+    summary = summary_with_symptoms()
+    assert summary.apply([{"op": "add", "field": "symptoms", "value": "B Cough"}]) == []
+    assert summary.symptoms == ["a pain", "b cough", "c fever"]
+
+
+def test_indices_refer_to_the_pre_turn_numbering():
+    summary = summary_with_symptoms()
+    summary.apply([{"op": "remove", "field": "symptoms", "index": 1},
+                   {"op": "update", "field": "symptoms", "index": 2, "value": "b wet cough"}])
+    assert summary.symptoms == ["b wet cough", "c fever"]
+
+
+def test_removes_apply_highest_index_first():
+    summary = summary_with_symptoms()
+    changes = summary.apply([{"op": "remove", "field": "symptoms", "index": 1},
+                             {"op": "remove", "field": "symptoms", "index": 2}])
+    assert summary.symptoms == ["c fever"]
+    assert sorted(c["previous"] for c in changes) == ["a pain", "b cough"]
+
+
+def test_duplicate_remove_is_ignored():
+    summary = summary_with_symptoms()
+    summary.apply([{"op": "remove", "field": "symptoms", "index": 1},
+                   {"op": "remove", "field": "symptoms", "index": "1"}])
+    assert summary.symptoms == ["b cough", "c fever"]
+
+
+def test_add_then_update_by_pre_turn_index():
+    summary = summary_with_symptoms()
+    summary.apply([{"op": "add", "field": "symptoms", "value": "d rash"},
+                   {"op": "remove", "field": "symptoms", "index": 1},
+                   {"op": "update", "field": "symptoms", "index": 3, "value": "c high fever"}])
+    assert summary.symptoms == ["b cough", "c high fever", "d rash"]
+
+
+def test_items_found_by_text():
+    summary = summary_with_symptoms()
+    summary.apply([{"op": "update", "field": "symptoms", "old": "cough", "value": "b dry cough"},
+                   {"op": "remove", "field": "symptoms", "value": "c fever"}])
+    assert summary.symptoms == ["a pain", "b dry cough"]
+
+
+def test_list_is_capped_after_removals():
+    summary = CallSummary(notes=[f"note {i}" for i in range(MAX_LIST_ITEMS)])
+    summary.apply([{"op": "remove", "field": "notes", "index": 1},
+                   {"op": "add", "field": "notes", "value": "latest"}])
+    assert len(summary.notes) == MAX_LIST_ITEMS
+    assert summary.notes[0] == "note 1" and summary.notes[-1] == "latest"
+
+
+def test_invalid_ops_are_ignored():
+    summary = summary_with_symptoms()
+    assert summary.apply(["not an op", {"op": "update", "field": "symptoms", "index": 9, "value": "x"},
+                          {"op": "add", "field": "unknown", "value": "x"}]) == []
+    assert summary.symptoms == ["a pain", "b cough", "c fever"]
+
+
+def test_round_trip_through_dict():
+    summary = summary_with_symptoms()
+    summary.patient = "45 M"
+    assert CallSummary.from_dict(summary.to_dict()) == summary
+
+
+def test_version_changes_only_with_the_summary():
+    summary = summary_with_symptoms()
+    summary.apply([{"op": "add", "field": "symptoms", "value": "a pain"}])
+    assert summary.version == 0
+    summary.apply([{"op": "set", "field": "patient", "value": "45 M"}])
+    assert summary.version == 1
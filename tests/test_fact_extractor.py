@@ -0,0 +1,53 @@
+import pytest
+
+from fact_extractor import ExtractedFacts, extract_facts, max_criticality
+
+
+def test_age_address_and_name():
+    facts = extract_facts("This is Maria, my father is 67 years old, we're at 42 Elm Street")
+    assert facts.patient_age == 67
+    assert facts.address == "42 Elm Street"
+    assert facts.caller_name == "Maria"
+
+
+@pytest.mark.parametrize("text", ["It's bad", "it's Tuesday", "I'm Not sure"])
+def test_common_phrases_are_not_names(text):
+    assert extract_facts(text).caller_name is None
+
+
+@pytest.mark.parametrize("text, level", [
+    ("he's not breathing", "critical"),
+    ("there's no pulse", "critical"),
+    ("my dad has chest pain", "high"),
+    ("he isn't bleeding but he collapsed", "high"),
+])
+def test_asserted_red_flags(text, level):
+    assert extract_facts(text).criticality_level == level
+
+
+@pytest.mark.parametrize("text", [
+    "Is there a gun in the house?",
+    "Is she unresponsive?",
+    "is he breathing",
+    "No, no chest pain, he is not unconscious",
+    "she doesn't have a seizure",
+    "he never collapsed",
+])
+def test_questions_and_negations_are_not_red_flags(text):
+    facts = extract_facts(text)
+    assert facts.red_flags == []
+    assert facts.criticality_level is None
+
+
+def test_merge_reports_only_new_facts():
+    known = ExtractedFacts()
+    known.merge(extract_facts("he is 67 and has chest pain"))
+    new = known.merge(extract_facts("he has chest pain and he's not breathing"))
+    assert new.red_flags == ["not breathing"]
+    assert new.patient_age is None
+    assert known.criticality_level == "critical"
+
+
+def test_max_criticality_ignores_unknown_levels():
+    assert max_criticality("low", None, "high", "bogus") == "high"
+    assert max_criticality(None) is None
@@ -0,0 +1,85 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from hedging import HedgedGroq
+from rate_governor import Reservation
+
+
+class RecordingGovernor:
+    def __init__(self):
+        self.settled = []
+
+    def acquire(self, model, tokens, priority=None, timeout=None):
+        return Reservation(model, tokens)
+
+    def try_acquire(self, model, tokens):
+        return Reservation(model, tokens)
+
+    def settle(self, reservation, actual_tokens):
+        self.settled.append((reservation.model, actual_tokens))
+
+    def report_error(self, model, error):
+        pass
+
+
+def chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class StalledStream:
+    """Never yields until closed, like a connection that stopped sending."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        self.closed.wait(30)
+        raise ConnectionError("stream closed")
+
+    def close(self):
+        self.closed.set()
+
+
+class Client:
+    def __init__(self, stalled_model):
+        self.stalled_model = stalled_model
+        self.stalled = StalledStream()
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, stream, timeout, **kwargs):
+        self.requests.append((model, timeout))
+        return self.stalled if model == self.stalled_model else iter([chunk("ok")])
+
+
+def hedger(client, governor):
+    return HedgedGroq(lambda: client, fallback_model="small", min_delay_ms=10, max_delay_ms=10,
+                      deadline_s=5.0, governor=governor)
+
+
+def test_losing_stream_is_closed_and_settled_at_once():
+    client, governor = Client(stalled_model="big"), RecordingGovernor()
+    content, info = hedger(client, governor).create("big", [{"role": "user", "content": "help"}])
+
+    assert content == "ok"
+    assert info["winner"] == "hedge" and info["model"] == "small"
+    assert client.stalled.closed.is_set()
+    assert sorted(model for model, _ in governor.settled) == ["big", "small"]
+    assert all(0 < timeout <= 5.0 for _, timeout in client.requests)
+
+
+def test_no_downgrade_hedges_on_the_same_model():
+    client, governor = Client(stalled_model=None), RecordingGovernor()
+
+    def create(model, messages, stream, timeout, **kwargs):
+        client.requests.append((model, timeout))
+        if len(client.requests) == 1:
+            time.sleep(0.2)     # slow primary
+        return iter([chunk("ok")])
+
+    client.chat.completions.create = create
+    _, info = hedger(client, governor).create("big", [{"role": "user", "content": "help"}], downgrade=False)
+
+    assert info["hedged"]
+    assert [model for model, _ in client.requests] == ["big", "big"]
@@ -0,0 +1,80 @@
+import threading
+from types import SimpleNamespace
+
+from memory_backend import LettaMemoryBackend, LocalMemoryBackend, SQLiteStore
+from memory_writer import WriteBehindQueue
+
+
+class FakeLetta:
+    def __init__(self, write_gate: threading.Event = None):
+        self.created, self.deleted, self.writes = [], [], []
+        self.write_gate = write_gate
+        self.agents = SimpleNamespace(create=self._create, delete=self._delete,
+                                      blocks=SimpleNamespace(modify=self._modify))
+
+    def _create(self, **kwargs):
+        agent = SimpleNamespace(id=f"agent-{len(self.created)}")
+        self.created.append(agent.id)
+        return agent
+
+    def _delete(self, agent_id):
+        self.deleted.append(agent_id)
+
+    def _modify(self, agent_id, block_label, value):
+        if self.write_gate is not None:
+            self.write_gate.wait(5)
+        self.writes.append((agent_id, block_label, value))
+
+
+def _letta(client):
+    writer = WriteBehindQueue(lambda target, label, value: target.write_block(label, value))
+    return LettaMemoryBackend(lambda: client, writer), writer
+
+
+def test_local_teardown_deletes_rows(tmp_path):
+    store = SQLiteStore(str(tmp_path / "memory.db"))
+    memory = LocalMemoryBackend("call-1", store=store)
+    memory.set_summary("• Chest pain")
+    memory.append_turn("caller", "he is clutching his chest")
+    assert memory.close(timeout=5)
+    assert store.load_call("call-1") == ({"call_history": "• Chest pain"},
+                                         [("caller", "he is clutching his chest")])
+
+    assert memory.teardown(timeout=5)
+    assert store.load_call("call-1") == ({}, [])
+
+
+def test_local_writes_after_teardown_are_ignored(tmp_path):
+    store = SQLiteStore(str(tmp_path / "memory.db"))
+    memory = LocalMemoryBackend("call-1", store=store)
+    memory.teardown(timeout=5)
+    memory.set_summary("• late")
+    memory.append_turn("caller", "late")
+    assert store.flush(timeout=5)
+    assert store.load_call("call-1") == ({}, [])
+    assert memory.get_summary() == ""
+
+
+def test_letta_teardown_deletes_agent():
+    client = FakeLetta()
+    memory, _ = _letta(client)
+    memory.set_summary("• Fire in kitchen")
+    assert memory.teardown(timeout=5)
+    assert client.created == ["agent-0"]
+    assert client.deleted == ["agent-0"]
+
+
+def test_letta_write_queued_past_flush_timeout_does_not_recreate_agent():
+    gate = threading.Event()
+    client = FakeLetta(write_gate=gate)
+    memory, writer = _letta(client)
+    memory.set_summary("• first")
+    memory.append_turn("caller", "second")
+    # The first write blocks in Letta, so the flush times out with the second still queued
+    threading.Timer(0.3, gate.set).start()
+    assert not memory.teardown(timeout=0.1)
+    memory.set_summary("• after teardown")
+    assert writer.flush(timeout=5)
+    assert client.created == ["agent-0"]
+    assert client.deleted == ["agent-0"]
+    assert all(value != "• after teardown" for _, _, value in client.writes)
@@ -0,0 +1,61 @@
+from novelty_gate import NoveltyGate
+
+TRANSCRIPT = (
+    "caller: my husband fell off the ladder at 42 Elm Street\n"
+    "dispatcher: okay, help is on the way\n"
+)
+
+
+def score(chunk, prior=TRANSCRIPT, summary=""):
+    return NoveltyGate().score(chunk, prior, summary)
+
+
+def test_backchannel_is_skipped():
+    result = score("okay uh-huh thank you")
+    assert result.skip and result.reason == "filler"
+
+
+def test_repeated_confirmation_is_skipped():
+    result = score("fell off the ladder, Elm Street")
+    assert result.skip and result.reason == "repeat"
+
+
+def test_new_facts_are_not_skipped():
+    result = score("his leg looks twisted and swollen")
+    assert not result.skip and result.reason == "novel"
+
+
+def test_new_entity_is_not_skipped():
+    result = score("he is 67")
+    assert not result.skip and result.reason == "new_entity"
+
+
+def test_red_flag_word_is_never_skipped():
+    result = score("he has chest pain", prior=TRANSCRIPT + "caller: he has chest pain\n")
+    assert not result.skip and result.reason == "relevant"
+
+
+def test_answer_to_dispatcher_question_is_not_skipped():
+    result = score("no", prior="dispatcher: is he conscious?\n")
+    assert not result.skip
+
+
+def test_yes_answer_is_not_skipped():
+    result = score("yeah", prior=TRANSCRIPT + "dispatcher: is he awake?\n")
+    assert not result.skip and result.reason == "answer"
+
+
+def test_negated_fact_is_not_a_repeat():
+    prior = TRANSCRIPT + "caller: he is awake and talking\n"
+    result = score("he is not awake", prior=prior)
+    assert not result.skip and result.reason == "negation"
+
+
+def test_contracted_negation_is_not_skipped():
+    prior = TRANSCRIPT + "caller: he is moving his legs\n"
+    assert not score("he isn't moving his legs", prior=prior).skip
+
+
+def test_disabled_gate_never_skips():
+    result = NoveltyGate(enabled=False).score("okay", TRANSCRIPT, "")
+    assert not result.skip and result.reason == "disabled"
@@ -0,0 +1,86 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from rate_governor import RateGovernor, RateLimit, RateLimitTimeout
+
+MODEL = "model"
+
+
+def governor(requests_per_minute=600, tokens_per_minute=60_000):
+    return RateGovernor(limits={MODEL: RateLimit(requests_per_minute, tokens_per_minute)}, share=1.0,
+                        max_wait_s=2.0)
+
+
+def drain(gov, requests=600):
+    for _ in range(requests):
+        gov.acquire(MODEL, 1)
+
+
+def test_ungoverned_models_pass_straight_through():
+    gov = governor()
+    assert gov.acquire("other", 10**9).tokens == 0
+    assert gov.try_acquire("other", 10**9) is not None
+
+
+def test_waiters_are_served_by_priority():
+    gov = governor()
+    drain(gov)      # next request in ~0.1s
+    order = []
+
+    def request(priority):
+        gov.acquire(MODEL, 1, priority)
+        order.append(priority)
+
+    threads = [threading.Thread(target=request, args=("low",))]
+    threads[0].start()
+    time.sleep(0.02)
+    threads.append(threading.Thread(target=request, args=("critical",)))
+    threads[1].start()
+    for t in threads:
+        t.join(5)
+    assert order == ["critical", "low"]
+
+
+def test_try_acquire_never_jumps_the_queue():
+    gov = governor()
+    drain(gov)
+    waiter = threading.Thread(target=gov.acquire, args=(MODEL, 1, "high"))
+    waiter.start()
+    time.sleep(0.02)
+    assert gov.try_acquire(MODEL, 1) is None
+    waiter.join(5)
+
+
+def test_times_out_when_quota_never_frees():
+    gov = governor(requests_per_minute=6)
+    drain(gov, 6)
+    with pytest.raises(RateLimitTimeout):
+        gov.acquire(MODEL, 1, timeout=0.05)
+
+
+def test_429_pauses_the_model_for_retry_after():
+    gov = governor()
+    error = SimpleNamespace(status_code=429, response=SimpleNamespace(headers={"retry-after": "0.2"}))
+    gov.report_error(MODEL, error)
+    assert gov.headroom([MODEL])[MODEL]["paused_s"] == pytest.approx(0.2, abs=0.1)
+    assert gov.try_acquire(MODEL, 1) is None
+    start = time.monotonic()
+    gov.acquire(MODEL, 1)
+    assert time.monotonic() - start >= 0.15
+
+
+def test_other_errors_do_not_pause():
+    gov = governor()
+    gov.report_error(MODEL, SimpleNamespace(status_code=500))
+    assert gov.headroom([MODEL])[MODEL]["paused_s"] == 0
+
+
+def test_settle_returns_unused_tokens():
+    gov = governor(tokens_per_minute=1000)
+    reservation = gov.acquire(MODEL, 800)
+    assert gov.headroom([MODEL])[MODEL]["tokens"] <= 200
+    gov.settle(reservation, 300)
+    assert gov.headroom([MODEL])[MODEL]["tokens"] >= 700
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import speculation
+from speculation import Speculator, merge_fragment, text_similarity
+from turn_store import BoundedCache
+
+
+class StubAgent:
+    def __init__(self):
+        self.calls = []
+
+    def speculate(self, text, role, with_advice):
+        self.calls.append(text)
+        return {"text": text, "role": role, "passages": [{"id": text}], "rag_ms": 5.0, "result": None,
+                "groq_ms": 0.0}
+
+
+def caller(text):
+    return {"event": "interim-transcription", "text": text, "metadata": {"role": "caller"}}
+
+
+@pytest.fixture(autouse=True)
+def no_debounce(monkeypatch):
+    monkeypatch.setattr(speculation, "SPEC_DEBOUNCE_S", 0.0)
+
+
+def test_merge_fragment_keeps_revisions_and_appends_the_rest():
+    assert merge_fragment("my dad", "my dad collapsed") == "my dad collapsed"
+    assert merge_fragment("my dad collapsed", "dad") == "my dad collapsed"
+    assert merge_fragment("my dad collapsed", "in the kitchen") == "my dad collapsed in the kitchen"
+
+
+def test_text_similarity():
+    assert text_similarity("he fell down", "He fell down") == 1.0
+    assert text_similarity("he fell", "she laughed") == 0.0
+
+
+def test_claim_uses_the_flushed_utterance_not_the_next_one():
+    first = "my father collapsed in the kitchen and is breathing badly"
+    second = "the front door is unlocked and the dog is locked away now"
+
+    async def scenario():
+        with ThreadPoolExecutor(1) as pool:
+            speculator = Speculator(StubAgent(), pool)
+            speculator.observe(caller(first))
+            speculator.reset_utterance()
+            # The next utterance starts speculating while the flushed batch waits
+            speculator.observe(caller(second))
+            next_one = speculator._current
+            claimed = await speculator.claim(first, "caller")
+            return claimed, next_one
+
+    claimed, next_one = asyncio.run(scenario())
+    assert claimed["text"] == first
+    assert next_one.text == second
+    assert not next_one.future.cancelled()
+
+
+def test_claim_misses_when_only_the_next_utterance_matches():
+    first = "my father collapsed in the kitchen and is breathing badly"
+    second = "the front door is unlocked and the dog is locked away now"
+
+    async def scenario():
+        with ThreadPoolExecutor(1) as pool:
+            speculator = Speculator(StubAgent(), pool)
+            speculator.observe(caller(first))
+            speculator.reset_utterance()
+            speculator.observe(caller(second))
+            return await speculator.claim(second, "caller"), speculator._current
+
+    claimed, current = asyncio.run(scenario())
+    assert claimed is None
+    assert current is not None and not current.future.cancelled()
+
+
+def test_bounded_cache_is_safe_across_threads():
+    cache = BoundedCache(16)
+
+    def hammer(offset):
+        for i in range(5000):
+            cache[(offset + i) % 40] = i
+            cache.get((offset + i * 7) % 40)
+
+    threads = [threading.Thread(target=hammer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(cache) == 16
@@ -0,0 +1,69 @@
+import pytest
+
+from token_accounting import (LATENCY_FIT_MIN_SAMPLES, LatencyModel, TokenLedger, TurnTokens, predict_breach,
+                              split_prompt_tokens, zero_turn_tokens)
+
+
+def latency(prompt, completion):
+    return 200 + 0.05 * prompt + 4.0 * completion
+
+
+def test_split_sums_to_the_prompt_total():
+    split = split_prompt_tokens(101, {"system": 300, "summary": 100, "history": 600})
+    assert sum(split.values()) == 101
+    assert split["history"] > split["system"] > split["summary"]
+    assert split_prompt_tokens(50, {}) == {}
+
+
+def test_fit_recovers_both_coefficients():
+    samples = [(p, c, latency(p, c)) for p in (500, 1500, 3000, 6000) for c in (40, 120, 300)]
+    fit = LatencyModel.fit(samples)
+    assert fit.intercept_ms == pytest.approx(200)
+    assert fit.ms_per_prompt_token == pytest.approx(0.05)
+    assert fit.ms_per_completion_token == pytest.approx(4.0)
+    assert fit.r2 == pytest.approx(1.0)
+
+
+def test_fit_with_constant_completion_uses_prompt_only():
+    samples = [(p, 100, latency(p, 100)) for p in range(1000, 1000 + 500 * LATENCY_FIT_MIN_SAMPLES, 500)]
+    fit = LatencyModel.fit(samples)
+    assert fit.ms_per_completion_token == 0.0
+    assert fit.ms_per_prompt_token == pytest.approx(0.05)
+    assert fit.predict(2000, 100) == pytest.approx(latency(2000, 100))
+
+
+def test_fit_needs_enough_samples():
+    assert LatencyModel.fit([(1000, 100, 500.0)] * (LATENCY_FIT_MIN_SAMPLES - 1)) is None
+
+
+def test_breach_turn_from_prompt_growth():
+    model = LatencyModel(intercept_ms=200, ms_per_prompt_token=0.1, ms_per_completion_token=0, samples=10, r2=1)
+    # Prompt grows 1000 tokens a turn from 1000; 200 + 0.1 * prompt > 1000 once prompt > 8000 (turn 9)
+    projection = predict_breach([1000, 2000, 3000], model, target_ms=1000)
+    assert projection["prompt_growth_per_turn"] == pytest.approx(1000)
+    assert projection["breach_turn"] == 9
+    assert projection["breach_prompt_tokens"] == 9000
+
+
+def test_no_breach_when_prompt_is_flat():
+    model = LatencyModel(200, 0.1, 0, 10, 1)
+    assert predict_breach([1000, 1000, 1000], model, target_ms=1000)["breach_turn"] is None
+
+
+def test_ledger_totals_per_call():
+    ledger = TokenLedger()
+    turn = TurnTokens(model="m", kind="advice", prompt_tokens=1000, completion_tokens=100, reported=True,
+                      latency_ms=400.0, sections={"history": 600, "system": 400})
+    ledger.record("call-1", turn)
+    ledger.record("call-1", turn)
+    totals = ledger.end_call("call-1")
+    assert totals["requests"] == 2
+    assert totals["sections"] == {"history": 1200, "system": 800}
+    assert totals["by_kind"] == {"advice": 2200}
+    assert ledger.call_totals("call-1") is None
+
+
+def test_zero_turn_tokens_has_the_turn_keys():
+    zero = zero_turn_tokens()
+    assert zero["prompt_tokens"] == zero["completion_tokens"] == 0
+    assert zero["cost_usd"] == 0.0
@@ -0,0 +1,184 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import turn_scheduler
+from turn_scheduler import TurnScheduler
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(turn_scheduler, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_most_critical_call_first(clock):
+    async def scenario():
+        scheduler = TurnScheduler()
+        await scheduler.put("low-call", [{"text": "a"}], "low")
+        await scheduler.put("critical-call", [{"text": "b"}], "critical")
+        await scheduler.put("medium-call", [{"text": "c"}], "medium")
+        return [(await scheduler.get()).call_id for _ in range(3)]
+
+    assert run(scenario()) == ["critical-call", "medium-call", "low-call"]
+
+
+def test_same_level_is_fifo(clock):
+    async def scenario():
+        scheduler = TurnScheduler()
+        for call_id in ("a", "b", "c"):
+            await scheduler.put(call_id, [], "medium")
+            clock[0] += 0.1
+        return [(await scheduler.get()).call_id for _ in range(3)]
+
+    assert run(scenario()) == ["a", "b", "c"]
+
+
+def test_waiting_turn_ages_past_a_newer_higher_one(clock):
+    async def scenario():
+        scheduler = TurnScheduler(aging_s=10.0)
+        await scheduler.put("old-low", [], "low")
+        clock[0] += 25.0    # worth 2.5 levels: above a fresh "high" (one level above medium)
+        await scheduler.put("new-high", [], "high")
+        return (await scheduler.get()).call_id
+
+    assert run(scenario()) == "old-low"
+
+
+def test_later_batch_merges_into_the_queued_turn(clock):
+    async def scenario():
+        scheduler = TurnScheduler()
+        await scheduler.put("other", [], "high")
+        await scheduler.put("call", [{"text": "first"}], "low")
+        await scheduler.put("call", [{"text": "second"}], "critical")
+        first, second = await scheduler.get(), await scheduler.get()
+        return first, second, scheduler.depth()
+
+    first, second, depth = run(scenario())
+    assert first.call_id == "call"
+    assert first.criticality_level == "critical"
+    assert [m["text"] for m in first.batch] == ["first", "second"]
+    assert first.coalesced == 1
+    assert second.call_id == "other"
+    assert depth == 0
+
+
+def test_call_with_turn_in_flight_is_passed_over(clock):
+    async def scenario():
+        scheduler = TurnScheduler()
+        await scheduler.put("a", [{"text": "1"}], "critical")
+        running = await scheduler.get()
+        await scheduler.put("a", [{"text": "2"}], "critical")
+        await scheduler.put("b", [], "low")
+        assert (await scheduler.get()).call_id == "b"
+
+        waiting = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        await scheduler.done(running)
+        follow_up = await asyncio.wait_for(waiting, 1)
+        return [m["text"] for m in follow_up.batch]
+
+    assert run(scenario()) == ["2"]
+
+
+def test_no_two_turns_of_a_call_run_concurrently(clock):
+    async def scenario():
+        scheduler = TurnScheduler()
+        active, overlaps, order = set(), [], []
+
+        async def worker():
+            while True:
+                turn = await scheduler.get()
+                if turn.call_id in active:
+                    overlaps.append(turn.call_id)
+                active.add(turn.call_id)
+                order.extend((turn.call_id, m["n"]) for m in turn.batch)
+                await asyncio.sleep(0.01)
+                active.discard(turn.call_id)
+                await scheduler.done(turn)
+
+        workers = [asyncio.create_task(worker()) for _ in range(3)]
+        for n in range(6):
+            for call_id, level in (("a", "low"), ("b", "critical")):
+                await scheduler.put(call_id, [{"n": n}], level)
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.1)
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        return overlaps, order
+
+    overlaps, order = run(scenario())
+    assert overlaps == []
+    for call_id in ("a", "b"):
+        assert [n for c, n in order if c == call_id] == list(range(6))
+
+
+def test_low_turns_are_delayed_only_when_saturated(clock):
+    async def scenario(saturation_depth):
+        scheduler = TurnScheduler(aging_s=10.0, saturation_depth=saturation_depth)
+        await scheduler.put("low-call", [], "low")
+        clock[0] += 15.0    # 1.5 levels of aging: ahead of a fresh "medium"
+        await scheduler.put("medium-call", [], "medium")
+        return (await scheduler.get()).call_id
+
+    assert run(scenario(saturation_depth=10)) == "low-call"
+    assert run(scenario(saturation_depth=2)) == "medium-call"
+
+
+def test_abandoned_run_holds_the_call_until_its_thread_finishes(clock):
+    # buffer2 releases a timed-out turn from the executor future's callback
+    import concurrent.futures
+    import threading
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        scheduler = TurnScheduler()
+        await scheduler.put("a", [{"text": "1"}], "critical")
+        turn = await scheduler.get()
+        await scheduler.put("a", [{"text": "2"}], "critical")
+
+        release = threading.Event()
+        with concurrent.futures.ThreadPoolExecutor(1) as pool:
+            run_future = pool.submit(release.wait, 5)
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(run_future)), timeout=0.01)
+            run_future.add_done_callback(lambda _: loop.call_soon_threadsafe(
+                lambda: loop.create_task(scheduler.done(turn))))
+            waiting = asyncio.create_task(scheduler.get())
+            await asyncio.sleep(0.1)
+            held = not waiting.done()
+            release.set()
+            follow_up = await asyncio.wait_for(waiting, 1)
+        return held, follow_up.batch
+
+    held, batch = run(scenario())
+    assert held
+    assert batch == [{"text": "2"}]
+
+
+def test_ended_call_is_discarded_after_its_turn_finishes(clock):
+    async def scenario():
+        scheduler = TurnScheduler()
+        await scheduler.put("a", [{"text": "1"}], "high")
+        running = await scheduler.get()
+        await scheduler.put("a", [{"text": "2"}], "high")
+        discarded = await scheduler.discard("a")
+        waiter = asyncio.create_task(scheduler.wait_done("a"))
+        await asyncio.sleep(0.01)
+        held = not waiter.done()
+        await scheduler.done(running)
+        await asyncio.wait_for(waiter, 1)
+        return discarded.batch, held, scheduler.depth()
+
+    batch, held, depth = run(scenario())
+    assert batch == [{"text": "2"}]
+    assert held
+    assert depth == 0
@@ -0,0 +1,212 @@
+"""
+Per-turn token and cost accounting, with a latency-vs-tokens model.
+
+Every Groq completion is recorded as a TurnTokens: the model, prompt and
+completion tokens (the provider's reported usage when the response carries it,
+else tiktoken estimates), its latency, and the prompt tokens broken out by
+section (system, summary, guidelines, history, request). Section counts are the
+prompt total split in proportion to each section's characters, so accounting
+adds no tokenization to the hot path.
+
+TokenLedger aggregates per call (until the call ends) and per model (metrics
+counters tokens.*, which the supervisor merges across workers) and keeps recent
+(prompt, completion, latency) samples per model. LatencyModel is a least-squares
+fit of latency on prompt and completion tokens; predict_breach() projects a
+call's prompt growth through it to find the turn where the latency target would
+be exceeded.
+"""
+
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from metrics import metrics
+
+# USD per 1M tokens (input, output), Groq list prices
+MODEL_PRICES = {
+    "meta-llama/llama-4-scout-17b-16e-instruct": (0.11, 0.34),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+}
+PROMPT_SECTIONS = ("system", "summary", "guidelines", "history", "request")
+LATENCY_FIT_WINDOW = 500        # recent completions per model the latency model is fitted on
+LATENCY_FIT_MIN_SAMPLES = 8
+MAX_PROJECTED_TURNS = 200       # predict_breach() looks this far ahead
+
+
+def split_prompt_tokens(prompt_tokens: int, section_chars: Dict[str, int]) -> Dict[str, int]:
+    """Prompt tokens per section, in proportion to the sections' characters (sums to prompt_tokens)."""
+    total_chars = sum(section_chars.values())
+    if not total_chars:
+        return {}
+    split = {name: prompt_tokens * chars // total_chars for name, chars in section_chars.items()}
+    largest = max(section_chars, key=section_chars.get)
+    split[largest] += prompt_tokens - sum(split.values())
+    return split
+
+
+@dataclass
+class TurnTokens:
+    model: Optional[str]        # None when no model was called
+    kind: str                   # "advice", "speculation", "consolidation" or "none"
+    prompt_tokens: int
+    completion_tokens: int
+    reported: bool              # counts are the provider's usage, not estimates
+    latency_ms: float
+    sections: Dict[str, int] = field(default_factory=dict)
+
+    def cost_usd(self) -> float:
+        input_price, output_price = MODEL_PRICES.get(self.model, (0.0, 0.0))
+        return (self.prompt_tokens * input_price + self.completion_tokens * output_price) / 1e6
+
+    def to_dict(self) -> Dict:
+        return dict(asdict(self), cost_usd=self.cost_usd())
+
+
+def zero_turn_tokens() -> Dict:
+    """Token report of a turn that didn't call the model: TurnTokens' keys, all counts zero."""
+    return TurnTokens(model=None, kind="none", prompt_tokens=0, completion_tokens=0, reported=True,
+                      latency_ms=0.0).to_dict()
+
+
+@dataclass
+class CallTokens:
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    sections: Dict[str, int] = field(default_factory=dict)
+    by_kind: Dict[str, int] = field(default_factory=dict)   # total tokens per kind
+
+    def add(self, turn: TurnTokens) -> None:
+        self.requests += 1
+        self.prompt_tokens += turn.prompt_tokens
+        self.completion_tokens += turn.completion_tokens
+        self.cost_usd += turn.cost_usd()
+        for name, tokens in turn.sections.items():
+            self.sections[name] = self.sections.get(name, 0) + tokens
+        self.by_kind[turn.kind] = self.by_kind.get(turn.kind, 0) + turn.prompt_tokens + turn.completion_tokens
+
+
+@dataclass
+class LatencyModel:
+    """latency_ms ≈ intercept_ms + ms_per_prompt_token * prompt + ms_per_completion_token * completion"""
+    intercept_ms: float
+    ms_per_prompt_token: float
+    ms_per_completion_token: float
+    samples: int
+    r2: float
+
+    @classmethod
+    def fit(cls, samples: Sequence[Tuple[int, int, float]]) -> Optional["LatencyModel"]:
+        """Least-squares fit on (prompt_tokens, completion_tokens, latency_ms) samples."""
+        n = len(samples)
+        if n < LATENCY_FIT_MIN_SAMPLES:
+            return None
+        mp = sum(s[0] for s in samples) / n
+        mc = sum(s[1] for s in samples) / n
+        my = sum(s[2] for s in samples) / n
+        spp = sum((p - mp) ** 2 for p, _, _ in samples)
+        scc = sum((c - mc) ** 2 for _, c, _ in samples)
+        spc = sum((p - mp) * (c - mc) for p, c, _ in samples)
+        spy = sum((p - mp) * (y - my) for p, _, y in samples)
+        scy = sum((c - mc) * (y - my) for _, c, y in samples)
+        det = spp * scc - spc * spc
+        if det > 1e-9 * max(1.0, spp * scc):
+            b = (spy * scc - scy * spc) / det
+            c = (scy * spp - spy * spc) / det
+        else:
+            # Completion length barely varies (or moves with the prompt): prompt tokens alone
+            b = spy / spp if spp else 0.0
+            c = 0.0
+        a = my - b * mp - c * mc
+        ss_tot = sum((y - my) ** 2 for _, _, y in samples)
+        ss_res = sum((y - (a + b * p + c * cc)) ** 2 for p, cc, y in samples)
+        return cls(a, b, c, n, 1 - ss_res / ss_tot if ss_tot else 0.0)
+
+    def predict(self, prompt_tokens: float, completion_tokens: float) -> float:
+        return self.intercept_ms + self.ms_per_prompt_token * prompt_tokens + self.ms_per_completion_token * completion_tokens
+
+
+def predict_breach(prompt_tokens_per_turn: List[int], model: LatencyModel, target_ms: float,
+                   overhead_ms: float = 0.0, completion_tokens: float = 0.0,
+                   max_turns: int = MAX_PROJECTED_TURNS) -> Dict:
+    """
+    Project a call's prompt growth (linear fit over its turns so far) through the
+    latency model. Returns the growth per turn and the first turn, counting from 1,
+    whose predicted latency plus `overhead_ms` (the turn's non-LLM stages) exceeds
+    target_ms, or breach_turn None if none within max_turns.
+    """
+    n = len(prompt_tokens_per_turn)
+    mean_x, mean_y = (n - 1) / 2, sum(prompt_tokens_per_turn) / n
+    sxx = sum((i - mean_x) ** 2 for i in range(n))
+    growth = sum((i - mean_x) * (y - mean_y) for i, y in enumerate(prompt_tokens_per_turn)) / sxx if sxx else 0.0
+    start = mean_y - growth * mean_x
+    projection = {"prompt_growth_per_turn": growth, "breach_turn": None, "breach_prompt_tokens": None,
+                  "breach_predicted_ms": None}
+    for turn in range(max_turns):
+        prompt = start + growth * turn
+        predicted = model.predict(prompt, completion_tokens) + overhead_ms
+        if predicted > target_ms:
+            projection.update(breach_turn=turn + 1, breach_prompt_tokens=round(prompt),
+                              breach_predicted_ms=predicted)
+            break
+    return projection
+
+
+class TokenLedger:
+    def __init__(self, window: int = LATENCY_FIT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._calls: Dict[str, CallTokens] = {}
+        self._samples: Dict[str, Deque[Tuple[int, int, float]]] = {}
+
+    def record(self, call_id: Optional[str], turn: TurnTokens) -> None:
+        metrics.incr(f"tokens.requests.{turn.model}")
+        metrics.incr(f"tokens.prompt.{turn.model}", turn.prompt_tokens)
+        metrics.incr(f"tokens.completion.{turn.model}", turn.completion_tokens)
+        metrics.incr(f"tokens.cost_usd.{turn.model}", turn.cost_usd())
+        if not turn.reported:
+            metrics.incr("tokens.estimated")
+        for name, tokens in turn.sections.items():
+            metrics.observe(f"tokens.section.{name}", tokens)
+        with self._lock:
+            if call_id is not None:
+                self._calls.setdefault(call_id, CallTokens()).add(turn)
+            self._samples.setdefault(turn.model, deque(maxlen=self.window)).append(
+                (turn.prompt_tokens, turn.completion_tokens, turn.latency_ms))
+
+    def call_totals(self, call_id: str) -> Optional[Dict]:
+        with self._lock:
+            totals = self._calls.get(call_id)
+            return asdict(totals) if totals is not None else None
+
+    def end_call(self, call_id: str) -> Optional[Dict]:
+        """Drop a finished call's totals; returns them."""
+        with self._lock:
+            totals = self._calls.pop(call_id, None)
+        return asdict(totals) if totals is not None else None
+
+    def latency_model(self, model: str) -> Optional[LatencyModel]:
+        with self._lock:
+            samples = list(self._samples.get(model, ()))
+        return LatencyModel.fit(samples)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            models = list(self._samples)
+        report = {}
+        for model in models:
+            fit = self.latency_model(model)
+            report[model] = {
+                "requests": metrics.counter(f"tokens.requests.{model}"),
+                "prompt_tokens": metrics.counter(f"tokens.prompt.{model}"),
+                "completion_tokens": metrics.counter(f"tokens.completion.{model}"),
+                "cost_usd": round(metrics.counter(f"tokens.cost_usd.{model}"), 6),
+                "latency_model": asdict(fit) if fit is not None else None,
+            }
+        return report
+
+
+# Process-wide ledger shared by every agent and buffer2's consolidation calls
+token_ledger = TokenLedger()
@@ -0,0 +1,119 @@
+"""
+Capture of WebSocket traffic for later replay (replay.py).
+
+With TRAFFIC_CAPTURE=<path> set, buffer2.py (and supervisor.py) record every
+inbound message and every outbound event, and main_websocket_server.py records
+what its clients send and what it broadcasts. Records are compact JSON lines,
+gzip-compressed when the path ends in .gz:
+
+    {"capture": 1, "source": "buffer2", "started_at": 1718000000.0}   header
+    {"t": 0.132, "d": "in", "m": {...}}                                 one per message
+
+`t` is seconds since the capture started and `d` the direction ("in"/"out").
+Writing happens on a background thread, so recording costs the event loop one
+queue put per message.
+"""
+
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger("traffic_capture")
+
+TRAFFIC_CAPTURE = os.getenv("TRAFFIC_CAPTURE")   # capture file path; unset disables recording
+CAPTURE_VERSION = 1
+
+
+def _open(path: str, mode: str):
+    return gzip.open(path, mode + "t", encoding="utf-8") if path.endswith(".gz") else open(path, mode, encoding="utf-8")
+
+
+class TrafficRecorder:
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._file = _open(path, "w")
+        self._file.write(json.dumps({"capture": CAPTURE_VERSION, "source": source, "started_at": self.started_at}) + "\n")
+        self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+        self._thread.start()
+        logger.info(f"Recording {source} traffic to {path}")
+
+    def record(self, direction: str, message) -> None:
+        """Record a message (a JSON string or an already-decoded dict) sent in `direction`."""
+        if isinstance(message, (str, bytes)):
+            try:
+                message = json.loads(message)
+            except json.JSONDecodeError:
+                message = {"raw": message if isinstance(message, str) else message.decode(errors="replace")}
+        self._queue.put(json.dumps({"t": round(time.monotonic() - self._start, 4), "d": direction, "m": message},
+                                   separators=(",", ":")))
+
+    async def tap(self, messages: AsyncIterator[Dict]) -> AsyncIterator[Dict]:
+        """Pass decoded inbound messages through, recording each."""
+        async for msg in messages:
+            self.record("in", msg)
+            yield msg
+
+    def wrap(self, sender) -> "_RecordingSender":
+        """Sender that records every outbound message before sending it."""
+        return _RecordingSender(self, sender)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5.0)
+
+    def _run(self) -> None:
+        while True:
+            line = self._queue.get()
+            if line is None:
+                break
+            self._file.write(line + "\n")
+            if self._queue.empty():
+                self._file.flush()
+        self._file.close()
+
+
+class _RecordingSender:
+    def __init__(self, recorder: TrafficRecorder, sender):
+        self.recorder = recorder
+        self.sender = sender
+
+    async def send(self, data: str) -> None:
+        self.recorder.record("out", data)
+        await self.sender.send(data)
+
+
+def recorder_from_env(source: str) -> Optional[TrafficRecorder]:
+    """A recorder if TRAFFIC_CAPTURE is set. Each source gets its own file next to the given path."""
+    if not TRAFFIC_CAPTURE:
+        return None
+    root, ext = TRAFFIC_CAPTURE, ""
+    for suffix in (".jsonl.gz", ".jsonl", ".gz"):
+        if TRAFFIC_CAPTURE.endswith(suffix):
+            root, ext = TRAFFIC_CAPTURE[:-len(suffix)], suffix
+            break
+    return TrafficRecorder(f"{root}.{source}{ext or '.jsonl'}", source)
+
+
+def read_capture(path: str) -> Tuple[Dict, Iterator[Tuple[float, str, Dict]]]:
+    """Header and an iterator of (t, direction, message) records of a capture file."""
+    f = _open(path, "r")
+    header = json.loads(f.readline())
+    if header.get("capture") != CAPTURE_VERSION:
+        f.close()
+        raise ValueError(f"{path} is not a version {CAPTURE_VERSION} traffic capture")
+
+    def records():
+        with f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["t"], record["d"], record["m"]
+    return header, records()
@@ -0,0 +1,164 @@
+"""
+Criticality-priority scheduling of agent turns.
+
+buffer2's task_queue was a FIFO asyncio.Queue, so under load a cardiac-arrest
+call's batch waited behind every batch queued before it. TurnScheduler orders
+queued turns by their call's criticality level at enqueue time (the agent's
+latest level, raised by red flags in the new fragments), with aging so nothing
+starves: a turn gains one level of priority for every AGING_S seconds it waits.
+Because every turn ages at the same rate, the ordering is fixed at enqueue time
+and a heap is enough.
+
+Turns of one call stay in order and never overlap. A call has at most one turn
+queued: a batch arriving while it waits is merged into it, raising its priority
+if the new batch's level is higher (as if it had been queued at that level).
+get() passes over calls that still have a turn in flight until the worker
+reports it done().
+
+When the queue is saturated (SATURATION_DEPTH turns waiting), low-priority turns
+are delayed: they give up SATURATION_DELAY_LEVELS of priority until the queue
+drains or aging lifts them. Wait times are recorded per level as
+`scheduler.wait_ms.<level>` histograms.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from fact_extractor import CRITICALITY_ORDER
+from metrics import metrics
+
+AGING_S = 10.0              # waiting this long is worth one criticality level
+SATURATION_DEPTH = 6        # queued turns at which low-priority turns start being delayed
+DELAY_MAX_LEVEL = "low"     # highest level whose turns are delayed under saturation
+SATURATION_DELAY_LEVELS = 2 # priority a delayed turn gives up while saturated (aging still lifts it)
+DEFAULT_LEVEL = "medium"    # matches DispatcherAgent's starting level
+
+
+@dataclass
+class QueuedTurn:
+    call_id: str
+    batch: List[Dict]
+    criticality_level: str
+    enqueued_at: float
+    coalesced: int = 0      # batches merged into this one while it waited
+    sort_key: Tuple[float, int] = field(default=(0.0, 0), repr=False)
+
+    def __lt__(self, other: "QueuedTurn") -> bool:
+        return self.sort_key < other.sort_key
+
+
+def _rank(level: str) -> int:
+    return CRITICALITY_ORDER.index(level) if level in CRITICALITY_ORDER else CRITICALITY_ORDER.index(DEFAULT_LEVEL)
+
+
+class TurnScheduler:
+    def __init__(self, aging_s: float = AGING_S, saturation_depth: int = SATURATION_DEPTH):
+        self.aging_s = aging_s
+        self.saturation_depth = saturation_depth
+        self._heap: List[QueuedTurn] = []
+        self._queued: Dict[str, QueuedTurn] = {}   # call id -> its queued turn
+        self._in_flight: Set[str] = set()           # calls whose turn a worker is processing
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+
+    def depth(self) -> int:
+        return len(self._heap)
+
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def saturated(self) -> bool:
+        return len(self._heap) >= self.saturation_depth
+
+    def _priority(self, enqueued_at: float, level: str) -> float:
+        # Priority at time t is rank + (t - enqueued_at) / aging_s; the t term is
+        # common to all turns, so ordering by enqueued_at / aging_s - rank is stable
+        return enqueued_at / self.aging_s - _rank(level)
+
+    async def put(self, call_id: str, batch: List[Dict], criticality_level: str) -> QueuedTurn:
+        async with self._cond:
+            now = time.monotonic()
+            queued = self._queued.get(call_id)
+            if queued is not None:
+                queued.batch.extend(batch)
+                queued.coalesced += 1
+                metrics.incr("scheduler.coalesced")
+                if _rank(criticality_level) > _rank(queued.criticality_level):
+                    queued.criticality_level = criticality_level
+                    queued.sort_key = (self._priority(queued.enqueued_at, criticality_level), queued.sort_key[1])
+                    heapq.heapify(self._heap)
+                return queued
+            turn = QueuedTurn(call_id, list(batch), criticality_level, now)
+            turn.sort_key = (self._priority(now, criticality_level), next(self._seq))
+            heapq.heappush(self._heap, turn)
+            self._queued[call_id] = turn
+            metrics.incr(f"scheduler.queued.{criticality_level}")
+            metrics.gauge("scheduler.depth", len(self._heap))
+            self._cond.notify()
+            return turn
+
+    def _next_ready(self) -> Optional[QueuedTurn]:
+        ready = [turn for turn in self._heap if turn.call_id not in self._in_flight]
+        if not ready:
+            return None
+        if not self.saturated():
+            return min(ready)
+        limit = _rank(DELAY_MAX_LEVEL)
+        return min(ready, key=lambda turn: (
+            turn.sort_key[0] + (SATURATION_DELAY_LEVELS if _rank(turn.criticality_level) <= limit else 0),
+            turn.sort_key[1]))
+
+    async def get(self) -> QueuedTurn:
+        """Highest-priority turn of a call with no turn in flight; call done() when it's processed."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._next_ready() is not None)
+            turn = self._next_ready()
+            if turn is not min(t for t in self._heap if t.call_id not in self._in_flight):
+                metrics.incr("scheduler.delayed")
+            self._heap.remove(turn)
+            heapq.heapify(self._heap)
+            del self._queued[turn.call_id]
+            self._in_flight.add(turn.call_id)
+            metrics.observe(f"scheduler.wait_ms.{turn.criticality_level}", (time.monotonic() - turn.enqueued_at) * 1000)
+            metrics.gauge("scheduler.depth", len(self._heap))
+            return turn
+
+    async def done(self, turn: QueuedTurn) -> None:
+        """The call's turn is processed: its next turn may be dequeued."""
+        async with self._cond:
+            self._in_flight.discard(turn.call_id)
+            self._cond.notify_all()
+
+    async def discard(self, call_id: str) -> Optional[QueuedTurn]:
+        """Drop the call's queued turn (the call ended); returns it."""
+        async with self._cond:
+            turn = self._queued.pop(call_id, None)
+            if turn is not None:
+                self._heap.remove(turn)
+                heapq.heapify(self._heap)
+                metrics.gauge("scheduler.depth", len(self._heap))
+            return turn
+
+    async def wait_done(self, call_id: str) -> None:
+        """Wait until the call has no turn in flight."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: call_id not in self._in_flight)
+
+    @staticmethod
+    def stats() -> Dict:
+        """Turns queued and wait-time percentiles per criticality level."""
+        report = {}
+        for level in reversed(CRITICALITY_ORDER):
+            name = f"scheduler.wait_ms.{level}"
+            report[level] = {
+                "queued": metrics.counter(f"scheduler.queued.{level}"),
+                "wait_ms_p50": metrics.quantile(name, 50),
+                "wait_ms_p90": metrics.quantile(name, 90),
+            }
+        report["coalesced"] = metrics.counter("scheduler.coalesced")
+        report["delayed"] = metrics.counter("scheduler.delayed")
+        return report
@@ -0,0 +1,127 @@
+"""
+Compact, bounded per-call state.
+
+The transcript used to be one string rebuilt by `+=` on every turn (copying the
+whole call each time) and the agent's caches were plain dicts that only grew.
+
+- TurnStore is an append-only transcript: rendered "role: text" lines are merged
+  into one text buffer only when the transcript is read, and each turn is
+  indexed by a 1-byte role code and its end offset in arrays, so a turn costs a
+  few bytes of index on top of its text.
+- BoundedCache is a small thread-safe LRU dict for per-call caches (embeddings, retrieval).
+- approx_bytes() estimates the memory held by a call's state for reporting.
+"""
+
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, List, Optional, Tuple
+
+
+class TurnStore:
+    __slots__ = ("_buffer", "_pending", "_ends", "_roles", "_role_names", "_prefix_len")
+
+    def __init__(self, turns: Iterable[Tuple[str, str]] = (), prefix: str = ""):
+        """`prefix` is transcript text loaded from elsewhere (e.g. Letta) that precedes the indexed turns."""
+        self._buffer = prefix               # merged transcript text
+        self._pending: List[str] = []       # rendered lines appended since the last merge
+        self._ends = array("Q")             # end offset of each turn's line in the transcript
+        self._roles = array("B")            # index into _role_names
+        self._role_names: List[str] = []
+        self._prefix_len = len(prefix)
+        for role, text in turns:
+            self.append(role, text)
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def append(self, role: str, text: str) -> None:
+        try:
+            code = self._role_names.index(role)
+        except ValueError:
+            code = len(self._role_names)
+            self._role_names.append(role)
+        line = f"{role}: {text}\n"
+        self._ends.append((self._ends[-1] if self._ends else self._prefix_len) + len(line))
+        self._roles.append(code)
+        self._pending.append(line)
+
+    def text(self) -> str:
+        """The transcript as "role: text" lines."""
+        if self._pending:
+            self._buffer += "".join(self._pending)
+            self._pending.clear()
+        return self._buffer
+
+    def tail(self, max_chars: int) -> str:
+        return self.text()[-max_chars:]
+
+    def turn(self, index: int) -> Tuple[str, str]:
+        index = range(len(self))[index]
+        role = self._role_names[self._roles[index]]
+        start = self._ends[index - 1] if index else self._prefix_len
+        return role, self.text()[start + len(role) + 2:self._ends[index] - 1]
+
+    def turns(self) -> List[Tuple[str, str]]:
+        return [self.turn(i) for i in range(len(self))]
+
+    def nbytes(self) -> int:
+        return (sys.getsizeof(self._buffer) + sum(sys.getsizeof(line) for line in self._pending)
+                + self._ends.itemsize * len(self._ends) + self._roles.itemsize * len(self._roles))
+
+
+class BoundedCache:
+    """
+    Least-recently-used mapping holding at most `maxsize` entries. Thread-safe: a
+    call's speculation thread uses the agent's caches alongside its turns.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, key: Hashable) -> Any:
+        with self._lock:
+            value = self._items[key]
+            self._items.move_to_end(key)
+            return value
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def nbytes(self) -> int:
+        with self._lock:
+            items = list(self._items.items())
+        return sum(approx_bytes(k) + approx_bytes(v) for k, v in items)
+
+
+def approx_bytes(obj: Any) -> int:
+    """Rough deep size of plain data (str, numbers, lists, tuples, dicts)."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_bytes(k) + approx_bytes(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(approx_bytes(item) for item in obj)
+    return size